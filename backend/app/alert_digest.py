@@ -0,0 +1,215 @@
+"""
+Alert digesting for SMS notifications.
+
+When a supply problem hits, every household device breaches at once and
+sending one SMS per alert floods the recipient and the Twilio quota. Alerts
+are still stored and broadcast individually, but their notifications are
+collected here per (parameter, region) and flushed on a fixed interval:
+
+- a group with one alert sends that alert's own message
+- a group with several alerts sends one digest line ("pH alerts from 120
+  devices in ward-12: ...")
+- each flush sends at most ``max_messages`` SMS; groups beyond that are
+  merged into the last message, up to the SMS length limit ("+N more groups")
+
+so SMS volume is bounded by the flush interval, not by the fleet size.
+"""
+
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+# Alert message keyword -> parameter (checked in order)
+_PARAMETER_KEYWORDS = (
+    ("pH", "ph"),
+    ("Turbidity", "turbidity"),
+    ("TDS", "tds"),
+)
+
+_PARAMETER_NAMES = {"ph": "pH", "turbidity": "Turbidity", "tds": "TDS"}
+
+# Twilio rejects message bodies longer than this
+SMS_MAX_CHARS = 1600
+
+
+def parameter_of(message: str) -> str:
+    """Best-effort parameter of an alert message (``other`` if none matches)."""
+    for keyword, parameter in _PARAMETER_KEYWORDS:
+        if keyword in message:
+            return parameter
+    return "other"
+
+
+def parse_regions(spec: str) -> Dict[str, str]:
+    """Parse ``prefix:region,prefix:region`` into a device ID prefix -> region map."""
+    regions = {}
+    for item in spec.split(","):
+        if ":" in item:
+            prefix, region = item.split(":", 1)
+            if prefix.strip() and region.strip():
+                regions[prefix.strip()] = region.strip()
+    return regions
+
+
+class _Group:
+    __slots__ = ("devices", "messages")
+
+    def __init__(self):
+        # device -> latest message (insertion ordered)
+        self.devices: "OrderedDict[str, str]" = OrderedDict()
+        self.messages = 0
+
+
+class AlertDigester:
+    """Collects alert notifications per (parameter, region) and sends bounded digests."""
+
+    def __init__(
+        self,
+        flush_seconds: float = 60.0,
+        max_messages: int = 3,
+        regions: Optional[Dict[str, str]] = None,
+        sample_devices: int = 3,
+    ):
+        """
+        Initialize the digester.
+
+        Args:
+            flush_seconds: Interval between digest flushes (0 sends every alert immediately)
+            max_messages: Max SMS per flush; remaining groups are merged into the last one
+            regions: Device ID prefix -> region/tag (longest prefix wins)
+            sample_devices: Devices named per group before "and N more"
+        """
+        self.flush_seconds = flush_seconds
+        self.max_messages = max(1, max_messages)
+        self.regions = regions or {}
+        self._prefixes = sorted(self.regions, key=len, reverse=True)
+        self.sample_devices = sample_devices
+        self._groups: Dict[Tuple[str, str], _Group] = {}
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+
+        self.alerts_submitted = 0
+        self.sms_sent = 0
+        self.flushes = 0
+
+    def region_of(self, device_id: str) -> str:
+        for prefix in self._prefixes:
+            if device_id.startswith(prefix):
+                return self.regions[prefix]
+        return "all"
+
+    async def submit(self, device_id: str, message: str, parameter: Optional[str] = None) -> None:
+        """Queue an alert for notification (sent at once when digesting is off)."""
+        self.alerts_submitted += 1
+        if self.flush_seconds <= 0:
+            await self._send(message)
+            return
+        key = (parameter or parameter_of(message), self.region_of(device_id))
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _Group()
+        group.devices[device_id] = message
+        group.devices.move_to_end(device_id)
+        group.messages += 1
+
+    def _line(self, parameter: str, region: str, group: _Group) -> str:
+        if len(group.devices) == 1 and group.messages == 1:
+            return next(iter(group.devices.values()))
+        devices = list(group.devices)
+        named = ", ".join(devices[: self.sample_devices])
+        more = len(devices) - self.sample_devices
+        where = "" if region == "all" else f" in {region}"
+        line = f"{_PARAMETER_NAMES.get(parameter, parameter)} alerts from {len(devices)} device(s){where}: {named}"
+        if more > 0:
+            line += f" and {more} more"
+        return line
+
+    def build_messages(self) -> List[str]:
+        """Drain the pending groups into at most ``max_messages`` SMS bodies (largest groups first)."""
+        groups = sorted(self._groups.items(), key=lambda item: len(item[1].devices), reverse=True)
+        self._groups = {}
+        if not groups:
+            return []
+        lines = [self._line(parameter, region, group) for (parameter, region), group in groups]
+        alerts = sum(group.messages for _, group in groups)
+        if len(lines) == 1 and alerts == 1:
+            return lines
+        header = f"⚠️ ALERT DIGEST: {alerts} alert(s) in the last {self.flush_seconds:.0f}s"
+        if len(lines) <= self.max_messages:
+            return [f"{header}\n{line}" for line in lines]
+        kept = lines[: self.max_messages - 1]
+        rest = lines[self.max_messages - 1:]
+        return [f"{header}\n{line}" for line in kept] + [self._merge(header, rest)]
+
+    @staticmethod
+    def _merge(header: str, lines: List[str]) -> str:
+        """Join lines into one SMS body, ending with "+N more groups" once it would exceed SMS_MAX_CHARS."""
+        body = header
+        for i, line in enumerate(lines):
+            more = len(lines) - i - 1
+            # Room for this line and, if any follow, the "+N more groups" note
+            reserve = len(f"\n+{more} more groups") if more else 0
+            if len(body) + 1 + len(line) + reserve > SMS_MAX_CHARS:
+                return f"{body}\n+{len(lines) - i} more groups"
+            body += f"\n{line}"
+        return body
+
+    async def flush(self) -> int:
+        """Send the pending digests now; returns the number of SMS sent."""
+        messages = self.build_messages()
+        if messages:
+            self.flushes += 1
+        for message in messages:
+            await self._send(message)
+        return len(messages)
+
+    async def _send(self, message: str) -> None:
+        from app.main import send_sms_alert
+
+        self.sms_sent += 1
+        await asyncio.to_thread(send_sms_alert, message)
+
+    async def run_loop(self) -> None:
+        while self.running:
+            await asyncio.sleep(self.flush_seconds)
+            try:
+                await self.flush()
+            except Exception as e:
+                print(f"[ALERT DIGEST] Error sending digest: {e}")
+
+    async def start(self) -> None:
+        if self.running or self.flush_seconds <= 0:
+            return
+        self.running = True
+        self.task = asyncio.create_task(self.run_loop())
+        print(f"[ALERT DIGEST] Flushing alert notifications every {self.flush_seconds:.0f}s")
+
+    async def stop(self) -> None:
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        # Do not drop alerts still waiting for the next flush
+        await self.flush()
+
+    def get_metrics(self) -> dict:
+        return {
+            "flush_seconds": self.flush_seconds,
+            "alerts_submitted": self.alerts_submitted,
+            "sms_sent": self.sms_sent,
+            "flushes": self.flushes,
+            "pending_groups": len(self._groups),
+            "pending_alerts": sum(group.messages for group in self._groups.values()),
+        }
+
+
+alert_digest = AlertDigester(
+    flush_seconds=float(os.environ.get("ALERT_DIGEST_FLUSH_SECONDS", "60")),
+    max_messages=int(os.environ.get("ALERT_DIGEST_MAX_SMS", "3")),
+    regions=parse_regions(os.environ.get("ALERT_DIGEST_REGIONS", "")),
+)
@@ -3,33 +3,112 @@ Time-based Alert Monitor
 
 Tracks threshold breaches over time and sends alerts if parameters
 stay out of range for a specified duration (e.g., 3 minutes).
+
+A noisy sensor hovering around a limit must not re-arm the timer on every
+in-range reading or raise an alert burst, so a breach only ends once the
+value has been back inside the limit by a hysteresis band for a minimum
+clear duration. A parameter that keeps starting new breaches is flapping:
+it gets one flapping alert and further alerts are suppressed until it
+settles.
+
+Breach timing runs on each device's own timeline: a reading older than the
+last one monitored for its device (e.g. a replayed buffer arriving among
+live readings) is skipped rather than moving the clock backwards.
 """
 
 import time
-from datetime import datetime, timezone, timedelta
-from typing import Dict, Optional
-from collections import defaultdict
+from collections import defaultdict, deque
+from typing import Callable, Deque, Dict, Optional
 
 from app.config import get_twilio_config
-from app.main import PH_MIN, PH_MAX, TURBIDITY_MAX_NTU, TDS_MAX_PPM
+from app.thresholds import CompiledProfile, thresholds
+
+# Default hysteresis bands: a breach clears only this far inside the limit
+DEFAULT_HYSTERESIS = {"ph": 0.1, "turbidity": 5.0, "tds": 10.0}
+
+_NAMES = {"ph": "pH", "turbidity": "Turbidity", "tds": "TDS"}
+
+
+def parse_hysteresis(spec: str) -> Dict[str, float]:
+    """Parse ``param:band,param:band`` on top of the default bands."""
+    bands = dict(DEFAULT_HYSTERESIS)
+    for item in spec.split(","):
+        if ":" in item:
+            param, band = item.split(":", 1)
+            if param.strip() in bands:
+                bands[param.strip()] = max(0.0, float(band))
+    return bands
+
+
+class _Breach:
+    __slots__ = ("start", "alert_sent", "clear_since", "onsets", "flap_notified")
+
+    def __init__(self, flap_threshold: int):
+        self.start: Optional[float] = None
+        self.alert_sent = False
+        # When the value last came back inside the clear band (None = not clearing)
+        self.clear_since: Optional[float] = None
+        # Start times of the most recent breaches
+        self.onsets: Deque[float] = deque(maxlen=max(1, flap_threshold))
+        self.flap_notified = False
 
 
 class AlertMonitor:
     """Monitors threshold breaches over time and triggers alerts after duration."""
 
-    def __init__(self, alert_duration_seconds: int = 180):  # 3 minutes default
+    def __init__(
+        self,
+        alert_duration_seconds: int = 180,  # 3 minutes default
+        hysteresis: Optional[Dict[str, float]] = None,
+        clear_seconds: float = 60.0,
+        flap_window_seconds: float = 900.0,
+        flap_threshold: int = 3,
+        profile_for: Optional[Callable[[str], CompiledProfile]] = None,
+    ):
         """
         Initialize the alert monitor.
 
         Args:
             alert_duration_seconds: Duration in seconds before sending alert (default: 180 = 3 minutes)
+            hysteresis: Per-parameter band inside the limit a value must reach to clear a breach
+            clear_seconds: Seconds a value must stay inside the band before the breach ends
+            flap_window_seconds: Window in which repeated breaches count as flapping
+            flap_threshold: Breaches within the window that make a parameter flapping (0 = off)
+            profile_for: Device ID -> threshold profile (default: the stored threshold profiles)
         """
         self.alert_duration = alert_duration_seconds
-        # Track when each device's parameters first breached threshold
-        # Format: {device_id: {parameter: first_breach_timestamp}}
-        self.breach_start_times: Dict[str, Dict[str, float]] = defaultdict(dict)
-        # Track if alert already sent for current breach
-        self.alert_sent: Dict[str, Dict[str, bool]] = defaultdict(dict)
+        self.hysteresis = dict(DEFAULT_HYSTERESIS if hysteresis is None else hysteresis)
+        self.clear_seconds = clear_seconds
+        self.flap_window = flap_window_seconds
+        self.flap_threshold = flap_threshold
+        self.profile_for = profile_for or thresholds.for_device
+        # Format: {device_id: {parameter: _Breach}}
+        self._breaches: Dict[str, Dict[str, _Breach]] = defaultdict(dict)
+        # Time of the last reading monitored per device
+        self._last_time: Dict[str, float] = {}
+
+        self.alerts = 0
+        self.flap_alerts = 0
+        self.suppressed = 0
+        self.cleared = 0
+        # Readings back in range that did not end the breach (inside the band or before clear_seconds)
+        self.held = 0
+        # Readings older than their device's last monitored one
+        self.late = 0
+
+    def _in_breach(self, value: float, low: Optional[float], high: Optional[float]) -> bool:
+        return (low is not None and value < low) or (high is not None and value > high)
+
+    def _in_clear_band(self, param: str, value: float, low: Optional[float], high: Optional[float]) -> bool:
+        band = self.hysteresis.get(param, 0.0)
+        return (low is None or value >= low + band) and (high is None or value <= high - band)
+
+    def _is_flapping(self, breach: _Breach, now: float) -> bool:
+        return (
+            self.flap_threshold > 0
+            and len(breach.onsets) >= self.flap_threshold
+            and now - breach.onsets[0] <= self.flap_window
+        )
 
     def check_and_alert(
         self,
@@ -47,91 +126,119 @@ class AlertMonitor:
             ph: pH value
             turbidity: Turbidity value (NTU)
             tds: TDS value (ppm)
-            current_time: Current timestamp (defaults to now)
+            current_time: Reading time (defaults to now)
 
         Returns:
-            List of alert messages sent
+            List of alert messages sent (none for a reading older than the device's last one)
         """
         if current_time is None:
             current_time = time.time()
+        if current_time < self._last_time.get(device_id, current_time):
+            self.late += 1
+            return []
+        self._last_time[device_id] = current_time
 
         alerts_sent = []
-        device_key = device_id
-
-        # Check pH
-        ph_breach = ph < PH_MIN or ph > PH_MAX
-        if ph_breach:
-            if "ph" not in self.breach_start_times[device_key]:
-                # First time breaching - record start time
-                self.breach_start_times[device_key]["ph"] = current_time
-                self.alert_sent[device_key]["ph"] = False
-            else:
-                # Already breaching - check duration
-                breach_duration = current_time - self.breach_start_times[device_key]["ph"]
-                if breach_duration >= self.alert_duration and not self.alert_sent[device_key].get("ph", False):
-                    # Send alert
-                    ph_status = "too low" if ph < PH_MIN else "too high"
-                    alert_msg = (
-                        f"⚠️ ALERT: pH level {ph_status} ({ph:.2f}) for {int(breach_duration)} seconds. "
-                        f"Safe range: {PH_MIN}-{PH_MAX}"
-                    )
-                    alerts_sent.append(alert_msg)
-                    self.alert_sent[device_key]["ph"] = True
-        else:
-            # pH is back in range - reset tracking
-            if "ph" in self.breach_start_times[device_key]:
-                del self.breach_start_times[device_key]["ph"]
-                self.alert_sent[device_key]["ph"] = False
-
-        # Check Turbidity
-        turbidity_breach = turbidity > TURBIDITY_MAX_NTU
-        if turbidity_breach:
-            if "turbidity" not in self.breach_start_times[device_key]:
-                self.breach_start_times[device_key]["turbidity"] = current_time
-                self.alert_sent[device_key]["turbidity"] = False
-            else:
-                breach_duration = current_time - self.breach_start_times[device_key]["turbidity"]
-                if breach_duration >= self.alert_duration and not self.alert_sent[device_key].get("turbidity", False):
-                    alert_msg = (
-                        f"⚠️ ALERT: Turbidity too high ({turbidity:.1f} NTU) for {int(breach_duration)} seconds. "
-                        f"Safe limit: {TURBIDITY_MAX_NTU} NTU"
-                    )
-                    alerts_sent.append(alert_msg)
-                    self.alert_sent[device_key]["turbidity"] = True
-        else:
-            if "turbidity" in self.breach_start_times[device_key]:
-                del self.breach_start_times[device_key]["turbidity"]
-                self.alert_sent[device_key]["turbidity"] = False
-
-        # Check TDS
-        tds_breach = tds > TDS_MAX_PPM
-        if tds_breach:
-            if "tds" not in self.breach_start_times[device_key]:
-                self.breach_start_times[device_key]["tds"] = current_time
-                self.alert_sent[device_key]["tds"] = False
-            else:
-                breach_duration = current_time - self.breach_start_times[device_key]["tds"]
-                if breach_duration >= self.alert_duration and not self.alert_sent[device_key].get("tds", False):
-                    alert_msg = (
-                        f"⚠️ ALERT: TDS too high ({tds:.0f} ppm) for {int(breach_duration)} seconds. "
-                        f"Safe limit: {TDS_MAX_PPM} ppm"
-                    )
-                    alerts_sent.append(alert_msg)
-                    self.alert_sent[device_key]["tds"] = True
-        else:
-            if "tds" in self.breach_start_times[device_key]:
-                del self.breach_start_times[device_key]["tds"]
-                self.alert_sent[device_key]["tds"] = False
+        profile = self.profile_for(device_id)
+        device = self._breaches[device_id]
+        for param, value in (("ph", ph), ("turbidity", turbidity), ("tds", tds)):
+            if value is None:
+                continue
+            low, high = profile.limits.get(param, (None, None))
+            breach = device.get(param)
+
+            if self._in_breach(value, low, high):
+                if breach is None:
+                    breach = device[param] = _Breach(self.flap_threshold)
+                if breach.start is None:
+                    # First time breaching - record start time
+                    breach.start = current_time
+                    breach.alert_sent = False
+                    breach.onsets.append(current_time)
+                breach.clear_since = None
+                breach_duration = current_time - breach.start
+                if breach_duration >= self.alert_duration and not breach.alert_sent:
+                    breach.alert_sent = True
+                    alert_msg = self._alert(param, value, breach_duration, profile, breach, current_time)
+                    if alert_msg:
+                        alerts_sent.append(alert_msg)
+            elif breach is not None and breach.start is None:
+                if current_time - breach.onsets[-1] > self.flap_window:
+                    # Settled: nothing left worth remembering
+                    del device[param]
+            elif breach is not None:
+                # Back in range: the breach ends only after holding inside the band
+                if not self._in_clear_band(param, value, low, high):
+                    breach.clear_since = None
+                    self.held += 1
+                    continue
+                if breach.clear_since is None:
+                    breach.clear_since = current_time
+                if current_time - breach.clear_since < self.clear_seconds:
+                    self.held += 1
+                    continue
+                breach.start = None
+                breach.alert_sent = False
+                breach.clear_since = None
+                self.cleared += 1
+                if not self._is_flapping(breach, current_time):
+                    breach.flap_notified = False
 
+        if not device:
+            del self._breaches[device_id]
         return alerts_sent
 
+    def _alert(self, param: str, value: float, duration: float, profile, breach: _Breach, now: float) -> Optional[str]:
+        """Alert text for a breach that lasted long enough, or None if it is suppressed as flapping."""
+        if self._is_flapping(breach, now):
+            if breach.flap_notified:
+                self.suppressed += 1
+                return None
+            breach.flap_notified = True
+            self.flap_alerts += 1
+            return (
+                f"⚠️ ALERT: {_NAMES[param]} flapping in and out of range "
+                f"({len(breach.onsets)} breaches in {int(now - breach.onsets[0])} seconds, now {value:g}). "
+                f"Safe range: {profile.describe(param)}. Further alerts suppressed until it settles"
+            )
+        self.alerts += 1
+        if param == "ph":
+            ph_status = "too low" if profile.state("ph", value) == "low" else "too high"
+            return (
+                f"⚠️ ALERT: pH level {ph_status} ({value:.2f}) for {int(duration)} seconds. "
+                f"Safe range: {profile.low('ph')}-{profile.high('ph')}"
+            )
+        if param == "turbidity":
+            return (
+                f"⚠️ ALERT: Turbidity too high ({value:.1f} NTU) for {int(duration)} seconds. "
+                f"Safe limit: {profile.high('turbidity')} NTU"
+            )
+        return (
+            f"⚠️ ALERT: TDS too high ({value:.0f} ppm) for {int(duration)} seconds. "
+            f"Safe limit: {profile.high('tds')} ppm"
+        )
+
     def reset_device(self, device_id: str):
         """Reset tracking for a specific device."""
-        device_key = device_id
-        if device_key in self.breach_start_times:
-            del self.breach_start_times[device_key]
-        if device_key in self.alert_sent:
-            del self.alert_sent[device_key]
+        self._breaches.pop(device_id, None)
+        self._last_time.pop(device_id, None)
+
+    def get_metrics(self) -> dict:
+        now = time.time()
+        breaches = [b for device in self._breaches.values() for b in device.values()]
+        return {
+            "alert_duration_seconds": self.alert_duration,
+            "hysteresis": self.hysteresis,
+            "clear_seconds": self.clear_seconds,
+            "active_breaches": sum(1 for b in breaches if b.start is not None),
+            "flapping": sum(1 for b in breaches if self._is_flapping(b, now)),
+            "alerts": self.alerts,
+            "flap_alerts": self.flap_alerts,
+            "suppressed": self.suppressed,
+            "cleared": self.cleared,
+            "held": self.held,
+            "late": self.late,
+        }
 
 
 # Global instance
@@ -144,5 +251,11 @@ def get_alert_monitor() -> AlertMonitor:
     if _alert_monitor is None:
         import os
         duration = int(os.environ.get("ALERT_DURATION_SECONDS", "180"))  # Default 3 minutes
-        _alert_monitor = AlertMonitor(alert_duration_seconds=duration)
+        _alert_monitor = AlertMonitor(
+            alert_duration_seconds=duration,
+            hysteresis=parse_hysteresis(os.environ.get("ALERT_HYSTERESIS", "")),
+            clear_seconds=float(os.environ.get("ALERT_CLEAR_SECONDS", "60")),
+            flap_window_seconds=float(os.environ.get("ALERT_FLAP_WINDOW_SECONDS", "900")),
+            flap_threshold=int(os.environ.get("ALERT_FLAP_THRESHOLD", "3")),
+        )
     return _alert_monitor
@@ -0,0 +1,303 @@
+"""
+Streaming anomaly detection on sensor readings.
+
+Fixed thresholds only fire once a value is already unsafe. This detector
+keeps a per-device EWMA baseline (mean and variance) for each parameter
+and flags:
+- spikes: a reading far from the baseline (|z| above a threshold)
+- shifts: a sustained move away from the baseline, found with a two-sided
+  CUSUM on the standardized residuals
+
+State lives in NumPy arrays with one row per device, so a reading costs a
+fixed number of array operations and a batch of readings from many devices
+is evaluated in one vectorized pass per "wave" (at most one reading per
+device per wave, preserving each device's order).
+"""
+
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PARAMETERS = ("ph", "turbidity", "tds")
+
+# Display name, unit and minimum baseline std (stops stable sensors from flagging noise)
+_PARAM_INFO = {
+    "ph": ("pH", "", 0.05),
+    "turbidity": ("Turbidity", " NTU", 1.0),
+    "tds": ("TDS", " ppm", 5.0),
+}
+
+
+def _fmt(param: str, value: float) -> str:
+    digits = 2 if param == "ph" else 0 if param == "tds" else 1
+    return f"{value:.{digits}f}{_PARAM_INFO[param][1]}"
+
+
+class AnomalyDetector:
+    """Per-device EWMA + CUSUM anomaly detector."""
+
+    def __init__(
+        self,
+        alpha: float = 0.05,
+        z_threshold: float = 5.0,
+        cusum_k: float = 0.5,
+        cusum_h: float = 8.0,
+        warmup: int = 20,
+        cooldown_seconds: float = 300.0,
+    ):
+        """
+        Initialize the detector.
+
+        Args:
+            alpha: EWMA smoothing factor for the baseline mean and variance
+            z_threshold: |z| above which a single reading is a spike
+            cusum_k: CUSUM slack in standard deviations (shifts smaller than this are ignored)
+            cusum_h: CUSUM decision threshold in standard deviations
+            warmup: Readings per device before anomalies are reported
+            cooldown_seconds: Minimum time between reports for the same device and parameter
+        """
+        self.alpha = alpha
+        self.z_threshold = z_threshold
+        self.cusum_k = cusum_k
+        self.cusum_h = cusum_h
+        self.warmup = warmup
+        self.cooldown = cooldown_seconds
+        self._std_floor = np.array([_PARAM_INFO[p][2] for p in PARAMETERS])
+
+        self._rows: Dict[str, int] = {}
+        self._device_ids: List[str] = []
+        capacity = 16
+        width = len(PARAMETERS)
+        self._count = np.zeros((capacity, width), dtype=np.int64)
+        self._mean = np.zeros((capacity, width))
+        self._var = np.zeros((capacity, width))
+        self._cusum_pos = np.zeros((capacity, width))
+        self._cusum_neg = np.zeros((capacity, width))
+        self._last_report = np.full((capacity, width), -np.inf)
+
+        self.readings_seen = 0
+        self.anomalies_found = 0
+        self.suppressed = 0
+
+    def _row(self, device_id: str) -> int:
+        row = self._rows.get(device_id)
+        if row is None:
+            row = len(self._device_ids)
+            if row == len(self._count):
+                self._grow()
+            self._rows[device_id] = row
+            self._device_ids.append(device_id)
+        return row
+
+    def _grow(self) -> None:
+        for name in ("_count", "_mean", "_var", "_cusum_pos", "_cusum_neg", "_last_report"):
+            old = getattr(self, name)
+            fill = -np.inf if name == "_last_report" else 0
+            new = np.full((len(old) * 2, old.shape[1]), fill, dtype=old.dtype)
+            new[: len(old)] = old
+            setattr(self, name, new)
+
+    def _step(self, rows: np.ndarray, values: np.ndarray, now: float, report: bool) -> List[Tuple[int, int, str, float, float, float]]:
+        """
+        Fold one reading per row into the baselines (rows must be unique).
+
+        Returns:
+            (row, parameter index, kind, value, baseline mean, z) for reported anomalies
+        """
+        present = ~np.isnan(values)
+        count = self._count[rows]
+        mean = self._mean[rows]
+        var = self._var[rows]
+        first = present & (count == 0)
+
+        # The variance EWMA starts at 0: divide out its startup bias (as in Adam)
+        updates = np.maximum(count - 1, 1)
+        std = np.maximum(np.sqrt(var / (1 - (1 - self.alpha) ** updates)), self._std_floor)
+        z = np.where(present & ~first, (values - mean) / std, 0.0)
+
+        # The baseline variance is still settling during warmup and z is inflated;
+        # accumulating it would fire a shift as soon as the device is armed
+        armed = present & (count >= self.warmup)
+        cusum_pos = np.where(armed, np.maximum(0.0, self._cusum_pos[rows] + z - self.cusum_k), 0.0)
+        cusum_neg = np.where(armed, np.maximum(0.0, self._cusum_neg[rows] - z - self.cusum_k), 0.0)
+
+        spike = armed & (np.abs(z) > self.z_threshold)
+        shift_up = armed & ~spike & (cusum_pos > self.cusum_h)
+        shift_down = armed & ~spike & (cusum_neg > self.cusum_h)
+        # A detected change is accepted; the baseline adapts from here
+        changed = spike | shift_up | shift_down
+        cusum_pos[changed] = 0.0
+        cusum_neg[changed] = 0.0
+
+        # Winsorize so one outlier cannot drag the baseline far
+        clipped = mean + np.clip(z, -self.z_threshold, self.z_threshold) * std
+        delta = clipped - mean
+        new_mean = np.where(first, values, np.where(present, mean + self.alpha * delta, mean))
+        new_var = np.where(present & ~first, (1 - self.alpha) * (var + self.alpha * delta * delta), var)
+
+        self._mean[rows] = new_mean
+        self._var[rows] = new_var
+        self._cusum_pos[rows] = np.where(present, cusum_pos, self._cusum_pos[rows])
+        self._cusum_neg[rows] = np.where(present, cusum_neg, self._cusum_neg[rows])
+        self._count[rows] = count + present
+        self.readings_seen += len(rows)
+
+        found: List[Tuple[int, int, str, float, float, float]] = []
+        if not report or not changed.any():
+            return found
+        due = changed & (now - self._last_report[rows] >= self.cooldown)
+        self.suppressed += int(changed.sum() - due.sum())
+        for i, j in zip(*np.nonzero(due)):
+            row = int(rows[i])
+            self._last_report[row, j] = now
+            kind = "spike" if spike[i, j] else "shift_up" if shift_up[i, j] else "shift_down"
+            found.append((row, int(j), kind, float(values[i, j]), float(mean[i, j]), float(z[i, j])))
+        self.anomalies_found += len(found)
+        return found
+
+    def _describe(self, row: int, j: int, kind: str, value: float, baseline: float, z: float) -> Dict[str, Any]:
+        param = PARAMETERS[j]
+        name = _PARAM_INFO[param][0]
+        if kind == "spike":
+            what = f"{name} {'jumped' if value > baseline else 'dropped'} to {_fmt(param, value)}"
+        else:
+            what = f"{name} is drifting {'up' if kind == 'shift_up' else 'down'} ({_fmt(param, value)})"
+        return {
+            "device_id": self._device_ids[row],
+            "parameter": param,
+            "kind": kind,
+            "value": value,
+            "baseline": baseline,
+            "z_score": z,
+            "message": f"⚠️ ANOMALY: {what}, baseline {_fmt(param, baseline)} (z={z:+.1f})",
+        }
+
+    @staticmethod
+    def _values(record: Dict[str, Any]) -> List[float]:
+        return [np.nan if record.get(p) is None else float(record[p]) for p in PARAMETERS]
+
+    def observe(self, record: Dict[str, Any], now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Update the device's baselines with a reading.
+
+        Returns:
+            Anomalies to report (empty during warmup or cooldown)
+        """
+        row = self._row(record.get("device_id") or "unknown")
+        values = np.array([self._values(record)])
+        found = self._step(np.array([row]), values, time.time() if now is None else now, report=True)
+        return [self._describe(*item) for item in found]
+
+    def _observe_many(
+        self,
+        device_ids: Sequence[str],
+        values: np.ndarray,
+        now: Optional[float],
+        report: bool,
+    ) -> List[Tuple[int, Dict[str, Any]]]:
+        """(batch position, anomaly) for a batch, one vectorized pass per wave."""
+        n = len(device_ids)
+        if n == 0:
+            return []
+        values = np.asarray(values, dtype=float).reshape(n, len(PARAMETERS))
+        rows = np.fromiter((self._row(d or "unknown") for d in device_ids), dtype=np.int64, count=n)
+        # Position of each reading among its device's readings: wave k holds every device's k-th reading
+        order = np.argsort(rows, kind="stable")
+        sorted_rows = rows[order]
+        starts = np.r_[0, np.flatnonzero(np.diff(sorted_rows)) + 1]
+        run_lengths = np.diff(np.r_[starts, n])
+        wave = np.empty(n, dtype=np.int64)
+        wave[order] = np.arange(n) - np.repeat(starts, run_lengths)
+
+        now = time.time() if now is None else now
+        found = []
+        for k in range(int(wave.max()) + 1):
+            idx = np.flatnonzero(wave == k)
+            # Rows are unique within a wave
+            position = dict(zip(rows[idx].tolist(), idx.tolist()))
+            found.extend((position[item[0]], self._describe(*item)) for item in self._step(rows[idx], values[idx], now, report))
+        return found
+
+    def observe_batch(
+        self,
+        device_ids: Sequence[str],
+        values: np.ndarray,
+        now: Optional[float] = None,
+        report: bool = True,
+    ) -> List[Dict[str, Any]]:
+        """
+        Update baselines with many readings at once.
+
+        Args:
+            device_ids: Device of each reading, in arrival order
+            values: Array of shape (n, len(PARAMETERS)); NaN marks a missing value
+            now: Report time for cooldowns (defaults to now)
+            report: False to only warm the baselines
+
+        Returns:
+            Anomalies to report
+        """
+        return [anomaly for _, anomaly in self._observe_many(device_ids, values, now, report)]
+
+    def observe_records(self, records: Sequence[Dict[str, Any]], now: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """
+        observe() for a batch of readings in one vectorized pass.
+
+        Returns:
+            Anomalies to report, per reading
+        """
+        out: List[List[Dict[str, Any]]] = [[] for _ in records]
+        if not records:
+            return out
+        device_ids = [r.get("device_id") or "unknown" for r in records]
+        values = np.array([self._values(r) for r in records])
+        for position, anomaly in self._observe_many(device_ids, values, now, report=True):
+            out[position].append(anomaly)
+        return out
+
+    def seed(self, readings: Iterable[Dict[str, Any]]) -> int:
+        """Warm baselines from stored history (oldest first) without reporting anomalies."""
+        readings = list(readings)
+        if not readings:
+            return 0
+        device_ids = [r.get("device_id") or "unknown" for r in readings]
+        values = np.array([self._values(r) for r in readings])
+        self.observe_batch(device_ids, values, report=False)
+        return len(readings)
+
+    def baseline(self, device_id: str) -> Optional[Dict[str, Any]]:
+        """Current baseline (mean, std, readings seen) of a device's parameters."""
+        row = self._rows.get(device_id)
+        if row is None:
+            return None
+        return {
+            param: {
+                "mean": float(self._mean[row, j]),
+                "std": float(np.sqrt(self._var[row, j])),
+                "count": int(self._count[row, j]),
+            }
+            for j, param in enumerate(PARAMETERS)
+            if self._count[row, j]
+        }
+
+    def get_metrics(self) -> dict:
+        return {
+            "devices": len(self._device_ids),
+            "readings_seen": self.readings_seen,
+            "anomalies_found": self.anomalies_found,
+            "suppressed_by_cooldown": self.suppressed,
+        }
+
+
+ANOMALY_DETECTION_ENABLED = os.environ.get("ANOMALY_DETECTION_ENABLED", "true").lower() == "true"
+
+anomaly_detector = AnomalyDetector(
+    alpha=float(os.environ.get("ANOMALY_EWMA_ALPHA", "0.05")),
+    z_threshold=float(os.environ.get("ANOMALY_Z_THRESHOLD", "5")),
+    cusum_k=float(os.environ.get("ANOMALY_CUSUM_K", "0.5")),
+    cusum_h=float(os.environ.get("ANOMALY_CUSUM_H", "8")),
+    warmup=int(os.environ.get("ANOMALY_WARMUP", "20")),
+    cooldown_seconds=float(os.environ.get("ANOMALY_COOLDOWN_SECONDS", "300")),
+)
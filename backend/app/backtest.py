@@ -0,0 +1,434 @@
+"""
+Historical replay and backtesting of alert rules.
+
+Stored readings (or an exported readings CSV) are streamed in event-time
+order through one or more candidate rule configurations — alert duration,
+hysteresis, clear duration, flap detection and optional limit overrides —
+to see how many alerts each would have produced, and when.
+
+The default engine is vectorized: per page, every reading is classified for
+every parameter at once (breach / dead band / clear band) with numpy, the
+rows are grouped per device, and the alert state machine then steps over
+runs of equally classified readings instead of single readings, finding the
+reading that fires an alert or ends a breach inside a run with a binary
+search. It produces the same alerts as AlertMonitor, which the ``monitor``
+engine replays through reading by reading as a reference.
+"""
+
+import csv
+import io
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.alert_monitor import AlertMonitor, get_alert_monitor
+from app.rolling_stats import record_timestamp
+from app.thresholds import LIMIT_FIELDS, CompiledProfile, compile_profile, thresholds
+
+PARAMETERS = ("ph", "turbidity", "tds")
+
+# Reading classes per parameter
+_CLEAR, _DEAD_BAND, _BREACH = 0, 1, 2
+
+ENGINES = ("vectorized", "monitor")
+
+
+class RuleConfig:
+    """A candidate alert rule configuration (unset fields use the live monitor's settings)."""
+
+    def __init__(
+        self,
+        name: Optional[str] = None,
+        alert_duration_seconds: Optional[float] = None,
+        hysteresis: Optional[Dict[str, float]] = None,
+        clear_seconds: Optional[float] = None,
+        flap_window_seconds: Optional[float] = None,
+        flap_threshold: Optional[int] = None,
+        limits: Optional[Dict[str, Optional[float]]] = None,
+    ):
+        """
+        Initialize the configuration.
+
+        Args:
+            name: Label in the report
+            alert_duration_seconds: Breach duration before an alert
+            hysteresis: Per-parameter clear bands (merged over the live ones)
+            clear_seconds: Seconds inside the band before a breach ends
+            flap_window_seconds: Flap detection window
+            flap_threshold: Breaches within the window that count as flapping (0 = off)
+            limits: ph_min/ph_max/turbidity_max/tds_max applied to every device on top of its profile
+        """
+        live = get_alert_monitor()
+        self.name = name
+        self.alert_duration = live.alert_duration if alert_duration_seconds is None else alert_duration_seconds
+        self.hysteresis = {**live.hysteresis, **(hysteresis or {})}
+        self.clear_seconds = live.clear_seconds if clear_seconds is None else clear_seconds
+        self.flap_window = live.flap_window if flap_window_seconds is None else flap_window_seconds
+        self.flap_threshold = live.flap_threshold if flap_threshold is None else flap_threshold
+        self.limits = {column: value for column, value in (limits or {}).items() if column in LIMIT_FIELDS and value is not None}
+        self._profiles: Dict[str, CompiledProfile] = {}
+
+    def profile_for(self, device_id: str) -> CompiledProfile:
+        """The device's stored profile with this configuration's limit overrides."""
+        base = thresholds.for_device(device_id)
+        if not self.limits:
+            return base
+        profile = self._profiles.get(base.name)
+        if profile is None:
+            limits = {param: list(bounds) for param, bounds in base.limits.items()}
+            for column, value in self.limits.items():
+                param, side = LIMIT_FIELDS[column]
+                limits[param][side] = value
+            profile = self._profiles[base.name] = compile_profile(
+                f"{base.name}+backtest", base.version, {param: tuple(b) for param, b in limits.items()}
+            )
+        return profile
+
+    def monitor(self) -> AlertMonitor:
+        """A fresh AlertMonitor with this configuration."""
+        return AlertMonitor(
+            alert_duration_seconds=self.alert_duration,
+            hysteresis=self.hysteresis,
+            clear_seconds=self.clear_seconds,
+            flap_window_seconds=self.flap_window,
+            flap_threshold=self.flap_threshold,
+            profile_for=self.profile_for,
+        )
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "alert_duration_seconds": self.alert_duration,
+            "hysteresis": self.hysteresis,
+            "clear_seconds": self.clear_seconds,
+            "flap_window_seconds": self.flap_window,
+            "flap_threshold": self.flap_threshold,
+            "limits": self.limits,
+        }
+
+
+class _Result:
+    """Alert counts and (a sample of) alert events of one configuration."""
+
+    def __init__(self, config: RuleConfig, max_events: int):
+        self.config = config
+        self.max_events = max_events
+        self.events: List[Dict[str, Any]] = []
+        self.counts: Counter = Counter()
+        self.by_parameter: Counter = Counter()
+        self.by_device: Counter = Counter()
+        self.by_day: Counter = Counter()
+        self.first: Optional[float] = None
+        self.last: Optional[float] = None
+
+    def add(self, kind: str, t: float, device_id: str, param: str, value: float, duration: float) -> None:
+        self.counts[kind] += 1
+        if kind == "suppressed":
+            return
+        self.by_parameter[param] += 1
+        self.by_device[device_id] += 1
+        when = datetime.fromtimestamp(t, timezone.utc)
+        self.by_day[when.date().isoformat()] += 1
+        self.first = t if self.first is None else min(self.first, t)
+        self.last = t if self.last is None else max(self.last, t)
+        if len(self.events) < self.max_events:
+            self.events.append({
+                "timestamp": when.isoformat(),
+                "device_id": device_id,
+                "parameter": param,
+                "value": value,
+                "breach_seconds": duration,
+                "kind": kind,
+            })
+
+    def report(self) -> Dict[str, Any]:
+        iso = lambda t: None if t is None else datetime.fromtimestamp(t, timezone.utc).isoformat()
+        return {
+            "config": self.config.describe(),
+            "notifications": self.counts["alert"] + self.counts["flapping"],
+            "alerts": self.counts["alert"],
+            "flap_alerts": self.counts["flapping"],
+            "suppressed": self.counts["suppressed"],
+            "first_alert": iso(self.first),
+            "last_alert": iso(self.last),
+            "by_parameter": dict(self.by_parameter),
+            "by_day": dict(sorted(self.by_day.items())),
+            "top_devices": dict(self.by_device.most_common(20)),
+            "events": sorted(self.events, key=lambda e: e["timestamp"]),
+        }
+
+
+class _State:
+    __slots__ = ("start", "alert_sent", "clear_since", "onsets", "flap_notified")
+
+    def __init__(self, flap_threshold: int):
+        self.start: Optional[float] = None
+        self.alert_sent = False
+        self.clear_since: Optional[float] = None
+        self.onsets: deque = deque(maxlen=max(1, flap_threshold))
+        self.flap_notified = False
+
+
+class VectorizedReplay:
+    """AlertMonitor's state machine over runs of equally classified readings."""
+
+    def __init__(self, config: RuleConfig, result: _Result):
+        self.config = config
+        self.result = result
+        self._bands = np.array([config.hysteresis.get(p, 0.0) for p in PARAMETERS])
+        # Per device row: (3,) low and high limits, NaN = none
+        self._low = np.empty((0, len(PARAMETERS)))
+        self._high = np.empty((0, len(PARAMETERS)))
+        self._states: Dict[tuple, _State] = {}
+
+    def _limits(self, device_ids: List[str]) -> None:
+        known = len(self._low)
+        if known == len(device_ids):
+            return
+        new = [self.config.profile_for(d).limits for d in device_ids[known:]]
+        nan = lambda v: np.nan if v is None else v
+        low = np.array([[nan(limits.get(p, (None, None))[0]) for p in PARAMETERS] for limits in new])
+        high = np.array([[nan(limits.get(p, (None, None))[1]) for p in PARAMETERS] for limits in new])
+        self._low = np.vstack([self._low, low])
+        self._high = np.vstack([self._high, high])
+
+    def _is_flapping(self, state: _State, now: float) -> bool:
+        c = self.config
+        return c.flap_threshold > 0 and len(state.onsets) >= c.flap_threshold and now - state.onsets[0] <= c.flap_window
+
+    def feed(self, device_ids: List[str], rows: np.ndarray, t: np.ndarray, values: np.ndarray) -> None:
+        """
+        Replay one page.
+
+        Args:
+            device_ids: Device ID of each row number
+            rows: (n,) device row numbers, sorted by device then time
+            t: (n,) epoch seconds
+            values: (n, 3) pH, turbidity and TDS with NaN for missing values
+        """
+        self._limits(device_ids)
+        low, high = self._low[rows], self._high[rows]
+        breach = (values < low) | (values > high)
+        clear = (np.isnan(low) | (values >= low + self._bands)) & (np.isnan(high) | (values <= high - self._bands))
+        cls = np.where(breach, _BREACH, np.where(clear, _CLEAR, _DEAD_BAND))
+
+        for p, param in enumerate(PARAMETERS):
+            valid = ~np.isnan(values[:, p])
+            r, tp, vp, cp = rows[valid], t[valid], values[valid, p], cls[valid, p]
+            if not len(r):
+                continue
+            # Run boundaries: a new device or a new class
+            change = np.flatnonzero((r[1:] != r[:-1]) | (cp[1:] != cp[:-1])) + 1
+            starts = np.concatenate(([0], change))
+            ends = np.concatenate((change, [len(r)]))
+            for i0, i1, row, c in zip(starts.tolist(), ends.tolist(), r[starts].tolist(), cp[starts].tolist()):
+                self._run(device_ids[row], param, c, tp, vp, i0, i1)
+
+    def _run(self, device_id: str, param: str, cls: int, t: np.ndarray, v: np.ndarray, i0: int, i1: int) -> None:
+        config = self.config
+        key = (device_id, param)
+        state = self._states.get(key)
+
+        if cls == _BREACH:
+            if state is None:
+                state = self._states[key] = _State(config.flap_threshold)
+            if state.start is None:
+                state.start = float(t[i0])
+                state.alert_sent = False
+                state.onsets.append(state.start)
+            state.clear_since = None
+            if not state.alert_sent:
+                j = i0 + int(np.searchsorted(t[i0:i1], state.start + config.alert_duration, "left"))
+                if j < i1:
+                    state.alert_sent = True
+                    now = float(t[j])
+                    if not self._is_flapping(state, now):
+                        kind = "alert"
+                    elif state.flap_notified:
+                        kind = "suppressed"
+                    else:
+                        state.flap_notified = True
+                        kind = "flapping"
+                    self.result.add(kind, now, device_id, param, float(v[j]), now - state.start)
+            return
+
+        if state is None:
+            return
+        if state.start is not None:
+            if cls == _DEAD_BAND:
+                state.clear_since = None
+                return
+            if state.clear_since is None:
+                state.clear_since = float(t[i0])
+            j = i0 + int(np.searchsorted(t[i0:i1], state.clear_since + config.clear_seconds, "left"))
+            if j >= i1:
+                return
+            now = float(t[j])
+            state.start = None
+            state.alert_sent = False
+            state.clear_since = None
+            if not self._is_flapping(state, now):
+                state.flap_notified = False
+            i0 = j + 1
+            if i0 >= i1:
+                return
+        # In range with no breach: forget settled parameters
+        if float(t[i1 - 1]) - state.onsets[-1] > config.flap_window:
+            del self._states[key]
+
+
+def _epoch_seconds(page: List[Dict[str, Any]]) -> np.ndarray:
+    """Epoch seconds of a page's timestamps, parsed in one call when they are all UTC."""
+    try:
+        naive = [s[:-6] if s.endswith("+00:00") else s[:-1] if s.endswith("Z") else None for s in (r["timestamp"] for r in page)]
+        if None not in naive:
+            return np.array(naive, dtype="datetime64[us]").astype(np.int64) / 1e6
+    except (KeyError, AttributeError, ValueError):
+        pass
+    return np.fromiter((record_timestamp(r) for r in page), dtype=float, count=len(page))
+
+
+def _page_arrays(page: List[Dict[str, Any]], index: Dict[str, int], device_ids: List[str]):
+    rows = np.empty(len(page), dtype=np.int64)
+    for i, r in enumerate(page):
+        d = r.get("device_id") or "unknown"
+        row = index.get(d)
+        if row is None:
+            row = index[d] = len(device_ids)
+            device_ids.append(d)
+        rows[i] = row
+    t = _epoch_seconds(page)
+    # None becomes NaN
+    values = np.array([[r.get("ph"), r.get("turbidity"), r.get("tds")] for r in page], dtype=float)
+    # Device first, event time within a device (stable, so equal times keep stored order)
+    order = np.lexsort((t, rows))
+    return rows[order], t[order], values[order]
+
+
+def iter_csv_pages(text: str, page_size: int = 5000) -> Iterable[List[Dict[str, Any]]]:
+    """Readings of an exported readings CSV, in event-time order, a page at a time."""
+    number = lambda s: float(s) if s not in (None, "") else None
+    readings = [
+        {
+            "timestamp": row.get("timestamp"),
+            "device_id": row.get("device_id") or "unknown",
+            "ph": number(row.get("ph")),
+            "turbidity": number(row.get("turbidity")),
+            "tds": number(row.get("tds")),
+            "temperature": number(row.get("temperature")),
+        }
+        for row in csv.DictReader(io.StringIO(text))
+        if row.get("timestamp")
+    ]
+    readings.sort(key=record_timestamp)
+    for i in range(0, len(readings), page_size):
+        yield readings[i:i + page_size]
+
+
+async def _filtered(
+    pages: Iterable[List[Dict[str, Any]]],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    device_id: Optional[str],
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    if start is None and end is None and device_id is None:
+        for page in pages:
+            yield page
+        return
+    start_ts = start.timestamp() if start else None
+    end_ts = end.timestamp() if end else None
+    for page in pages:
+        yield [
+            r for r in page
+            if (device_id is None or r.get("device_id") == device_id)
+            and (start_ts is None or record_timestamp(r) >= start_ts)
+            and (end_ts is None or record_timestamp(r) < end_ts)
+        ]
+
+
+async def run_backtest(
+    configs: List[RuleConfig],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    device_id: Optional[str] = None,
+    pages: Optional[Iterable[List[Dict[str, Any]]]] = None,
+    engine: str = "vectorized",
+    max_events: int = 100,
+) -> Dict[str, Any]:
+    """
+    Replay history through candidate rule configurations in one pass.
+
+    Args:
+        configs: Configurations to compare (the live one if empty)
+        start: Only readings at or after this time
+        end: Only readings before this time
+        device_id: Only this device's readings
+        pages: Readings to replay instead of the stored ones (e.g. iter_csv_pages), oldest first
+        engine: ``vectorized`` or ``monitor`` (reading by reading through AlertMonitor)
+        max_events: Alert events listed per configuration
+
+    Returns:
+        Readings replayed, timing and one report per configuration
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}'. Available: {', '.join(ENGINES)}")
+    configs = configs or [RuleConfig(name="current")]
+    results = [_Result(config, max_events) for config in configs]
+
+    if pages is None:
+        from app.sensor_health import iter_reading_pages
+
+        source = iter_reading_pages(start, end, device_id)
+    else:
+        source = _filtered(pages, start, end, device_id)
+
+    started = time.perf_counter()
+    readings = 0
+    index: Dict[str, int] = {}
+    device_ids: List[str] = []
+    if engine == "vectorized":
+        replays = [VectorizedReplay(result.config, result) for result in results]
+        async for page in source:
+            if not page:
+                continue
+            rows, t, values = _page_arrays(page, index, device_ids)
+            for replay in replays:
+                replay.feed(device_ids, rows, t, values)
+            readings += len(page)
+    else:
+        monitors = [result.config.monitor() for result in results]
+        async for page in source:
+            for r in page:
+                d = r.get("device_id") or "unknown"
+                index.setdefault(d, len(index))
+                now = record_timestamp(r)
+                for monitor, result in zip(monitors, results):
+                    suppressed = monitor.suppressed
+                    fired = monitor.check_and_alert(d, r.get("ph"), r.get("turbidity"), r.get("tds"), current_time=now)
+                    _record_monitor_alerts(result, monitor, suppressed, fired, d, r, now)
+            readings += len(page)
+        device_ids = list(index)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "engine": engine,
+        "readings": readings,
+        "devices": len(device_ids),
+        "elapsed_seconds": round(elapsed, 3),
+        "readings_per_second": round(readings / elapsed) if elapsed > 0 else None,
+        "results": [result.report() for result in results],
+    }
+
+
+def _record_monitor_alerts(result: _Result, monitor: AlertMonitor, suppressed: int, fired: List[str], device_id: str, record: Dict[str, Any], now: float) -> None:
+    """Attribute what one check_and_alert call did to parameters (its messages name them)."""
+    from app.alert_digest import parameter_of
+
+    for message in fired:
+        param = parameter_of(message)
+        breach = monitor._breaches[device_id][param]
+        result.add("flapping" if "flapping" in message else "alert", now, device_id, param, record.get(param), now - breach.start)
+    result.counts["suppressed"] += monitor.suppressed - suppressed
@@ -0,0 +1,184 @@
+"""
+Compact binary reading payloads.
+
+JSON costs the firmware string building and the server a parse plus a
+pydantic validation per field. The binary format is a fixed little-endian
+layout, decoded in one ``numpy.frombuffer`` call and range-checked with
+array comparisons:
+
+    header  (6 bytes):  b"JM", version (u8, = 1), flags (u8), count (u16)
+    record (22 bytes):  device index (u16), epoch seconds (u32, 0 = unknown),
+                        pH, turbidity NTU, TDS ppm, temperature °C (f32 each,
+                        NaN temperature = not measured)
+
+With ``FLAG_SEQ`` set in the header, every record is followed by the
+device's boot id (u16) and the reading's sequence number (u32), 28 bytes in
+all, so retried payloads are stored once (see app.dedup).
+
+The device index becomes the device ID ``<prefix><index>`` (prefix
+``esp32_`` by default, so index 1 is ``esp32_1``) unless the request names a
+single device.
+"""
+
+import os
+import struct
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+MAGIC = b"JM"
+VERSION = 1
+HEADER = struct.Struct("<2sBBH")
+RECORD = np.dtype([
+    ("device", "<u2"),
+    ("epoch", "<u4"),
+    ("ph", "<f4"),
+    ("turbidity", "<f4"),
+    ("tds", "<f4"),
+    ("temperature", "<f4"),
+])
+RECORD_SEQ = np.dtype(RECORD.descr + [("boot", "<u2"), ("seq", "<u4")])
+FLAG_SEQ = 0x01
+
+# Epochs are accepted up to this far ahead of the server clock
+_MAX_CLOCK_SKEW = 300.0
+# Oldest epoch accepted (2020-01-01); anything earlier is an unsynced clock
+_MIN_EPOCH = 1577836800
+
+
+class BinaryPayloadError(ValueError):
+    """A payload whose header or length does not match the format."""
+
+
+def encode_readings(readings: Iterable[Dict[str, Any]]) -> bytes:
+    """
+    Pack readings into a payload.
+
+    Readings are dicts with device index ``device``, ``epoch`` and the values; when
+    any has a ``seq``, the payload carries ``boot`` and ``seq`` for every record.
+    """
+    rows = list(readings)
+    with_seq = any(r.get("seq") is not None for r in rows)
+    out = np.zeros(len(rows), dtype=RECORD_SEQ if with_seq else RECORD)
+    for i, r in enumerate(rows):
+        temperature = r.get("temperature")
+        values = (
+            r.get("device", 0), r.get("epoch", 0), r["ph"], r["turbidity"], r["tds"],
+            np.nan if temperature is None else temperature,
+        )
+        out[i] = values + (r.get("boot", 0), r.get("seq", 0)) if with_seq else values
+    return HEADER.pack(MAGIC, VERSION, FLAG_SEQ if with_seq else 0, len(rows)) + out.tobytes()
+
+
+def decode(payload: bytes) -> np.ndarray:
+    """Header check and zero-copy view of the records."""
+    if len(payload) < HEADER.size:
+        raise BinaryPayloadError(f"Payload shorter than the {HEADER.size}-byte header")
+    magic, version, flags, count = HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise BinaryPayloadError("Not a reading payload (bad magic)")
+    if version != VERSION:
+        raise BinaryPayloadError(f"Unsupported payload version {version} (supported: {VERSION})")
+    if flags & ~FLAG_SEQ:
+        raise BinaryPayloadError(f"Unsupported payload flags {flags:#04x}")
+    dtype = RECORD_SEQ if flags & FLAG_SEQ else RECORD
+    expected = HEADER.size + count * dtype.itemsize
+    if len(payload) != expected:
+        raise BinaryPayloadError(f"Payload is {len(payload)} bytes; {count} record(s) need {expected}")
+    return np.frombuffer(payload, dtype=dtype, count=count, offset=HEADER.size)
+
+
+def validate(records: np.ndarray, now: Optional[float] = None) -> Tuple[np.ndarray, List[Dict[str, Any]]]:
+    """
+    Range-check every record at once (the same limits as ReadingIn).
+
+    Returns:
+        (indices of valid records, rejected records as {"index", "detail"})
+    """
+    now = time.time() if now is None else now
+    ph, turbidity, tds = records["ph"], records["turbidity"], records["tds"]
+    epoch = records["epoch"]
+    checks = (
+        ("ph must be between 0 and 14", ~((ph >= 0) & (ph <= 14))),
+        ("turbidity must be >= 0", ~((turbidity >= 0) & np.isfinite(turbidity))),
+        ("tds must be >= 0", ~((tds >= 0) & np.isfinite(tds))),
+        ("temperature must be finite or NaN", np.isinf(records["temperature"])),
+        (
+            "epoch must be 0 or a synced clock",
+            (epoch != 0) & ((epoch < _MIN_EPOCH) | (epoch > now + _MAX_CLOCK_SKEW)),
+        ),
+    )
+    bad = np.zeros(len(records), dtype=bool)
+    for _, failed in checks:
+        bad |= failed
+    rejected = [
+        {"index": int(i), "detail": "; ".join(detail for detail, failed in checks if failed[i])}
+        for i in np.flatnonzero(bad)
+    ]
+    return np.flatnonzero(~bad), rejected
+
+
+def to_records(
+    records: np.ndarray,
+    valid: np.ndarray,
+    timestamp: str,
+    device_prefix: str,
+    device_id: Optional[str] = None,
+) -> List[Dict[str, Any]]:
+    """Reading records of the valid rows, in device clock order (``timestamp`` for unknown epochs, which keep payload order)."""
+    rows = records[valid]
+    # Stable sort: readings buffered on a device are replayed in the order they were measured
+    rows = rows[np.argsort(rows["epoch"], kind="stable")]
+    # float32 -> float64 with the float32 noise rounded off; NaN temperature -> None
+    values = np.round(np.stack([rows["ph"], rows["turbidity"], rows["tds"], rows["temperature"]], axis=1).astype(float), 4)
+    if device_id is None:
+        names = {index: f"{device_prefix}{index}" for index in np.unique(rows["device"]).tolist()}
+        devices = [names[index] for index in rows["device"].tolist()]
+    else:
+        devices = [device_id] * len(rows)
+    epochs = rows["epoch"].tolist()
+    sequenced = "seq" in rows.dtype.names
+    out = [
+        {
+            "timestamp": timestamp,
+            "ph": ph,
+            "turbidity": turbidity,
+            "tds": tds,
+            "device_id": device,
+            "temperature": None if temperature != temperature else temperature,
+        }
+        for (ph, turbidity, tds, temperature), device in zip(values.tolist(), devices)
+    ]
+    # Synced device clocks give the measurement time
+    for record, epoch in zip(out, epochs):
+        if epoch:
+            record["timestamp"] = record["measured_at"] = datetime.fromtimestamp(epoch, timezone.utc).isoformat()
+    if sequenced:
+        for record, boot, seq in zip(out, rows["boot"].tolist(), rows["seq"].tolist()):
+            record["boot_id"] = boot
+            record["seq"] = seq
+    return out
+
+
+class BinaryIngestStats:
+    def __init__(self):
+        self.payloads = 0
+        self.bad_payloads = 0
+        self.readings = 0
+        self.rejected = 0
+        self.bytes = 0
+
+    def get_metrics(self) -> dict:
+        return {
+            "payloads": self.payloads,
+            "bad_payloads": self.bad_payloads,
+            "readings": self.readings,
+            "rejected": self.rejected,
+            "bytes_per_reading": round(self.bytes / (self.readings + self.rejected), 1) if self.readings + self.rejected else None,
+        }
+
+
+DEFAULT_DEVICE_PREFIX = os.environ.get("BINARY_INGEST_DEVICE_PREFIX", "esp32_")
+binary_ingest_stats = BinaryIngestStats()
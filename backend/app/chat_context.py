@@ -0,0 +1,272 @@
+"""
+Cached water-quality context for the chatbot.
+
+Keeps the latest reading per device and the most recent alerts in memory,
+updated from the ingest path, together with the system prompt built from
+them. Chat turns read the cached snapshot instead of querying storage,
+and only the knowledge sections relevant to the question (plus those for
+out-of-range parameters) are added to the prompt.
+"""
+
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.knowledge_base import STATE_SECTIONS, TOP_K, format_sections, full_knowledge, retriever
+from app.rolling_stats import record_timestamp
+from app.thresholds import thresholds
+
+def format_alerts_context(alerts: List[Dict[str, Any]]) -> str:
+    """Format alerts into context string for the chatbot."""
+    if not alerts:
+        return "No recent alerts. Water quality is within safe parameters."
+
+    context_parts = []
+    for alert in alerts[:5]:  # Use top 5 most recent alerts
+        message = alert.get("message", "")
+        timestamp = alert.get("timestamp", "")
+        device_id = alert.get("device_id", "")
+
+        # Extract parameter values from alert message or readings
+        readings = alert.get("readings", {})
+        ph = readings.get("ph") if readings else None
+        turbidity = readings.get("turbidity") if readings else None
+        tds = readings.get("tds") if readings else None
+
+        alert_info = f"Alert: {message}"
+        if device_id:
+            alert_info += f" (Device: {device_id})"
+        if timestamp:
+            alert_info += f" (Time: {timestamp})"
+        if ph is not None:
+            alert_info += f" | pH: {ph:.2f}"
+        if turbidity is not None:
+            alert_info += f" | Turbidity: {turbidity:.1f} NTU"
+        if tds is not None:
+            alert_info += f" | TDS: {tds:.0f} ppm"
+
+        context_parts.append(alert_info)
+
+    return "\n".join(context_parts)
+
+
+def build_water_context(latest_reading: Optional[Dict[str, Any]]) -> str:
+    """Describe the latest reading and any out-of-range parameters (using its device's limits)."""
+    if not latest_reading:
+        return ""
+    ph = latest_reading.get("ph")
+    tds = latest_reading.get("tds")
+    turbidity = latest_reading.get("turbidity")
+    profile = thresholds.for_device(latest_reading.get("device_id"))
+
+    water_context = f"\n\nCurrent Water Quality:\n"
+    water_context += f"pH: {ph:.2f} (Safe range: {profile.describe('ph')})\n"
+    water_context += f"TDS: {tds:.0f} ppm (Safe: {profile.describe('tds')})\n"
+    water_context += f"Turbidity: {turbidity:.1f} NTU (Safe: {profile.describe('turbidity')})\n"
+
+    # Identify issues
+    issues = []
+    ph_state = profile.state("ph", ph)
+    if ph_state == "low":
+        issues.append(f"pH is too acidic ({ph:.2f})")
+    elif ph_state == "high":
+        issues.append(f"pH is too alkaline ({ph:.2f})")
+    if profile.state("tds", tds) != "ok":
+        issues.append(f"TDS is too high ({tds:.0f} ppm)")
+    if profile.state("turbidity", turbidity) != "ok":
+        issues.append(f"Turbidity is too high ({turbidity:.1f} NTU)")
+
+    if issues:
+        water_context += f"\n⚠️ Issues Detected: {', '.join(issues)}\n"
+    else:
+        water_context += f"\n✅ All parameters are within safe ranges.\n"
+    return water_context
+
+
+def water_state_signature(latest_reading: Optional[Dict[str, Any]]) -> str:
+    """Coarse in/out-of-range state of the latest reading, e.g. ``ph:ok|tds:high|turbidity:ok``."""
+    if not latest_reading:
+        return "no-data"
+    profile = thresholds.for_device(latest_reading.get("device_id"))
+    ph_state = profile.state("ph", latest_reading.get("ph"))
+    tds_state = profile.state("tds", latest_reading.get("tds"))
+    turbidity_state = profile.state("turbidity", latest_reading.get("turbidity"))
+    return f"ph:{ph_state}|tds:{tds_state}|turbidity:{turbidity_state}"
+
+
+def build_system_prompt(water_context: str, alerts_context: str, knowledge: Optional[str] = None) -> str:
+    """Assemble the chatbot system prompt (the full knowledge base unless ``knowledge`` is given)."""
+    knowledge = full_knowledge() if knowledge is None else knowledge
+    return f"""You are a simple and helpful water quality assistant for JalSuraksha.
+Your job is to provide clear, actionable recommendations when water quality is bad.
+
+Knowledge Base:
+{knowledge}
+
+{water_context}
+
+Recent Alerts:
+{alerts_context}
+
+Guidelines:
+- Be concise and practical
+- Focus on what to do if water is bad
+- Provide step-by-step recommendations
+- Use simple language
+- Prioritize safety
+- If water quality is good, acknowledge it briefly
+- The current reading and recent alerts are above; use the tools only for history, trends, statistics or other devices
+- Always use proper spacing and punctuation in your responses"""
+
+
+class ChatContextCache:
+    """Per-device water context snapshots, refreshed by ingest events."""
+
+    def __init__(self, alerts_limit: int = 5):
+        self.alerts_limit = alerts_limit
+        # Latest reading per device; the None key tracks the most recent reading of any device
+        self._latest: Dict[Optional[str], Dict[str, Any]] = {}
+        self._alerts: deque = deque(maxlen=alerts_limit)
+        self._alerts_loaded = False
+        self._loaded_devices: set = set()
+        # Cached (water context, alerts context), only for devices someone has chatted about
+        self._contexts: Dict[Optional[str], Tuple[str, str]] = {}
+        self.hits = 0
+        self.rebuilds = 0
+        self.cold_loads = 0
+        self.prompts_built = 0
+        self.prompt_chars = 0
+        self.full_prompt_chars = 0
+        self.sections_sent = 0
+
+    def on_reading(self, record: Dict[str, Any]) -> None:
+        """Record a newly stored reading and refresh affected snapshots."""
+        device_id = record.get("device_id")
+        timestamp = record_timestamp(record)
+        for key in (device_id, None):
+            # A replayed (backfilled) reading does not replace a newer one
+            current = self._latest.get(key)
+            if current is not None and record_timestamp(current) >= timestamp:
+                continue
+            self._latest[key] = record
+            if key in self._contexts:
+                self._rebuild(key)
+
+    def on_alert(self, alert_record: Dict[str, Any]) -> None:
+        """Record a newly stored alert; alerts appear in every prompt."""
+        self._alerts.appendleft(alert_record)
+        for key in list(self._contexts):
+            self._rebuild(key)
+
+    def _rebuild(self, device_id: Optional[str]) -> Tuple[str, str]:
+        self.rebuilds += 1
+        context = (
+            build_water_context(self._latest.get(device_id)),
+            format_alerts_context(list(self._alerts)),
+        )
+        self._contexts[device_id] = context
+        return context
+
+    def _knowledge(self, device_id: Optional[str], question: Optional[str]) -> Tuple[str, List[str]]:
+        latest = self._latest.get(device_id)
+        # The device's limits, or those of the device whose reading is shown
+        profile = thresholds.for_device(device_id if device_id is not None else (latest or {}).get("device_id"))
+        if question is None:
+            return full_knowledge(profile), [section.key for section in retriever.sections]
+        signature = water_state_signature(latest)
+        required = [STATE_SECTIONS[state] for state in signature.split("|") if state in STATE_SECTIONS]
+        sections = retriever.retrieve(question, k=TOP_K, required=required)
+        return format_sections(sections, profile), [section.key for section in sections]
+
+    def _record_prompt(self, prompt: str, knowledge: str, section_keys: List[str]) -> None:
+        full = len(prompt) - len(knowledge) + len(full_knowledge())
+        self.prompts_built += 1
+        self.prompt_chars += len(prompt)
+        self.full_prompt_chars += full
+        self.sections_sent += len(section_keys)
+        # ~4 characters per token for English text
+        print(
+            f"[CHATBOT PROMPT] sections={','.join(section_keys) or '-'} chars={len(prompt)} "
+            f"(~{len(prompt) // 4} tokens; {full} with the full knowledge base)"
+        )
+
+    async def _load(self, device_id: Optional[str]) -> None:
+        """Seed a snapshot from storage the first time a device is asked about."""
+        from app.main import _get_alerts, _get_latest
+
+        self.cold_loads += 1
+        if device_id not in self._loaded_devices and device_id not in self._latest:
+            try:
+                reading = await _get_latest(device_id)
+                if reading and device_id not in self._latest:
+                    self._latest[device_id] = reading
+            except Exception as e:
+                print(f"[CHATBOT] Error fetching latest reading: {e}")
+        self._loaded_devices.add(device_id)
+        if not self._alerts_loaded:
+            try:
+                alerts = await _get_alerts(self.alerts_limit)
+                if not self._alerts:
+                    self._alerts.extend(alerts)
+            except Exception as e:
+                print(f"[CHATBOT] Error fetching alerts: {e}")
+            self._alerts_loaded = True
+
+    async def get_system_prompt(
+        self,
+        device_id: Optional[str] = None,
+        fallback_alerts: Optional[List[Dict[str, Any]]] = None,
+        question: Optional[str] = None,
+    ) -> str:
+        """
+        Get the system prompt for a device.
+
+        Args:
+            device_id: Device to describe (None = most recently reporting device)
+            fallback_alerts: Client-supplied alerts, used only when no alerts are known
+            question: User question used to pick knowledge sections (None = whole knowledge base)
+
+        Returns:
+            System prompt string
+        """
+        if device_id not in self._loaded_devices or not self._alerts_loaded:
+            await self._load(device_id)
+        if not self._alerts and fallback_alerts:
+            # Client-supplied alerts are request-specific, so don't cache this context
+            context = (
+                build_water_context(self._latest.get(device_id)),
+                format_alerts_context(fallback_alerts),
+            )
+        else:
+            context = self._contexts.get(device_id)
+            if context is not None:
+                self.hits += 1
+            else:
+                context = self._rebuild(device_id)
+        knowledge, section_keys = self._knowledge(device_id, question)
+        prompt = build_system_prompt(context[0], context[1], knowledge)
+        self._record_prompt(prompt, knowledge, section_keys)
+        return prompt
+
+    def invalidate(self) -> None:
+        """Drop cached contexts (e.g. after threshold profiles change)."""
+        self._contexts = {}
+
+    def get_water_signature(self, device_id: Optional[str] = None) -> str:
+        """Coarse water state of a device's snapshot (call after ``get_system_prompt``)."""
+        return water_state_signature(self._latest.get(device_id))
+
+    def get_metrics(self) -> dict:
+        return {
+            "hits": self.hits,
+            "rebuilds": self.rebuilds,
+            "cold_loads": self.cold_loads,
+            "cached_prompts": len(self._contexts),
+            "prompts_built": self.prompts_built,
+            "avg_prompt_chars": self.prompt_chars / self.prompts_built if self.prompts_built else 0.0,
+            "avg_full_prompt_chars": self.full_prompt_chars / self.prompts_built if self.prompts_built else 0.0,
+            "avg_sections": self.sections_sent / self.prompts_built if self.prompts_built else 0.0,
+            "devices": len(self._latest) - (1 if None in self._latest else 0),
+        }
+
+
+chat_context = ChatContextCache()
@@ -2,128 +2,210 @@
 Simple chatbot module for water quality recommendations using LangChain and Azure OpenAI.
 Streams recommendations based on current water quality data.
 """
+import asyncio
+import json
 import os
-from typing import List, Dict, Any, Optional, AsyncGenerator
-from langchain_openai import AzureChatOpenAI
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-
-# Global memory storage (simple in-memory for now)
-_chat_memories: Dict[str, List] = {}
-
-# Water quality recommendations knowledge base
-WATER_QUALITY_KNOWLEDGE = """
-Water Quality Recommendations:
-
-1. pH Level Issues:
-   - If pH < 6.0 (Acidic): Add alkaline substances like baking soda or lime. Install pH correction filters. Check for industrial contamination sources.
-   - If pH > 9.0 (Alkaline): Add acidic substances like citric acid or vinegar. Install reverse osmosis system. Check for soap or detergent contamination.
-
-2. High TDS (Total Dissolved Solids):
-   - Install reverse osmosis (RO) system
-   - Use activated carbon filters
-   - Consider distillation for very high TDS
-   - Check for salt intrusion or mineral contamination
-   - Regular filter maintenance is essential
-
-3. High Turbidity:
-   - Install sediment filters
-   - Use coagulation and flocculation treatment
-   - Consider sand filtration systems
-   - Check for source contamination
-   - Regular cleaning of storage tanks
-
-4. General Water Quality Improvement:
-   - Regular testing and monitoring
-   - Proper storage in clean containers
-   - Boiling water for consumption
-   - Use of water purifiers
-   - Regular maintenance of water treatment systems
-   - Avoid storing water in direct sunlight
-   - Replace filters as per manufacturer recommendations
-
-5. Emergency Actions:
-   - If water quality is severely compromised, stop consumption immediately
-   - Use bottled water as temporary solution
-   - Contact local water authority
-   - Boil water before use if contamination is suspected
-   - Install emergency filtration systems
-"""
+import re
+import time
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional, AsyncGenerator, Set, Tuple
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage, message_chunk_to_message
+
+from app.chat_context import chat_context
+from app.chatbot_tools import TOOLS, execute_tool
+from app.intent_router import degraded_answer, route_metrics, try_fast_path
+from app.llm_gateway import LLMUnavailableError, get_llm_gateway
+from app.session_store import get_session_store
+
+
+class StreamMetrics:
+    """Time-to-first-token and throughput of recent streamed responses."""
+
+    def __init__(self, window: int = 200):
+        self.samples: deque = deque(maxlen=window)
+        self.total_requests = 0
+
+    def record(self, ttft: float, total: float, tokens: int) -> None:
+        generation_time = total - ttft
+        tokens_per_s = tokens / generation_time if generation_time > 0 else 0.0
+        self.samples.append((ttft, total, tokens_per_s))
+        self.total_requests += 1
+        print(f"[CHATBOT STREAM] ttft={ttft * 1000:.0f}ms total={total * 1000:.0f}ms tokens={tokens} ({tokens_per_s:.1f} tok/s)")
+
+    def get_metrics(self) -> dict:
+        if not self.samples:
+            return {"requests": self.total_requests}
+        ttfts = sorted(s[0] for s in self.samples)
+        totals = sorted(s[1] for s in self.samples)
+        rates = [s[2] for s in self.samples]
+        return {
+            "requests": self.total_requests,
+            "ttft_p50_ms": ttfts[len(ttfts) // 2] * 1000,
+            "ttft_p95_ms": ttfts[int(len(ttfts) * 0.95)] * 1000,
+            "total_p50_ms": totals[len(totals) // 2] * 1000,
+            "tokens_per_s_avg": sum(rates) / len(rates),
+        }
+
+
+stream_metrics = StreamMetrics()
+
+
+class ResponseCache:
+    """
+    LRU + TTL cache of chatbot answers.
 
+    Keyed on the normalized question and the coarse water state signature, so
+    a cached answer is only reused while the water is in the same condition.
+    Near-duplicate phrasings are matched through a character trigram index.
+    """
 
-def get_llm(streaming: bool = False):
-    """Initialize and return the Azure OpenAI LLM for streaming."""
-    azure_openai_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
-    azure_openai_api_key = os.environ.get("AZURE_OPENAI_API_KEY")
-    azure_openai_deployment = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
-    api_version = os.environ.get("OPENAI_API_VERSION", "2024-12-01-preview")
-
-    if not azure_openai_endpoint or not azure_openai_api_key:
-        raise ValueError("Azure OpenAI credentials not configured. Please set AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY in .env file.")
-
-    return AzureChatOpenAI(
-        azure_endpoint=azure_openai_endpoint,
-        azure_deployment=azure_openai_deployment,
-        openai_api_version=api_version,
-        openai_api_key=azure_openai_api_key,
-        temperature=0.7,
-        streaming=streaming,
-    )
-
-
-def format_alerts_context(alerts: List[Dict[str, Any]]) -> str:
-    """Format alerts into context string for the chatbot."""
-    if not alerts:
-        return "No recent alerts. Water quality is within safe parameters."
-
-    context_parts = []
-    for alert in alerts[:5]:  # Use top 5 most recent alerts
-        message = alert.get("message", "")
-        timestamp = alert.get("timestamp", "")
-        device_id = alert.get("device_id", "")
-        
-        # Extract parameter values from alert message or readings
-        readings = alert.get("readings", {})
-        ph = readings.get("ph") if readings else None
-        turbidity = readings.get("turbidity") if readings else None
-        tds = readings.get("tds") if readings else None
-
-        alert_info = f"Alert: {message}"
-        if device_id:
-            alert_info += f" (Device: {device_id})"
-        if timestamp:
-            alert_info += f" (Time: {timestamp})"
-        if ph is not None:
-            alert_info += f" | pH: {ph:.2f}"
-        if turbidity is not None:
-            alert_info += f" | Turbidity: {turbidity:.1f} NTU"
-        if tds is not None:
-            alert_info += f" | TDS: {tds:.0f} ppm"
-
-        context_parts.append(alert_info)
-
-    return "\n".join(context_parts)
-
-
-def _get_latest_reading_data():
-    """Get the latest water quality reading directly."""
-    try:
-        from app.main import _get_latest
-        reading = _get_latest(None)
-        return reading
-    except Exception as e:
-        print(f"[CHATBOT] Error fetching latest reading: {e}")
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 600.0, similarity_threshold: float = 0.85):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+        # (signature, normalized question) -> (response, expires_at, trigrams)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[str, float, frozenset]]" = OrderedDict()
+        # (signature, trigram) -> keys containing it
+        self._index: Dict[Tuple[str, str], Set[Tuple[str, str]]] = {}
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def normalize(message: str) -> str:
+        return " ".join(re.sub(r"[^\w\s]", " ", message.lower()).split())
+
+    @staticmethod
+    def _trigrams(text: str) -> frozenset:
+        padded = f"  {text} "
+        return frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        _, _, grams = self._entries.pop(key)
+        for gram in grams:
+            bucket = self._index.get((key[0], gram))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._index[(key[0], gram)]
+
+    def _live(self, key: Tuple[str, str], now: float) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] <= now:
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def _most_similar(self, signature: str, grams: frozenset) -> Optional[Tuple[str, str]]:
+        shared: Dict[Tuple[str, str], int] = {}
+        for gram in grams:
+            for key in self._index.get((signature, gram), ()):
+                shared[key] = shared.get(key, 0) + 1
+        best_key, best_score = None, 0.0
+        for key, overlap in shared.items():
+            other = self._entries[key][2]
+            score = overlap / (len(grams) + len(other) - overlap)
+            if score > best_score:
+                best_key, best_score = key, score
+        return best_key if best_score >= self.similarity_threshold else None
+
+    def get(self, message: str, signature: str) -> Optional[str]:
+        now = time.monotonic()
+        normalized = self.normalize(message)
+        response = self._live((signature, normalized), now)
+        if response is not None:
+            self.exact_hits += 1
+            return response
+        if self.similarity_threshold > 0:
+            key = self._most_similar(signature, self._trigrams(normalized))
+            if key is not None:
+                response = self._live(key, now)
+                if response is not None:
+                    self.similar_hits += 1
+                    return response
+        self.misses += 1
         return None
 
+    def put(self, message: str, signature: str, response: str) -> None:
+        normalized = self.normalize(message)
+        key = (signature, normalized)
+        if key in self._entries:
+            self._remove(key)
+        grams = self._trigrams(normalized)
+        self._entries[key] = (response, time.monotonic() + self.ttl, grams)
+        for gram in grams:
+            self._index.setdefault((signature, gram), set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def get_metrics(self) -> dict:
+        lookups = self.exact_hits + self.similar_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "lookups": lookups,
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_rate": (self.exact_hits + self.similar_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+response_cache = ResponseCache(
+    max_entries=int(os.environ.get("CHATBOT_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.environ.get("CHATBOT_CACHE_TTL", "600")),
+    similarity_threshold=float(os.environ.get("CHATBOT_CACHE_SIMILARITY", "0.85")),
+)
+
+
+def _is_cacheable(user_message: str, history: List[Dict[str, str]]) -> bool:
+    """Short follow-ups ("why?", "tell me more") depend on the conversation, so skip the cache."""
+    return not history or len(ResponseCache.normalize(user_message).split()) >= 3
+
+
+def _is_storable(history: List[Dict[str, str]], tool_memo: Dict[Tuple[str, str], asyncio.Future]) -> bool:
+    """
+    Only standalone answers built from the chat context are cached.
+
+    Answers that ran tools carry live history/stats the context signature does not
+    cover, and answers to a conversation may only make sense within it.
+    """
+    return not history and not tool_memo
 
-def _get_recent_alerts_data(limit: int = 5):
-    """Get recent alerts directly."""
-    try:
-        from app.main import _get_alerts
-        alerts = _get_alerts(limit)
-        return alerts
-    except Exception as e:
-        print(f"[CHATBOT] Error fetching alerts: {e}")
-        return []
+
+# Tool-calling rounds per turn before the model must answer with the data it has
+MAX_TOOL_ROUNDS = 3
+
+# Appended to a streamed answer that failed part-way (sent and stored with it)
+INTERRUPTED_NOTE = "\n\n(Response interrupted. Please try again.)"
+
+
+async def _run_tool_calls(tool_calls: List[Dict[str, Any]], memo: Dict[Tuple[str, str], asyncio.Future]) -> List[ToolMessage]:
+    """
+    Execute one model turn's tool calls concurrently.
+
+    Results are memoized per chat turn, so a tool requested again with the same
+    arguments (in this round or a later one) is not executed twice.
+    """
+    async def run(call: Dict[str, Any]) -> ToolMessage:
+        args = call.get("args") or {}
+        key = (call["name"], json.dumps(args, sort_keys=True))
+        if key not in memo:
+            memo[key] = asyncio.ensure_future(execute_tool(call["name"], args))
+        result = await memo[key]
+        return ToolMessage(content=json.dumps(result, default=str), tool_call_id=call["id"])
+
+    return list(await asyncio.gather(*(run(call) for call in tool_calls)))
+
+
+async def _remember(session_id: str, user_message: str, response: str) -> None:
+    """Append a turn to the bounded session store."""
+    await get_session_store().append(session_id, user_message, response)
 
 
 async def get_chatbot_response_stream(user_message: str, alerts: List[Dict[str, Any]] = None, session_id: str = "default") -> AsyncGenerator[str, None]:
@@ -134,77 +216,53 @@ async def get_chatbot_response_stream(user_message: str, alerts: List[Dict[str,
         str: Chunks of the response text
     """
     try:
-        # Get conversation history for this session
-        if session_id not in _chat_memories:
-            _chat_memories[session_id] = []
+        started = time.perf_counter()
         
-        # Always fetch latest reading and alerts for context
-        latest_reading = _get_latest_reading_data()
-        recent_alerts = _get_recent_alerts_data(5)
+        # Get conversation history for this session (last 5 messages)
+        history = await get_session_store().get_history(session_id, limit=5)
         
-        # Build water quality context
-        water_context = ""
-        if latest_reading:
-            ph = latest_reading.get("ph")
-            tds = latest_reading.get("tds")
-            turbidity = latest_reading.get("turbidity")
-            
-            water_context = f"\n\nCurrent Water Quality:\n"
-            water_context += f"pH: {ph:.2f} (Safe range: 6.0-9.0)\n"
-            water_context += f"TDS: {tds:.0f} ppm (Safe: <500 ppm)\n"
-            water_context += f"Turbidity: {turbidity:.1f} NTU (Safe: <100 NTU)\n"
-            
-            # Identify issues
-            issues = []
-            if ph < 6.0:
-                issues.append(f"pH is too acidic ({ph:.2f})")
-            elif ph > 9.0:
-                issues.append(f"pH is too alkaline ({ph:.2f})")
-            if tds > 500:
-                issues.append(f"TDS is too high ({tds:.0f} ppm)")
-            if turbidity > 100:
-                issues.append(f"Turbidity is too high ({turbidity:.1f} NTU)")
-            
-            if issues:
-                water_context += f"\n⚠️ Issues Detected: {', '.join(issues)}\n"
-            else:
-                water_context += f"\n✅ All parameters are within safe ranges.\n"
+        # Factual questions are answered from live data without the LLM
+        fast = await try_fast_path(user_message)
+        if fast is not None:
+            intent, answer = fast
+            await _remember(session_id, user_message, answer)
+            route_metrics.record(f"fast_path:{intent}", time.perf_counter() - started)
+            yield answer
+            return
         
-        # Format alerts context
-        alerts_context = format_alerts_context(recent_alerts or alerts or [])
+        # Cached snapshot of the latest reading and alerts, plus knowledge sections for this question
+        system_prompt = await chat_context.get_system_prompt(fallback_alerts=alerts, question=user_message)
         
-        # Build system prompt
-        system_prompt = f"""You are a simple and helpful water quality assistant for JalSuraksha.
-Your job is to provide clear, actionable recommendations when water quality is bad.
-
-Knowledge Base:
-{WATER_QUALITY_KNOWLEDGE}
-
-{water_context}
-
-Recent Alerts:
-{alerts_context}
-
-Guidelines:
-- Be concise and practical
-- Focus on what to do if water is bad
-- Provide step-by-step recommendations
-- Use simple language
-- Prioritize safety
-- If water quality is good, acknowledge it briefly
-- Always use proper spacing and punctuation in your responses"""
+        # Repeated questions about the same water state are answered from cache
+        signature = chat_context.get_water_signature()
+        cacheable = _is_cacheable(user_message, history)
+        cached = response_cache.get(user_message, signature) if cacheable else None
+        if cached is not None:
+            await _remember(session_id, user_message, cached)
+            route_metrics.record("cache", time.perf_counter() - started)
+            yield cached
+            return
         
         # Build messages list
+        gateway = get_llm_gateway()
         try:
-            llm = get_llm(streaming=True)
+            gateway.get_llm()
         except Exception as e:
             yield f"Configuration error: {str(e)}. Please check your Azure OpenAI settings in .env file."
             return
+        
+        # Upstream failing: answer from live data instead of queueing behind it
+        if not gateway.available:
+            answer = await degraded_answer(user_message)
+            await _remember(session_id, user_message, answer)
+            route_metrics.record("degraded", time.perf_counter() - started)
+            yield answer
+            return
             
         messages = [SystemMessage(content=system_prompt)]
         
         # Add conversation history (last 5 messages to keep it simple)
-        for msg in _chat_memories[session_id][-5:]:
+        for msg in history:
             if msg["role"] == "user":
                 messages.append(HumanMessage(content=msg["content"]))
             elif msg["role"] == "assistant":
@@ -213,78 +271,77 @@ Guidelines:
         # Add current user message
         messages.append(HumanMessage(content=user_message))
         
-        # Stream response - use non-streaming to avoid spacing issues
-        # Then stream the complete response character by character for UX
+        # Stream tokens as the model produces them; whitespace is preserved
+        # verbatim and the SSE layer encodes each delta.
         full_response = ""
+        first_token_at: Optional[float] = None
+        token_count = 0
+        completed = False
+        degraded = False
+        
+        tool_memo: Dict[Tuple[str, str], asyncio.Future] = {}
         
         try:
-            # Get full response first (non-streaming) to ensure proper spacing
-            llm_sync = get_llm(streaming=False)
-            response = llm_sync.invoke(messages)
-            
-            if hasattr(response, 'content'):
-                full_response = response.content
-            elif hasattr(response, 'text'):
-                full_response = response.text
-            else:
-                full_response = str(response)
-            
-            # Stream the complete response in chunks for better UX
-            chunk_size = 5  # Stream 5 characters at a time
-            for i in range(0, len(full_response), chunk_size):
-                chunk = full_response[i:i + chunk_size]
-                yield chunk
-                # Small delay for smooth streaming effect
-                import asyncio
-                await asyncio.sleep(0.01)
-                
-        except Exception as stream_error:
-            # If non-streaming fails, try streaming
-            import traceback
-            error_trace = traceback.format_exc()
-            print(f"[CHATBOT STREAM] Error: {error_trace}")
-            try:
-                async for chunk in llm.astream(messages):
-                    if hasattr(chunk, 'content'):
-                        delta = chunk.content or ""
-                    elif hasattr(chunk, 'text'):
-                        delta = chunk.text or ""
-                    else:
-                        delta = str(chunk) if chunk else ""
-                    
-                    if delta:
-                        full_response += delta
-                        yield delta
-            except Exception as e2:
-                raise stream_error
-                    
-        except Exception as stream_error:
+            for tool_round in range(MAX_TOOL_ROUNDS + 1):
+                # The last round disables tools so the model has to answer
+                tool_choice = "none" if tool_round == MAX_TOOL_ROUNDS else None
+                gathered = None
+                async for chunk in gateway.astream(messages, TOOLS, tool_choice):
+                    gathered = chunk if gathered is None else gathered + chunk
+                    delta = chunk.content if hasattr(chunk, "content") else str(chunk)
+                    if not isinstance(delta, str) or not delta:
+                        continue
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    token_count += 1
+                    full_response += delta
+                    yield delta
+                if gathered is None or not getattr(gathered, "tool_calls", None):
+                    break
+                ai_message = message_chunk_to_message(gathered)
+                messages.append(ai_message)
+                messages.extend(await _run_tool_calls(ai_message.tool_calls, tool_memo))
+            completed = True
+        except Exception as e:
             import traceback
-            error_trace = traceback.format_exc()
-            print(f"[CHATBOT STREAM] Error during streaming: {error_trace}")
-            # If streaming fails, try non-streaming as fallback
-            try:
-                llm_sync = get_llm(streaming=False)
-                response = llm_sync.invoke(messages)
-                if hasattr(response, 'content'):
-                    full_response = response.content
-                elif hasattr(response, 'text'):
-                    full_response = response.text
-                else:
-                    full_response = str(response)
+            print(f"[CHATBOT STREAM] Error during streaming: {traceback.format_exc()}")
+            if full_response:
+                # Kept in the history as well, so later turns know this answer was cut short
+                full_response += INTERRUPTED_NOTE
+                yield INTERRUPTED_NOTE
+            elif isinstance(e, LLMUnavailableError):
+                # Breaker open, queue full or deadline hit: retrying upstream would only add load
+                full_response = await degraded_answer(user_message)
+                degraded = True
                 yield full_response
-            except Exception as e2:
-                import traceback
-                print(f"[CHATBOT FALLBACK] Error: {traceback.format_exc()}")
-                yield f"I apologize, but I'm experiencing technical difficulties. Please check the backend logs for details."
+            else:
+                # Nothing was sent yet, so a single non-streaming answer is still seamless
+                try:
+                    response = await gateway.ainvoke(messages, TOOLS, "none")
+                    full_response = response.content if hasattr(response, "content") else str(response)
+                    first_token_at = time.perf_counter()
+                    completed = True
+                    yield full_response
+                except LLMUnavailableError:
+                    full_response = await degraded_answer(user_message)
+                    degraded = True
+                    yield full_response
+                except Exception:
+                    print(f"[CHATBOT FALLBACK] Error: {traceback.format_exc()}")
+                    yield "I apologize, but I'm experiencing technical difficulties. Please check the backend logs for details."
         
-        # Store in memory
-        _chat_memories[session_id].append({"role": "user", "content": user_message})
-        _chat_memories[session_id].append({"role": "assistant", "content": full_response})
+        if first_token_at is not None:
+            stream_metrics.record(
+                ttft=first_token_at - started,
+                total=time.perf_counter() - started,
+                tokens=token_count,
+            )
         
-        # Keep memory size manageable
-        if len(_chat_memories[session_id]) > 10:
-            _chat_memories[session_id] = _chat_memories[session_id][-10:]
+        if completed and cacheable and _is_storable(history, tool_memo):
+            response_cache.put(user_message, signature, full_response)
+        if full_response:
+            await _remember(session_id, user_message, full_response)
+        route_metrics.record("degraded" if degraded else "llm", time.perf_counter() - started)
             
     except ValueError as e:
         yield f"Configuration error: {str(e)}. Please check your Azure OpenAI settings."
@@ -295,7 +352,7 @@ Guidelines:
         yield f"I apologize, but I'm experiencing technical difficulties. Please try again later. Error: {str(e)}"
 
 
-def get_chatbot_response(user_message: str, alerts: List[Dict[str, Any]] = None, session_id: str = "default") -> str:
+async def get_chatbot_response(user_message: str, alerts: List[Dict[str, Any]] = None, session_id: str = "default") -> str:
     """
     Get response from chatbot (non-streaming fallback).
     
@@ -308,73 +365,46 @@ def get_chatbot_response(user_message: str, alerts: List[Dict[str, Any]] = None,
         Chatbot response string
     """
     try:
-        llm = get_llm(streaming=False)
+        started = time.perf_counter()
         
-        # Get latest reading and alerts
-        latest_reading = _get_latest_reading_data()
-        recent_alerts = _get_recent_alerts_data(5)
+        # Get conversation history for this session (last 5 messages)
+        history = await get_session_store().get_history(session_id, limit=5)
         
-        # Build water quality context
-        water_context = ""
-        if latest_reading:
-            ph = latest_reading.get("ph")
-            tds = latest_reading.get("tds")
-            turbidity = latest_reading.get("turbidity")
-            
-            water_context = f"\n\nCurrent Water Quality:\n"
-            water_context += f"pH: {ph:.2f} (Safe range: 6.0-9.0)\n"
-            water_context += f"TDS: {tds:.0f} ppm (Safe: <500 ppm)\n"
-            water_context += f"Turbidity: {turbidity:.1f} NTU (Safe: <100 NTU)\n"
-            
-            # Identify issues
-            issues = []
-            if ph < 6.0:
-                issues.append(f"pH is too acidic ({ph:.2f})")
-            elif ph > 9.0:
-                issues.append(f"pH is too alkaline ({ph:.2f})")
-            if tds > 500:
-                issues.append(f"TDS is too high ({tds:.0f} ppm)")
-            if turbidity > 100:
-                issues.append(f"Turbidity is too high ({turbidity:.1f} NTU)")
-            
-            if issues:
-                water_context += f"\n⚠️ Issues Detected: {', '.join(issues)}\n"
-            else:
-                water_context += f"\n✅ All parameters are within safe ranges.\n"
+        # Factual questions are answered from live data without the LLM
+        fast = await try_fast_path(user_message)
+        if fast is not None:
+            intent, answer = fast
+            await _remember(session_id, user_message, answer)
+            route_metrics.record(f"fast_path:{intent}", time.perf_counter() - started)
+            return answer
+        
+        # Cached snapshot of the latest reading and alerts, plus knowledge sections for this question
+        system_prompt = await chat_context.get_system_prompt(fallback_alerts=alerts, question=user_message)
         
-        # Format alerts context
-        alerts_context = format_alerts_context(recent_alerts or alerts or [])
+        # Repeated questions about the same water state are answered from cache
+        signature = chat_context.get_water_signature()
+        cacheable = _is_cacheable(user_message, history)
+        cached = response_cache.get(user_message, signature) if cacheable else None
+        if cached is not None:
+            await _remember(session_id, user_message, cached)
+            route_metrics.record("cache", time.perf_counter() - started)
+            return cached
         
-        # Get conversation history for this session
-        if session_id not in _chat_memories:
-            _chat_memories[session_id] = []
+        gateway = get_llm_gateway()
+        gateway.get_llm()
         
-        # Build system prompt
-        system_prompt = f"""You are a simple and helpful water quality assistant for JalSuraksha.
-Your job is to provide clear, actionable recommendations when water quality is bad.
-
-Knowledge Base:
-{WATER_QUALITY_KNOWLEDGE}
-
-{water_context}
-
-Recent Alerts:
-{alerts_context}
-
-Guidelines:
-- Be concise and practical
-- Focus on what to do if water is bad
-- Provide step-by-step recommendations
-- Use simple language
-- Prioritize safety
-- If water quality is good, acknowledge it briefly
-- Always use proper spacing and punctuation in your responses"""
+        # Upstream failing: answer from live data instead of queueing behind it
+        if not gateway.available:
+            answer = await degraded_answer(user_message)
+            await _remember(session_id, user_message, answer)
+            route_metrics.record("degraded", time.perf_counter() - started)
+            return answer
         
         # Build messages list
         messages = [SystemMessage(content=system_prompt)]
         
         # Add conversation history
-        for msg in _chat_memories[session_id][-5:]:
+        for msg in history:
             if msg["role"] == "user":
                 messages.append(HumanMessage(content=msg["content"]))
             elif msg["role"] == "assistant":
@@ -383,8 +413,22 @@ Guidelines:
         # Add current user message
         messages.append(HumanMessage(content=user_message))
         
-        # Get response from LLM
-        response = llm.invoke(messages)
+        # Get response from LLM, running any requested tools in parallel
+        tool_memo: Dict[Tuple[str, str], asyncio.Future] = {}
+        try:
+            for tool_round in range(MAX_TOOL_ROUNDS + 1):
+                tool_choice = "none" if tool_round == MAX_TOOL_ROUNDS else None
+                response = await gateway.ainvoke(messages, TOOLS, tool_choice)
+                if not getattr(response, "tool_calls", None):
+                    break
+                messages.append(response)
+                messages.extend(await _run_tool_calls(response.tool_calls, tool_memo))
+        except LLMUnavailableError as e:
+            print(f"[CHATBOT] LLM unavailable ({e}), answering from live data")
+            answer = await degraded_answer(user_message)
+            await _remember(session_id, user_message, answer)
+            route_metrics.record("degraded", time.perf_counter() - started)
+            return answer
         
         # Extract response content
         if hasattr(response, 'content'):
@@ -392,13 +436,10 @@ Guidelines:
         else:
             response_text = str(response)
         
-        # Store in memory
-        _chat_memories[session_id].append({"role": "user", "content": user_message})
-        _chat_memories[session_id].append({"role": "assistant", "content": response_text})
-        
-        # Keep memory size manageable
-        if len(_chat_memories[session_id]) > 10:
-            _chat_memories[session_id] = _chat_memories[session_id][-10:]
+        if cacheable and _is_storable(history, tool_memo):
+            response_cache.put(user_message, signature, response_text)
+        await _remember(session_id, user_message, response_text)
+        route_metrics.record("llm", time.perf_counter() - started)
         
         return response_text
     except ValueError as e:
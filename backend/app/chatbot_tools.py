@@ -2,13 +2,21 @@
 Tool functions for chatbot to get live data.
 """
 from typing import Dict, Any, List, Optional
-from app.main import _get_readings, _get_latest, _get_alerts, readings_store, alerts_store
-from app.db import get_supabase
+from app.main import _get_readings, _get_latest, _get_alerts
+from app.rolling_stats import rolling_stats
 
+# Caps on the model-chosen limits (as advertised in the tool descriptions)
+MAX_READINGS = 100
+MAX_ALERTS = 50
 
-def get_latest_reading(device_id: Optional[str] = None) -> Dict[str, Any]:
+
+def _limit(args: Dict[str, Any], cap: int) -> int:
+    return max(1, min(int(args.get("limit", 10)), cap))
+
+
+async def get_latest_reading(device_id: Optional[str] = None) -> Dict[str, Any]:
     """Get the latest water quality reading."""
-    reading = _get_latest(device_id)
+    reading = await _get_latest(device_id)
     if reading:
         return {
             "success": True,
@@ -20,9 +28,9 @@ def get_latest_reading(device_id: Optional[str] = None) -> Dict[str, Any]:
     }
 
 
-def get_recent_readings(limit: int = 10, device_id: Optional[str] = None) -> Dict[str, Any]:
+async def get_recent_readings(limit: int = 10, device_id: Optional[str] = None) -> Dict[str, Any]:
     """Get recent water quality readings."""
-    readings = _get_readings(limit, device_id)
+    readings = await _get_readings(limit, device_id)
     return {
         "success": True,
         "count": len(readings),
@@ -30,9 +38,9 @@ def get_recent_readings(limit: int = 10, device_id: Optional[str] = None) -> Dic
     }
 
 
-def get_recent_alerts(limit: int = 10) -> Dict[str, Any]:
+async def get_recent_alerts(limit: int = 10) -> Dict[str, Any]:
     """Get recent water quality alerts."""
-    alerts = _get_alerts(limit)
+    alerts = await _get_alerts(limit)
     return {
         "success": True,
         "count": len(alerts),
@@ -40,50 +48,37 @@ def get_recent_alerts(limit: int = 10) -> Dict[str, Any]:
     }
 
 
-def get_water_quality_stats() -> Dict[str, Any]:
-    """Get water quality statistics."""
-    readings = _get_readings(100, None)  # Get last 100 readings for stats
-    
-    if not readings:
+async def get_water_quality_stats(window: str = "24h", device_id: Optional[str] = None) -> Dict[str, Any]:
+    """Get water quality statistics over a rolling window (maintained at ingest)."""
+    try:
+        windows = rolling_stats.get(device_id, window)
+    except KeyError:
         return {
             "success": False,
-            "message": "No data available for statistics"
+            "message": f"Unknown window '{window}'. Available: {', '.join(rolling_stats.windows)}"
         }
     
-    ph_values = [r.get("ph") for r in readings if r.get("ph") is not None]
-    turbidity_values = [r.get("turbidity") for r in readings if r.get("turbidity") is not None]
-    tds_values = [r.get("tds") for r in readings if r.get("tds") is not None]
-    
     stats = {}
-    
-    if ph_values:
-        stats["ph"] = {
-            "average": sum(ph_values) / len(ph_values),
-            "min": min(ph_values),
-            "max": max(ph_values),
-            "count": len(ph_values)
+    for param, s in windows[window].items():
+        stats[param] = {
+            "average": s["mean"],
+            "min": s["min"],
+            "max": s["max"],
+            "std": s["std"],
+            "count": s["count"]
         }
     
-    if turbidity_values:
-        stats["turbidity"] = {
-            "average": sum(turbidity_values) / len(turbidity_values),
-            "min": min(turbidity_values),
-            "max": max(turbidity_values),
-            "count": len(turbidity_values)
-        }
-    
-    if tds_values:
-        stats["tds"] = {
-            "average": sum(tds_values) / len(tds_values),
-            "min": min(tds_values),
-            "max": max(tds_values),
-            "count": len(tds_values)
+    if not stats:
+        return {
+            "success": False,
+            "message": "No data available for statistics"
         }
     
     return {
         "success": True,
+        "window": window,
         "stats": stats,
-        "total_readings": len(readings)
+        "total_readings": max(s["count"] for s in stats.values())
     }
 
 
@@ -145,28 +140,37 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "get_water_quality_stats",
-            "description": "Get statistical summary of water quality data including averages, min, max values for pH, TDS, and turbidity.",
+            "description": "Get statistical summary of water quality data including averages, min, max and standard deviation for pH, TDS, turbidity and temperature over a rolling time window.",
             "parameters": {
                 "type": "object",
-                "properties": {}
+                "properties": {
+                    "window": {
+                        "type": "string",
+                        "description": "Rolling window: 5m, 1h or 24h (default: 24h)"
+                    },
+                    "device_id": {
+                        "type": "string",
+                        "description": "Optional device ID. Leave empty for all devices combined."
+                    }
+                }
             }
         }
     }
 ]
 
 
-def execute_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+async def execute_tool(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
     """Execute a tool function by name."""
     tool_functions = {
         "get_latest_reading": lambda args: get_latest_reading(args.get("device_id")),
-        "get_recent_readings": lambda args: get_recent_readings(args.get("limit", 10), args.get("device_id")),
-        "get_recent_alerts": lambda args: get_recent_alerts(args.get("limit", 10)),
-        "get_water_quality_stats": lambda args: get_water_quality_stats(),
+        "get_recent_readings": lambda args: get_recent_readings(_limit(args, MAX_READINGS), args.get("device_id")),
+        "get_recent_alerts": lambda args: get_recent_alerts(_limit(args, MAX_ALERTS)),
+        "get_water_quality_stats": lambda args: get_water_quality_stats(args.get("window", "24h"), args.get("device_id")),
     }
     
     if tool_name in tool_functions:
         try:
-            return tool_functions[tool_name](arguments)
+            return await tool_functions[tool_name](arguments)
         except Exception as e:
             return {
                 "success": False,
@@ -28,3 +28,12 @@ def is_supabase_configured() -> bool:
     return bool(os.environ.get("SUPABASE_URL", "").strip() and (
         os.environ.get("SUPABASE_SERVICE_ROLE_KEY", "").strip() or os.environ.get("SUPABASE_ANON_KEY", "").strip()
     ))
+
+def get_db_pool_config() -> dict:
+    """Connection pool settings for the async Supabase client."""
+    return {
+        "max_connections": int(os.environ.get("SUPABASE_POOL_MAX_CONNECTIONS", "20")),
+        "max_keepalive": int(os.environ.get("SUPABASE_POOL_MAX_KEEPALIVE", "10")),
+        "keepalive_expiry": float(os.environ.get("SUPABASE_POOL_KEEPALIVE_EXPIRY", "30")),
+        "query_timeout": float(os.environ.get("SUPABASE_QUERY_TIMEOUT", "10")),
+    }
@@ -0,0 +1,253 @@
+"""
+Cross-parameter correlation analytics.
+
+Pearson correlations between pH, turbidity, TDS and temperature are built
+from running sums: for every pair of parameters the count, the sums and
+the sums of squares of both and the sum of their products, restricted to
+readings where both are present. Sums are additive, so:
+
+- at ingest each reading adds its products to the current time bucket of
+  its device (a fixed ring of buckets per window, like the forecaster), and
+  a window's matrix is the sum of its in-window buckets
+- the fleet matrix is the sum over devices
+- any historical range is recomputed in one streaming pass over stored
+  readings, a page at a time with vectorized outer products
+"""
+
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from app.rolling_stats import parse_window, record_timestamp
+
+PARAMETERS = ("ph", "turbidity", "tds", "temperature")
+
+# Values are shifted by a typical level before summing to limit cancellation
+_SHIFT = np.array([7.0, 10.0, 250.0, 25.0])
+
+# Stats per bucket: pair counts, sums of x_i, sums of x_i^2 (both over readings where i and j are present) and sums of x_i*x_j
+_N, _SX, _SXX, _SXY = range(4)
+
+_MIN_PAIRS = 3
+
+
+def _values(readings: List[Dict[str, Any]]) -> np.ndarray:
+    return np.array(
+        [[np.nan if r.get(p) is None else r[p] for p in PARAMETERS] for r in readings],
+        dtype=float,
+    )
+
+
+def _products(values: np.ndarray) -> np.ndarray:
+    """Per-reading contributions of shape (n, 4, P, P) for a (n, P) array with NaN for missing values."""
+    present = ~np.isnan(values)
+    m = present.astype(float)
+    x = np.where(present, values - _SHIFT, 0.0)
+    out = np.empty((len(values), 4, len(PARAMETERS), len(PARAMETERS)))
+    out[:, _N] = m[:, :, None] * m[:, None, :]
+    out[:, _SX] = x[:, :, None] * m[:, None, :]
+    out[:, _SXX] = (x * x)[:, :, None] * m[:, None, :]
+    out[:, _SXY] = x[:, :, None] * x[:, None, :]
+    return out
+
+
+def correlation_matrix(sums: np.ndarray) -> np.ndarray:
+    """
+    Pearson correlations from summed stats.
+
+    Args:
+        sums: Array of shape (..., 4, P, P)
+
+    Returns:
+        Array of shape (..., P, P); NaN where a pair has too few readings or no variance
+    """
+    n = sums[..., _N, :, :]
+    sx = sums[..., _SX, :, :]
+    sxx = sums[..., _SXX, :, :]
+    sxy = sums[..., _SXY, :, :]
+    sy = np.swapaxes(sx, -1, -2)
+    syy = np.swapaxes(sxx, -1, -2)
+    cov = n * sxy - sx * sy
+    var_x = n * sxx - sx * sx
+    var_y = n * syy - sy * sy
+    denom = np.sqrt(np.maximum(var_x, 0.0) * np.maximum(var_y, 0.0))
+    # Relative guard: variance lost in rounding counts as none
+    ok = (n >= _MIN_PAIRS) & (denom > 1e-12 * np.maximum(n * n, 1.0))
+    r = np.divide(cov, denom, out=np.full_like(cov, np.nan), where=ok)
+    return np.clip(r, -1.0, 1.0)
+
+
+def format_matrix(sums: np.ndarray) -> Dict[str, Any]:
+    """JSON form of one device's (or the fleet's) summed stats."""
+    r = correlation_matrix(sums)
+    n = sums[_N]
+    return {
+        "count": int(n.diagonal().max()) if n.size else 0,
+        "matrix": {
+            a: {b: None if np.isnan(r[i, j]) else round(float(r[i, j]), 4) for j, b in enumerate(PARAMETERS)}
+            for i, a in enumerate(PARAMETERS)
+        },
+        "pair_counts": {
+            a: {b: int(n[i, j]) for j, b in enumerate(PARAMETERS)}
+            for i, a in enumerate(PARAMETERS)
+        },
+    }
+
+
+class CorrelationWindow:
+    """Ring of time buckets holding running sums of products for every device."""
+
+    def __init__(self, span_seconds: float, buckets: int = 12):
+        self.span = span_seconds
+        self.buckets = buckets
+        self.width = span_seconds / buckets
+        width = len(PARAMETERS)
+        capacity = 16
+        # Bucket number held by each ring slot (-1 = empty)
+        self._bucket_no = np.full((capacity, buckets), -1, dtype=np.int64)
+        self._sums = np.zeros((capacity, buckets, 4, width, width))
+
+    def _grow(self, capacity: int) -> None:
+        bucket_no = np.full((capacity, self.buckets), -1, dtype=np.int64)
+        bucket_no[: len(self._bucket_no)] = self._bucket_no
+        sums = np.zeros((capacity,) + self._sums.shape[1:])
+        sums[: len(self._sums)] = self._sums
+        self._bucket_no, self._sums = bucket_no, sums
+
+    def add(self, row: int, t: float, products: np.ndarray) -> None:
+        if row >= len(self._bucket_no):
+            self._grow(max(row + 1, len(self._bucket_no) * 2))
+        bucket = int(t // self.width)
+        slot = bucket % self.buckets
+        held = self._bucket_no[row, slot]
+        if held > bucket:
+            # Older than the bucket now occupying this slot: outside the window
+            return
+        if held != bucket:
+            self._bucket_no[row, slot] = bucket
+            self._sums[row, slot] = 0.0
+        self._sums[row, slot] += products
+
+    def totals(self, devices: int, now: float) -> np.ndarray:
+        """Summed stats of each device's in-window buckets, shape (devices, 4, P, P)."""
+        current = int(now // self.width)
+        bucket_no = self._bucket_no[:devices]
+        in_window = (bucket_no > current - self.buckets) & (bucket_no <= current)
+        return np.einsum("db,dbspq->dspq", in_window.astype(float), self._sums[:devices])
+
+
+class CorrelationEngine:
+    """Per-device and fleet-wide correlation matrices over sliding windows, fed from the ingest path."""
+
+    def __init__(self, windows: Dict[str, float]):
+        self.windows = {name: CorrelationWindow(span) for name, span in windows.items()}
+        self._rows: Dict[str, int] = {}
+        self._device_ids: List[str] = []
+
+    def _row(self, device_id: str) -> int:
+        row = self._rows.get(device_id)
+        if row is None:
+            row = len(self._device_ids)
+            self._rows[device_id] = row
+            self._device_ids.append(device_id)
+        return row
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """Fold a stored reading's products into its device's current buckets."""
+        row = self._row(record.get("device_id") or "unknown")
+        t = record_timestamp(record)
+        products = _products(_values([record]))[0]
+        for window in self.windows.values():
+            window.add(row, t, products)
+
+    def seed(self, readings: Iterable[Dict[str, Any]]) -> int:
+        """Warm the windows from stored history."""
+        count = 0
+        for record in sorted(readings, key=record_timestamp):
+            self.add(record)
+            count += 1
+        return count
+
+    def get(self, window: str, device_id: Optional[str] = None, now: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Correlation matrices over a sliding window.
+
+        Args:
+            window: Window name
+            device_id: Only report this device (the fleet matrix is always included)
+            now: Window end (defaults to now)
+
+        Returns:
+            {"fleet": matrix, "devices": {device_id: matrix}}
+        """
+        if window not in self.windows:
+            raise KeyError(window)
+        totals = self.windows[window].totals(len(self._device_ids), time.time() if now is None else now)
+        return _report(totals, self._device_ids, device_id)
+
+    def get_metrics(self) -> dict:
+        return {
+            "devices": len(self._device_ids),
+            "windows": {name: w.span for name, w in self.windows.items()},
+        }
+
+
+def _report(totals: np.ndarray, device_ids: List[str], device_id: Optional[str]) -> Dict[str, Any]:
+    # Only devices with readings in range are reported
+    active = [i for i in range(len(device_ids)) if totals[i, _N].any()]
+    if device_id is not None:
+        active = [i for i in active if device_ids[i] == device_id]
+    fleet = totals.sum(axis=0) if len(totals) else np.zeros((4, len(PARAMETERS), len(PARAMETERS)))
+    return {
+        "parameters": list(PARAMETERS),
+        "fleet": format_matrix(fleet),
+        "devices": {device_ids[i]: format_matrix(totals[i]) for i in active},
+    }
+
+
+async def compute_correlation(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    device_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Recompute correlation matrices over an arbitrary historical range.
+
+    Streams the stored readings once; memory is one set of sums per device.
+    """
+    from app.sensor_health import iter_reading_pages
+
+    rows: Dict[str, int] = {}
+    device_ids: List[str] = []
+    width = len(PARAMETERS)
+    totals = np.zeros((16, 4, width, width))
+    readings = 0
+    async for page in iter_reading_pages(start, end, device_id):
+        index = np.empty(len(page), dtype=np.int64)
+        for i, r in enumerate(page):
+            d = r.get("device_id") or "unknown"
+            row = rows.get(d)
+            if row is None:
+                row = rows[d] = len(device_ids)
+                device_ids.append(d)
+            index[i] = row
+        if len(device_ids) > len(totals):
+            grown = np.zeros((max(len(device_ids), len(totals) * 2), 4, width, width))
+            grown[: len(totals)] = totals
+            totals = grown
+        np.add.at(totals, index, _products(_values(page)))
+        readings += len(page)
+    report = _report(totals[: len(device_ids)], device_ids, device_id)
+    report["readings"] = readings
+    return report
+
+
+def _configured_windows() -> Dict[str, float]:
+    specs = os.environ.get("CORRELATION_WINDOWS", "1h,24h")
+    return {spec.strip(): parse_window(spec) for spec in specs.split(",") if spec.strip()}
+
+
+correlation_engine = CorrelationEngine(_configured_windows())
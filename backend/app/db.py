@@ -1,13 +1,123 @@
-from functools import lru_cache
-from typing import Optional
+import asyncio
+import time
+from typing import Any, Optional
 
-from supabase import Client, create_client
+import httpx
+from supabase import AsyncClient, AsyncClientOptions, acreate_client
 
-from app.config import get_supabase_key, get_supabase_url, is_supabase_configured
+from app.config import get_db_pool_config, get_supabase_key, get_supabase_url, is_supabase_configured
 
 
-@lru_cache
-def get_supabase() -> Optional[Client]:
+class QueryPool:
+    """Gates async Supabase queries to the HTTP pool size and records saturation metrics."""
+
+    def __init__(self, max_connections: int, query_timeout: float):
+        self.max_connections = max_connections
+        self.query_timeout = query_timeout
+        self._semaphore = asyncio.Semaphore(max_connections)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.waiting = 0
+        self.total_queries = 0
+        self.saturated_waits = 0
+        self.total_wait_seconds = 0.0
+        self.timeouts = 0
+        self.errors = 0
+
+    async def execute(self, query: Any, timeout: Optional[float] = None) -> Any:
+        """Run a postgrest builder's ``execute()`` with a pool slot and a deadline."""
+        timeout = self.query_timeout if timeout is None else timeout
+        started = time.perf_counter()
+        if self._semaphore.locked():
+            self.saturated_waits += 1
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        self.total_wait_seconds += time.perf_counter() - started
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        self.total_queries += 1
+        try:
+            return await asyncio.wait_for(query.execute(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TimeoutError(f"Supabase query exceeded {timeout}s")
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def get_metrics(self) -> dict:
+        return {
+            "max_connections": self.max_connections,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "waiting": self.waiting,
+            "utilization": self.in_flight / self.max_connections if self.max_connections else 0.0,
+            "total_queries": self.total_queries,
+            "saturated_waits": self.saturated_waits,
+            "avg_wait_ms": (self.total_wait_seconds / self.total_queries * 1000) if self.total_queries else 0.0,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+        }
+
+
+_async_client: Optional[AsyncClient] = None
+_http_client: Optional[httpx.AsyncClient] = None
+_query_pool: Optional[QueryPool] = None
+_client_lock: Optional[asyncio.Lock] = None
+
+
+async def get_async_supabase() -> Optional[AsyncClient]:
+    """Get the shared async Supabase client backed by a size-limited keep-alive pool."""
+    global _async_client, _http_client, _client_lock
     if not is_supabase_configured():
         return None
-    return create_client(get_supabase_url(), get_supabase_key())
+    if _async_client is not None:
+        return _async_client
+    if _client_lock is None:
+        _client_lock = asyncio.Lock()
+    async with _client_lock:
+        if _async_client is None:
+            cfg = get_db_pool_config()
+            _http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=cfg["max_connections"],
+                    max_keepalive_connections=cfg["max_keepalive"],
+                    keepalive_expiry=cfg["keepalive_expiry"],
+                ),
+                timeout=cfg["query_timeout"],
+            )
+            _async_client = await acreate_client(
+                get_supabase_url(),
+                get_supabase_key(),
+                options=AsyncClientOptions(httpx_client=_http_client),
+            )
+    return _async_client
+
+
+def get_query_pool() -> QueryPool:
+    """Get the global query pool used to run async Supabase queries."""
+    global _query_pool
+    if _query_pool is None:
+        cfg = get_db_pool_config()
+        _query_pool = QueryPool(cfg["max_connections"], cfg["query_timeout"])
+    return _query_pool
+
+
+async def run_query(query: Any, timeout: Optional[float] = None) -> Any:
+    """Execute an async postgrest query through the shared pool."""
+    return await get_query_pool().execute(query, timeout=timeout)
+
+
+async def close_async_supabase() -> None:
+    """Close the shared HTTP pool (called on shutdown)."""
+    global _async_client, _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+    _async_client = None
+    _http_client = None
@@ -0,0 +1,152 @@
+"""
+Duplicate reading detection by device sequence number.
+
+A device that numbers its readings (``seq``) can retry a POST whose
+response it never saw, or resend a buffer after an outage, without the
+reading being stored or alerted on twice. A sequence number only identifies
+a reading together with the device's ``boot_id`` or the reading's
+``measured_at``, since the counter starts over when the device restarts.
+
+Per device and boot, the highest sequence number seen and a bitmap of the
+``window`` numbers below it are kept (one Python int), so a check is a
+shift and a mask:
+
+- above the highest: new; the bitmap shifts up
+- inside the window: new unless its bit is set (late or reordered readings)
+- measured after the highest one: the counter started over; the window resets
+- far below the window: the counter started over; the window resets
+
+Readings are claimed while their insert is in flight, so a retry racing the
+original (e.g. an HTTP retry while a WebSocket frame is being stored) is a
+duplicate too. The window only covers what is in memory; the unique
+``reading_key`` index in schema.sql also catches retries across server
+restarts.
+"""
+
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+# (device_id, boot_id, seq, measured_at epoch seconds)
+DedupKey = Tuple[str, Optional[int], Optional[int], Optional[float]]
+
+
+def reading_key(key: DedupKey) -> Optional[str]:
+    """Stored identity of a reading (the reading_key column), or None for readings without one."""
+    device_id, boot_id, seq, measured_at = key
+    if seq is None:
+        return None
+    if boot_id is not None:
+        return f"{device_id}/b{boot_id}/{seq}"
+    if measured_at is not None:
+        return f"{device_id}/t{round(measured_at * 1000)}/{seq}"
+    return None
+
+
+class _Window:
+    __slots__ = ("highest", "bits", "measured_at")
+
+    def __init__(self, seq: int, measured_at: Optional[float]):
+        self.highest = seq
+        # Bit i set = seq (highest - i) was seen
+        self.bits = 1
+        # Measurement time of the highest seq, when the device sends one
+        self.measured_at = measured_at
+
+
+class SequenceDeduplicator:
+    """Per-device sliding windows of recently seen sequence numbers."""
+
+    def __init__(self, window: int = 1024, boots: int = 4):
+        """
+        Initialize the deduplicator.
+
+        Args:
+            window: Sequence numbers below the highest one that are remembered
+            boots: Boots remembered per device (a replayed buffer may predate a restart)
+        """
+        self.window = window
+        self.boots = boots
+        self._mask = (1 << window) - 1
+        self._devices: Dict[str, Dict[Optional[int], _Window]] = {}
+        self._pending: Set[DedupKey] = set()
+        self.accepted = 0
+        self.duplicates = 0
+        self.restarts = 0
+
+    def _restarted(self, w: _Window, seq: int, measured_at: Optional[float]) -> bool:
+        """Whether a seq at or below the highest one belongs to a new counter run."""
+        if w.highest - seq >= self.window:
+            return True
+        # Within one run, sequence numbers grow with the measurement time
+        return measured_at is not None and w.measured_at is not None and measured_at > w.measured_at
+
+    def is_duplicate(self, key: DedupKey) -> bool:
+        """Whether a reading was already stored or is being stored (readings without seq never are)."""
+        device_id, boot_id, seq, measured_at = key
+        if seq is None:
+            return False
+        if key in self._pending:
+            return True
+        w = self._devices.get(device_id, {}).get(boot_id)
+        if w is None or seq > w.highest or self._restarted(w, seq, measured_at):
+            return False
+        return bool(w.bits >> (w.highest - seq) & 1)
+
+    def filter(self, keys: Iterable[DedupKey]) -> List[bool]:
+        """
+        Duplicate flags for a batch, claiming the new readings until record() or release().
+
+        Repeats inside the batch itself are duplicates too.
+
+        Args:
+            keys: (device_id, boot_id, seq, measured_at) per reading
+        """
+        flags = []
+        for key in keys:
+            duplicate = self.is_duplicate(key)
+            if not duplicate and key[2] is not None:
+                self._pending.add(key)
+            flags.append(duplicate)
+        self.duplicates += sum(flags)
+        return flags
+
+    def release(self, keys: Iterable[DedupKey]) -> None:
+        """Give up claimed readings whose insert failed, so the device can retry them."""
+        for key in keys:
+            self._pending.discard(key)
+
+    def record(self, key: DedupKey) -> None:
+        """Mark a claimed reading as stored (call once it actually is)."""
+        device_id, boot_id, seq, measured_at = key
+        if seq is None:
+            return
+        self._pending.discard(key)
+        self.accepted += 1
+        boots = self._devices.setdefault(device_id, {})
+        w = boots.get(boot_id)
+        if w is None:
+            boots[boot_id] = _Window(seq, measured_at)
+            while len(boots) > self.boots:
+                del boots[next(iter(boots))]
+        elif seq > w.highest:
+            w.bits = (w.bits << (seq - w.highest) | 1) & self._mask
+            w.highest = seq
+            w.measured_at = measured_at
+        elif self._restarted(w, seq, measured_at):
+            self.restarts += 1
+            boots[boot_id] = _Window(seq, measured_at)
+        else:
+            w.bits |= 1 << (w.highest - seq)
+
+    def get_metrics(self) -> dict:
+        return {
+            "window": self.window,
+            "devices": len(self._devices),
+            "pending": len(self._pending),
+            "accepted": self.accepted,
+            "duplicates": self.duplicates,
+            "restarts": self.restarts,
+        }
+
+
+reading_dedup = SequenceDeduplicator(window=int(os.environ.get("INGEST_DEDUP_WINDOW", "1024")))
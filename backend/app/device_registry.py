@@ -0,0 +1,283 @@
+"""
+Device registry with offline detection.
+
+Every stored reading is a heartbeat: the registry records the device's
+last-seen time, learns its reporting interval and (re)schedules an offline
+deadline a few intervals ahead. Deadlines live in a hashed timer wheel, so a
+heartbeat costs O(1) (move the device between two slot sets) and a tick only
+looks at the slot that is due, never at the whole fleet. Devices whose
+deadline passes are marked offline; their next reading brings them back
+online.
+"""
+
+import asyncio
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from app.rolling_stats import record_timestamp
+
+
+class TimerWheel:
+    """Hashed timer wheel keyed by device ID (one pending deadline per key)."""
+
+    def __init__(self, tick_seconds: float = 1.0, slots: int = 512):
+        self.tick = tick_seconds
+        self.slots: List[Set[str]] = [set() for _ in range(slots)]
+        # key -> deadline tick
+        self._deadline: Dict[str, int] = {}
+        self._current: Optional[int] = None
+
+    def _tick_of(self, t: float) -> int:
+        return math.ceil(t / self.tick)
+
+    def schedule(self, key: str, deadline: float) -> None:
+        """Set (or move) a key's deadline."""
+        self.cancel(key)
+        tick = self._tick_of(deadline)
+        if self._current is not None:
+            tick = max(tick, self._current + 1)
+        self._deadline[key] = tick
+        self.slots[tick % len(self.slots)].add(key)
+
+    def cancel(self, key: str) -> None:
+        tick = self._deadline.pop(key, None)
+        if tick is not None:
+            self.slots[tick % len(self.slots)].discard(key)
+
+    def advance(self, now: float) -> List[str]:
+        """
+        Move the wheel up to ``now``.
+
+        Returns:
+            Keys whose deadline has passed (they are removed from the wheel)
+        """
+        target = math.floor(now / self.tick)
+        if self._current is None:
+            # First advance: start from the earliest deadline so ones already past are found
+            self._current = min(min(self._deadline.values(), default=target), target) - 1
+        expired: List[str] = []
+        # After a long pause one lap of the wheel visits every slot
+        for tick in range(self._current + 1, min(target, self._current + len(self.slots)) + 1):
+            slot = self.slots[tick % len(self.slots)]
+            # Keys more than one lap ahead share the slot; only take those that are due
+            due = [key for key in slot if self._deadline[key] <= target]
+            for key in due:
+                slot.discard(key)
+                del self._deadline[key]
+            expired.extend(due)
+        self._current = max(self._current, target)
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._deadline)
+
+
+class _Device:
+    __slots__ = ("last_seen", "interval", "online", "offline_since", "heartbeats")
+
+    def __init__(self, last_seen: float, interval: float):
+        self.last_seen = last_seen
+        self.interval = interval
+        self.online = True
+        self.offline_since: Optional[float] = None
+        self.heartbeats = 0
+
+
+class DeviceRegistry:
+    """Last-seen time, learned reporting interval and online state of every device."""
+
+    def __init__(
+        self,
+        default_interval: float = 5.0,
+        offline_factor: float = 6.0,
+        min_offline_seconds: float = 30.0,
+        alpha: float = 0.2,
+    ):
+        """
+        Initialize the registry.
+
+        Args:
+            default_interval: Assumed reporting interval until one is learned
+            offline_factor: Missed intervals before a device counts as offline
+            min_offline_seconds: Lower bound on the offline timeout
+            alpha: Smoothing factor of the learned interval
+        """
+        self.default_interval = default_interval
+        self.offline_factor = offline_factor
+        self.min_offline = min_offline_seconds
+        self.alpha = alpha
+        self.wheel = TimerWheel()
+        self._devices: Dict[str, _Device] = {}
+        self.offline_events = 0
+        self.online_events = 0
+
+    def timeout(self, device: _Device) -> float:
+        return max(self.min_offline, self.offline_factor * device.interval)
+
+    def heartbeat(self, device_id: str, t: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Record a reading from a device (O(1)).
+
+        Returns:
+            A device_online event if the device was offline, else None
+        """
+        t = time.time() if t is None else t
+        device = self._devices.get(device_id)
+        event = None
+        if device is None:
+            device = self._devices[device_id] = _Device(t, self.default_interval)
+        elif t < device.last_seen:
+            # Late reading: it does not move the deadline
+            device.heartbeats += 1
+            return None
+        else:
+            gap = t - device.last_seen
+            if not device.online:
+                event = self._event("device_online", device_id, device, t)
+                device.online = True
+                device.offline_since = None
+                self.online_events += 1
+            elif gap > 0:
+                # Only learn from gaps while online; an outage is not the reporting interval
+                device.interval += self.alpha * (min(gap, self.timeout(device)) - device.interval)
+            device.last_seen = t
+        device.heartbeats += 1
+        self.wheel.schedule(device_id, t + self.timeout(device))
+        return event
+
+    def tick(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Mark devices whose deadline has passed as offline.
+
+        Returns:
+            device_offline events
+        """
+        now = time.time() if now is None else now
+        events = []
+        for device_id in self.wheel.advance(now):
+            device = self._devices[device_id]
+            device.online = False
+            device.offline_since = device.last_seen + self.timeout(device)
+            events.append(self._event("device_offline", device_id, device, now))
+            self.offline_events += 1
+        return events
+
+    def seed(self, readings: Iterable[Dict[str, Any]], now: Optional[float] = None) -> int:
+        """Learn devices from stored history; devices already silent start offline without events."""
+        count = 0
+        for record in sorted(readings, key=record_timestamp):
+            self.heartbeat(record.get("device_id") or "unknown", record_timestamp(record))
+            count += 1
+        now = time.time() if now is None else now
+        for device_id in self.wheel.advance(now):
+            device = self._devices[device_id]
+            device.online = False
+            device.offline_since = device.last_seen + self.timeout(device)
+        return count
+
+    def _event(self, kind: str, device_id: str, device: _Device, t: float) -> Dict[str, Any]:
+        silent = t - device.last_seen
+        if kind == "device_offline":
+            message = (
+                f"📴 Device {device_id} offline: no reading for {int(silent)} seconds "
+                f"(expected every {device.interval:.0f} seconds)"
+            )
+        else:
+            message = f"✅ Device {device_id} back online after {int(silent)} seconds without readings"
+        return {
+            "type": kind,
+            "device_id": device_id,
+            "timestamp": datetime.fromtimestamp(t, timezone.utc).isoformat(),
+            "last_seen": datetime.fromtimestamp(device.last_seen, timezone.utc).isoformat(),
+            "silent_seconds": silent,
+            "message": message,
+        }
+
+    def get(self, device_id: str) -> Optional[Dict[str, Any]]:
+        device = self._devices.get(device_id)
+        return None if device is None else self._describe(device_id, device)
+
+    def list_devices(self, online: Optional[bool] = None) -> List[Dict[str, Any]]:
+        return [
+            self._describe(device_id, device)
+            for device_id, device in self._devices.items()
+            if online is None or device.online == online
+        ]
+
+    def _describe(self, device_id: str, device: _Device) -> Dict[str, Any]:
+        return {
+            "device_id": device_id,
+            "online": device.online,
+            "last_seen": datetime.fromtimestamp(device.last_seen, timezone.utc).isoformat(),
+            "expected_interval_seconds": round(device.interval, 2),
+            "offline_timeout_seconds": round(self.timeout(device), 2),
+            "offline_since": (
+                datetime.fromtimestamp(device.offline_since, timezone.utc).isoformat()
+                if device.offline_since is not None else None
+            ),
+            "heartbeats": device.heartbeats,
+        }
+
+    def get_metrics(self) -> dict:
+        online = sum(1 for d in self._devices.values() if d.online)
+        return {
+            "devices": len(self._devices),
+            "online": online,
+            "offline": len(self._devices) - online,
+            "pending_timers": len(self.wheel),
+            "offline_events": self.offline_events,
+            "online_events": self.online_events,
+        }
+
+
+class DeviceMonitorJob:
+    """Background task that advances the timer wheel and reports devices going offline."""
+
+    def __init__(self, registry: DeviceRegistry, interval: float = 1.0):
+        self.registry = registry
+        self.interval = interval
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+
+    async def run_once(self) -> List[Dict[str, Any]]:
+        from app.main import report_device_event
+
+        events = self.registry.tick()
+        for event in events:
+            await report_device_event(event)
+        return events
+
+    async def run_loop(self) -> None:
+        while self.running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[DEVICES] Error checking for offline devices: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        self.task = asyncio.create_task(self.run_loop())
+
+    async def stop(self) -> None:
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+device_registry = DeviceRegistry(
+    default_interval=float(os.environ.get("DEVICE_DEFAULT_INTERVAL", "5")),
+    offline_factor=float(os.environ.get("DEVICE_OFFLINE_FACTOR", "6")),
+    min_offline_seconds=float(os.environ.get("DEVICE_OFFLINE_MIN_SECONDS", "30")),
+)
+device_monitor = DeviceMonitorJob(device_registry)
@@ -114,7 +114,8 @@ class DummyDataGenerator:
         """
         # Lazy imports to avoid circular dependency
         from datetime import timezone
-        from app.main import ReadingIn, _insert_reading, _insert_alert, check_thresholds, send_sms_alert
+        from app.alert_digest import alert_digest
+        from app.main import ReadingIn, _insert_reading, _insert_alert, _report_anomalies, check_thresholds
         from app.websocket_manager import ws_manager
 
         now = datetime.now(timezone.utc).isoformat()
@@ -128,7 +129,8 @@ class DummyDataGenerator:
         }
 
         # Store reading
-        _insert_reading(record)
+        await _insert_reading(record)
+        await _report_anomalies(record)
 
         # Only check time-based alerts (3-minute persistent breach)
         # NO immediate alerts - only after 3 minutes of continuous breach
@@ -149,8 +151,8 @@ class DummyDataGenerator:
                 "message": alert_msg,
                 "readings": record,
             }
-            _insert_alert(alert_record)
-            send_sms_alert(alert_msg)
+            await _insert_alert(alert_record, threshold=True)
+            await alert_digest.submit(reading["device_id"], alert_msg)
             await ws_manager.broadcast({"type": "alert", "data": alert_record})
             print(f"[DUMMY] [ALERT] {alert_msg}")
 
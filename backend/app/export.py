@@ -6,37 +6,37 @@ import csv
 import io
 from datetime import datetime, timedelta
 from typing import Optional, List, Dict, Any
-from app.db import get_supabase
+from app.db import get_async_supabase, run_query
 from app.main import readings_store, alerts_store
 
 
-def _get_readings_by_date_range(
+async def _get_readings_by_date_range(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     device_id: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """Get readings filtered by date range."""
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     if supabase:
-        q = supabase.table("water_readings").select("*").order("created_at", desc=False)
+        q = supabase.table("water_readings").select("*").order("observed_at", desc=False)
         
         if device_id:
             q = q.eq("device_id", device_id)
         
         if start_date:
-            q = q.gte("created_at", start_date.isoformat())
+            q = q.gte("observed_at", start_date.isoformat())
         
         if end_date:
             # Add one day to include the entire end date
             end_date_inclusive = end_date + timedelta(days=1)
-            q = q.lt("created_at", end_date_inclusive.isoformat())
+            q = q.lt("observed_at", end_date_inclusive.isoformat())
         
-        r = q.execute()
+        r = await run_query(q)
         rows = r.data or []
         return [
             {
-                "timestamp": x.get("created_at"),
+                "timestamp": x.get("observed_at") or x.get("created_at"),
                 "ph": x["ph"],
                 "turbidity": x["turbidity"],
                 "tds": x["tds"],
@@ -71,13 +71,13 @@ def _get_readings_by_date_range(
         return out
 
 
-def _get_alerts_by_date_range(
+async def _get_alerts_by_date_range(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     device_id: Optional[str] = None,
 ) -> List[Dict[str, Any]]:
     """Get alerts filtered by date range."""
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     
     if supabase:
         q = supabase.table("water_alerts").select("*").order("created_at", desc=False)
@@ -92,7 +92,7 @@ def _get_alerts_by_date_range(
             end_date_inclusive = end_date + timedelta(days=1)
             q = q.lt("created_at", end_date_inclusive.isoformat())
         
-        r = q.execute()
+        r = await run_query(q)
         rows = r.data or []
         return [
             {
@@ -131,13 +131,13 @@ def _get_alerts_by_date_range(
         return out
 
 
-def export_readings_to_csv(
+async def export_readings_to_csv(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     device_id: Optional[str] = None,
 ) -> str:
     """Export readings to CSV format."""
-    readings = _get_readings_by_date_range(start_date, end_date, device_id)
+    readings = await _get_readings_by_date_range(start_date, end_date, device_id)
     
     output = io.StringIO()
     writer = csv.DictWriter(
@@ -160,13 +160,13 @@ def export_readings_to_csv(
     return output.getvalue()
 
 
-def export_alerts_to_csv(
+async def export_alerts_to_csv(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     device_id: Optional[str] = None,
 ) -> str:
     """Export alerts to CSV format."""
-    alerts = _get_alerts_by_date_range(start_date, end_date, device_id)
+    alerts = await _get_alerts_by_date_range(start_date, end_date, device_id)
     
     output = io.StringIO()
     writer = csv.DictWriter(
@@ -189,14 +189,14 @@ def export_alerts_to_csv(
     return output.getvalue()
 
 
-def export_combined_to_csv(
+async def export_combined_to_csv(
     start_date: Optional[datetime] = None,
     end_date: Optional[datetime] = None,
     device_id: Optional[str] = None,
 ) -> str:
     """Export both readings and alerts to a combined CSV."""
-    readings = _get_readings_by_date_range(start_date, end_date, device_id)
-    alerts = _get_alerts_by_date_range(start_date, end_date, device_id)
+    readings = await _get_readings_by_date_range(start_date, end_date, device_id)
+    alerts = await _get_alerts_by_date_range(start_date, end_date, device_id)
     
     output = io.StringIO()
     writer = csv.writer(output)
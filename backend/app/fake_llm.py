@@ -0,0 +1,138 @@
+"""
+Deterministic fake chat model for offline chatbot testing and benchmarking.
+
+Enable with ``CHATBOT_LLM_BACKEND=fake``. Responses are derived from the last
+user message and streamed word by word with a configurable per-token delay,
+so streaming latency can be measured without Azure OpenAI credentials.
+When tools are bound, questions about trends or history first produce
+parallel tool calls, which exercises the tool-calling loop offline.
+"""
+
+import asyncio
+import json
+import re
+import time
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class FakeWaterChatModel(BaseChatModel):
+    """Chat model that streams a canned, input-dependent answer."""
+
+    token_latency: float = 0.02
+    """Delay in seconds before each streamed token."""
+
+    first_token_latency: float = 0.0
+    """Extra delay in seconds before the first token (simulated prompt processing)."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-water"
+
+    def bind_tools(self, tools: Sequence[Any], *, tool_choice: Optional[str] = None, **kwargs: Any):
+        names = [t["function"]["name"] if isinstance(t, dict) else getattr(t, "name", str(t)) for t in tools]
+        return self.bind(tool_names=names, tool_choice=tool_choice, **kwargs)
+
+    def _tool_calls(self, messages: List[BaseMessage], **kwargs: Any) -> List[Dict[str, Any]]:
+        names = kwargs.get("tool_names") or []
+        if not names or kwargs.get("tool_choice") == "none" or isinstance(messages[-1], ToolMessage):
+            return []
+        question = next((m.content for m in reversed(messages) if isinstance(m, HumanMessage)), "")
+        if not re.search(r"trend|history|compare|over time", question.lower()):
+            return []
+        wanted = [("get_water_quality_stats", {}), ("get_recent_readings", {"limit": 10})]
+        return [
+            {"name": name, "args": args, "id": f"call_{i}", "type": "tool_call"}
+            for i, (name, args) in enumerate(wanted)
+            if name in names
+        ]
+
+    def _response_text(self, messages: List[BaseMessage]) -> str:
+        question = next(
+            (m.content for m in reversed(messages) if isinstance(m, HumanMessage)),
+            "",
+        )
+        tool_results = sum(1 for m in messages if isinstance(m, ToolMessage))
+        used = f" (using {tool_results} tool results)" if tool_results else ""
+        return (
+            f"You asked: \"{question}\". Based on the current readings{used}, "
+            "keep monitoring pH, TDS and turbidity.\n\n"
+            "1. Keep filters maintained.\n"
+            "2. Store water in clean, covered containers."
+        )
+
+    def _tokens(self, messages: List[BaseMessage]) -> List[str]:
+        # Leading whitespace stays attached to the following word, like real BPE tokens
+        return re.findall(r"\s*\S+", self._response_text(messages))
+
+    @staticmethod
+    def _chunks(tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [
+            {"name": c["name"], "args": json.dumps(c["args"]), "id": c["id"], "index": i}
+            for i, c in enumerate(tool_calls)
+        ]
+
+    def _generate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tool_calls = self._tool_calls(messages, **kwargs)
+        if tool_calls:
+            time.sleep(self.first_token_latency)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=tool_calls))])
+        tokens = self._tokens(messages)
+        time.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        tool_calls = self._tool_calls(messages, **kwargs)
+        if tool_calls:
+            await asyncio.sleep(self.first_token_latency)
+            return ChatResult(generations=[ChatGeneration(message=AIMessage(content="", tool_calls=tool_calls))])
+        tokens = self._tokens(messages)
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(tokens))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content="".join(tokens)))])
+
+    def _stream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        tool_calls = self._tool_calls(messages, **kwargs)
+        if tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=self._chunks(tool_calls)))
+            return
+        for token in self._tokens(messages):
+            time.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Any = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        tool_calls = self._tool_calls(messages, **kwargs)
+        if tool_calls:
+            yield ChatGenerationChunk(message=AIMessageChunk(content="", tool_call_chunks=self._chunks(tool_calls)))
+            return
+        for token in self._tokens(messages):
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
@@ -0,0 +1,200 @@
+"""
+Fleet summary table.
+
+One precomputed row per device, updated at ingest: latest reading, which
+parameters are out of range, persistent-breach alerts raised during the
+current breach, when the device was last seen and its rolling averages.
+"Last seen" is receive time, as in the device registry, so a replayed
+backfill does not make a device look stale or silent. A fleet overview of
+thousands of devices is then a filter and sort over in-memory rows instead
+of a query per device.
+"""
+
+import os
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+
+from app.rolling_stats import PARAMETERS, RollingStatsEngine, record_timestamp, rolling_stats
+from app.thresholds import thresholds
+
+SORT_KEYS = ("device_id", "last_seen", "open_alerts", "breaches", "ph", "turbidity", "tds", "temperature")
+
+
+class FleetTable:
+    """Latest state of every device, maintained from the ingest path."""
+
+    def __init__(self, stats: RollingStatsEngine, average_window: str, stale_seconds: float = 300.0):
+        """
+        Initialize the fleet table.
+
+        Args:
+            stats: Rolling statistics engine the averages are read from
+            average_window: Rolling stats window reported as each device's averages
+            stale_seconds: Seconds without a reading after which a device counts as stale
+        """
+        self.stats = stats
+        self.average_window = average_window if average_window in stats.windows else next(iter(stats.windows))
+        self.stale_seconds = stale_seconds
+        self._rows: Dict[str, Dict[str, Any]] = {}
+        # Epoch seconds of each device's latest reading (event time)
+        self._t: Dict[str, float] = {}
+        # Epoch seconds each device was last heard from (receive time)
+        self._seen: Dict[str, float] = {}
+
+    def on_reading(self, record: Dict[str, Any], received: Optional[float] = None) -> None:
+        """
+        Update a device's row from a stored reading (after the rolling stats saw it).
+
+        Args:
+            record: The stored reading
+            received: When it arrived (defaults to now)
+        """
+        device_id = record.get("device_id") or "unknown"
+        t = record_timestamp(record)
+        received = time.time() if received is None else received
+        row = self._rows.get(device_id)
+        if row is None:
+            row = self._rows[device_id] = {
+                "device_id": device_id,
+                "readings": 0,
+                "open_alerts": 0,
+                "last_alert": None,
+            }
+            self._t[device_id] = -1.0
+            self._seen[device_id] = received
+        row["readings"] += 1
+        if received >= self._seen[device_id]:
+            self._seen[device_id] = received
+            row["last_seen"] = datetime.fromtimestamp(received, timezone.utc).isoformat()
+        if t < self._t[device_id]:
+            # Late reading: counted, but the latest state stays
+            return
+        breaches = [breach.parameter for breach in thresholds.for_device(device_id).evaluate(record)]
+        if not breaches:
+            # Back in range: alerts from the breach are resolved
+            row["open_alerts"] = 0
+        self._t[device_id] = t
+        row["latest_timestamp"] = record.get("timestamp")
+        row["latest"] = {param: record.get(param) for param in PARAMETERS}
+        row["breaches"] = breaches
+        row["averages"] = {param: round(mean, 4) for param, mean in self.stats.means(device_id, self.average_window).items()}
+
+    def on_alert(self, alert_record: Dict[str, Any]) -> None:
+        """Count a persistent-breach alert against its device (anomalies and device events are not open alerts)."""
+        row = self._rows.get(alert_record.get("device_id") or "unknown")
+        if row is None:
+            return
+        row["open_alerts"] += 1
+        row["last_alert"] = {"timestamp": alert_record.get("timestamp"), "message": alert_record.get("message")}
+
+    def reevaluate(self) -> None:
+        """Recompute breach status from each device's latest reading (after threshold profiles change)."""
+        for device_id, row in self._rows.items():
+            if "latest" in row:
+                row["breaches"] = [breach.parameter for breach in thresholds.for_device(device_id).evaluate(row["latest"])]
+
+    def seed(self, readings: Iterable[Dict[str, Any]]) -> int:
+        """Build rows from stored history (the rolling stats must already be seeded)."""
+        count = 0
+        for record in sorted(readings, key=record_timestamp):
+            self.on_reading(record, record_timestamp(record))
+            count += 1
+        return count
+
+    def summary(
+        self,
+        in_breach: Optional[bool] = None,
+        has_alerts: Optional[bool] = None,
+        stale: Optional[bool] = None,
+        parameter: Optional[str] = None,
+        search: Optional[str] = None,
+        sort: str = "device_id",
+        descending: bool = False,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Dict[str, Any]:
+        """
+        Filtered, sorted fleet overview.
+
+        Args:
+            in_breach: Only devices with (True) or without (False) an out-of-range parameter
+            has_alerts: Only devices with (True) or without (False) open alerts
+            stale: Only devices silent for longer (True) or shorter (False) than stale_seconds
+            parameter: Only devices with this parameter out of range
+            search: Only devices whose ID contains this text
+            sort: One of SORT_KEYS
+            descending: Reverse the sort order
+            limit: Max devices returned (None = all)
+            offset: Devices skipped before the first returned
+
+        Returns:
+            Fleet counts, the number of matching devices and the requested page of rows
+        """
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key '{sort}'. Available: {', '.join(SORT_KEYS)}")
+        now = time.time()
+        seen = self._seen
+        rows = list(self._rows.values())
+        stale_before = now - self.stale_seconds
+        counts = {
+            "devices": len(rows),
+            "in_breach": sum(1 for r in rows if r["breaches"]),
+            "with_open_alerts": sum(1 for r in rows if r["open_alerts"]),
+            "stale": sum(1 for t in seen.values() if t < stale_before),
+        }
+
+        search = search.lower() if search else None
+        matched = [
+            r for r in rows
+            if (in_breach is None or bool(r["breaches"]) == in_breach)
+            and (has_alerts is None or bool(r["open_alerts"]) == has_alerts)
+            and (stale is None or (seen[r["device_id"]] < stale_before) == stale)
+            and (parameter is None or parameter in r["breaches"])
+            and (search is None or search in r["device_id"].lower())
+        ]
+
+        if sort == "device_id":
+            key = lambda r: r["device_id"]
+        elif sort == "last_seen":
+            key = lambda r: seen[r["device_id"]]
+        elif sort == "breaches":
+            key = lambda r: (len(r["breaches"]), r["open_alerts"])
+        elif sort == "open_alerts":
+            key = lambda r: r["open_alerts"]
+        else:
+            # Devices without the value sort last either way
+            present = [r for r in matched if r["latest"].get(sort) is not None]
+            missing = [r for r in matched if r["latest"].get(sort) is None]
+            present.sort(key=lambda r: r["latest"][sort], reverse=descending)
+            matched = present + missing
+            key = None
+        if key is not None:
+            matched.sort(key=key, reverse=descending)
+
+        page = matched[offset:] if limit is None else matched[offset:offset + limit]
+        return {
+            "generated_at": datetime.fromtimestamp(now, timezone.utc).isoformat(),
+            "average_window": self.average_window,
+            "counts": counts,
+            "matched": len(matched),
+            "devices": [
+                {
+                    **r,
+                    "in_breach": bool(r["breaches"]),
+                    "last_seen_age_seconds": round(max(0.0, now - seen[r["device_id"]]), 1),
+                    "stale": seen[r["device_id"]] < stale_before,
+                }
+                for r in page
+            ],
+        }
+
+    def get_metrics(self) -> dict:
+        return {"devices": len(self._rows)}
+
+
+fleet_table = FleetTable(
+    rolling_stats,
+    average_window=os.environ.get("FLEET_AVERAGE_WINDOW", "1h"),
+    stale_seconds=float(os.environ.get("FLEET_STALE_SECONDS", "300")),
+)
@@ -0,0 +1,324 @@
+"""
+Short-horizon trend forecasts and time-to-threshold per device.
+
+Readings are folded at ingest into fixed-width time buckets per device
+(a ring of bucket sums and counts per parameter, so memory per device is
+bounded whatever the reporting rate). A background job fits a robust
+linear trend (weighted least squares with Huber reweighting) to every
+device and parameter over the sliding window in one vectorized NumPy pass,
+extrapolates it, and estimates how long until each safety limit is crossed.
+Newly predicted breaches are broadcast before the persistent-breach alerts
+would fire.
+"""
+
+import asyncio
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.rolling_stats import parse_window, record_timestamp
+from app.thresholds import thresholds
+
+PARAMETERS = ("ph", "turbidity", "tds")
+
+
+class TrendForecaster:
+    """Bucketed sliding-window trend model for the whole fleet."""
+
+    def __init__(
+        self,
+        window_seconds: float = 3600.0,
+        buckets: int = 60,
+        horizon_seconds: float = 1800.0,
+        min_buckets: int = 5,
+    ):
+        """
+        Initialize the forecaster.
+
+        Args:
+            window_seconds: History used for each fit
+            buckets: Time buckets per window (readings in a bucket are averaged)
+            horizon_seconds: How far ahead a crossing counts as a predicted breach
+            min_buckets: Buckets with data required before a series is forecast
+        """
+        self.window = window_seconds
+        self.buckets = buckets
+        self.width = window_seconds / buckets
+        self.horizon = horizon_seconds
+        self.min_buckets = min_buckets
+
+        self._rows: Dict[str, int] = {}
+        self._device_ids: List[str] = []
+        capacity = 16
+        # Bucket number held by each ring slot (-1 = empty)
+        self._bucket_no = np.full((capacity, buckets), -1, dtype=np.int64)
+        self._sum = np.zeros((capacity, buckets, len(PARAMETERS)))
+        self._n = np.zeros((capacity, buckets, len(PARAMETERS)))
+
+        self._forecasts: List[Dict[str, Any]] = []
+        self.generated_at: Optional[float] = None
+        self.last_fit_ms = 0.0
+        self.fits = 0
+        # In-flight fit_async() run, shared by concurrent callers
+        self._fitting: Optional[asyncio.Future] = None
+
+    def _row(self, device_id: str) -> int:
+        row = self._rows.get(device_id)
+        if row is None:
+            row = len(self._device_ids)
+            if row == len(self._bucket_no):
+                self._grow()
+            self._rows[device_id] = row
+            self._device_ids.append(device_id)
+        return row
+
+    def _grow(self) -> None:
+        capacity = len(self._bucket_no) * 2
+        bucket_no = np.full((capacity, self.buckets), -1, dtype=np.int64)
+        bucket_no[: len(self._bucket_no)] = self._bucket_no
+        sums = np.zeros((capacity, self.buckets, len(PARAMETERS)))
+        sums[: len(self._sum)] = self._sum
+        counts = np.zeros((capacity, self.buckets, len(PARAMETERS)))
+        counts[: len(self._n)] = self._n
+        self._bucket_no, self._sum, self._n = bucket_no, sums, counts
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """Fold a stored reading into its device's current bucket (O(1))."""
+        row = self._row(record.get("device_id") or "unknown")
+        bucket = int(record_timestamp(record) // self.width)
+        slot = bucket % self.buckets
+        held = self._bucket_no[row, slot]
+        if held > bucket:
+            # Older than the bucket now occupying this slot: outside the window
+            return
+        if held != bucket:
+            self._bucket_no[row, slot] = bucket
+            self._sum[row, slot] = 0.0
+            self._n[row, slot] = 0.0
+        for j, param in enumerate(PARAMETERS):
+            value = record.get(param)
+            if value is not None:
+                self._sum[row, slot, j] += value
+                self._n[row, slot, j] += 1
+
+    def seed(self, readings: Iterable[Dict[str, Any]]) -> int:
+        """Warm the buckets from stored history."""
+        count = 0
+        for record in sorted(readings, key=record_timestamp):
+            self.add(record)
+            count += 1
+        return count
+
+    def _snapshot(self) -> Tuple[List[str], np.ndarray, np.ndarray, np.ndarray]:
+        """Copy of the buckets, so a fit off the event loop does not race add()."""
+        devices = len(self._device_ids)
+        return (
+            list(self._device_ids),
+            self._bucket_no[:devices].copy(),
+            self._sum[:devices].copy(),
+            self._n[:devices].copy(),
+        )
+
+    def fit(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Fit every device and parameter and estimate time to threshold.
+
+        Returns:
+            One forecast per device and parameter with enough data
+        """
+        return self._fit(self._snapshot(), now)
+
+    async def fit_async(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        fit() with the NumPy work on a worker thread, so the event loop keeps serving.
+
+        Concurrent callers share one fit.
+        """
+        if self._fitting is None:
+            self._fitting = asyncio.ensure_future(asyncio.to_thread(self._fit, self._snapshot(), now))
+            self._fitting.add_done_callback(self._fit_done)
+        return await asyncio.shield(self._fitting)
+
+    def _fit_done(self, future: asyncio.Future) -> None:
+        self._fitting = None
+
+    def _fit(self, snapshot: Tuple[List[str], np.ndarray, np.ndarray, np.ndarray], now: Optional[float]) -> List[Dict[str, Any]]:
+        started = time.perf_counter()
+        now = time.time() if now is None else now
+        device_ids, bucket_no, sums, n_readings = snapshot
+        if not device_ids:
+            self._forecasts, self.generated_at = [], now
+            return []
+
+        current = int(now // self.width)
+        in_window = (bucket_no > current - self.buckets) & (bucket_no <= current)
+        counts = n_readings * in_window[:, :, None]
+        valid = counts > 0
+        # (devices, params, buckets) layout: reductions run over the last axis
+        w = np.ascontiguousarray(counts.transpose(0, 2, 1))
+        ok = np.ascontiguousarray(valid.transpose(0, 2, 1))
+        y = np.ascontiguousarray((sums / np.maximum(n_readings, 1)).transpose(0, 2, 1))
+        # Bucket midpoints in seconds relative to now (<= 0)
+        x = np.broadcast_to(((bucket_no + 0.5) * self.width - now)[:, None, :], y.shape)
+
+        level, slope, resid_std, n = self._robust_fit(x, y, w, ok)
+        enough = n >= self.min_buckets
+
+        forecasts = []
+        for j, param in enumerate(PARAMETERS):
+            rows = np.flatnonzero(enough[:, j])
+            for row, a, b, std, buckets in zip(
+                rows.tolist(), level[rows, j].tolist(), slope[rows, j].tolist(),
+                resid_std[rows, j].tolist(), n[rows, j].tolist(),
+            ):
+                low, high = thresholds.for_device(device_ids[row]).limits[param]
+                eta, threshold = self._time_to_threshold(a, b, low, high)
+                forecasts.append({
+                    "device_id": device_ids[row],
+                    "parameter": param,
+                    "current": a,
+                    "slope_per_hour": b * 3600,
+                    "forecast": a + b * self.horizon,
+                    "residual_std": std,
+                    "threshold": threshold,
+                    "time_to_threshold_seconds": eta,
+                    "predicted_breach": eta is not None and 0 < eta <= self.horizon,
+                    "buckets": buckets,
+                })
+
+        self._forecasts = forecasts
+        self.generated_at = now
+        self.fits += 1
+        self.last_fit_ms = (time.perf_counter() - started) * 1000
+        return forecasts
+
+    @staticmethod
+    def _robust_fit(x: np.ndarray, y: np.ndarray, w: np.ndarray, ok: np.ndarray, iterations: int = 2):
+        """Vectorized weighted least squares with Huber reweighting over the last axis."""
+        x = np.where(ok, x, 0.0)
+        y = np.where(ok, y, 0.0)
+        base = np.where(ok, w, 0.0)
+        n = ok.sum(axis=2)
+        weights = base
+        for i in range(iterations + 1):
+            sw = np.maximum(weights.sum(axis=2), 1e-12)
+            mx = np.einsum("dpb,dpb->dp", weights, x) / sw
+            my = np.einsum("dpb,dpb->dp", weights, y) / sw
+            dx = x - mx[..., None]
+            wdx = weights * dx
+            sxx = np.einsum("dpb,dpb->dp", wdx, dx)
+            sxy = np.einsum("dpb,dpb->dp", wdx, y)
+            slope = np.divide(sxy, sxx, out=np.zeros_like(sxy), where=sxx > 1e-12)
+            intercept = my - slope * mx
+            resid = np.where(ok, y - intercept[..., None] - slope[..., None] * x, 0.0)
+            if i == iterations:
+                break
+            # Huber weights from a MAD scale: sort with empty buckets pushed to the end
+            abs_resid = np.sort(np.where(ok, np.abs(resid), np.inf), axis=2)
+            lo = np.take_along_axis(abs_resid, np.maximum((n - 1) // 2, 0)[..., None], axis=2)[..., 0]
+            hi = np.take_along_axis(abs_resid, np.minimum(n // 2, abs_resid.shape[2] - 1)[..., None], axis=2)[..., 0]
+            mad = np.where(n > 0, (lo + hi) / 2, 0.0)
+            cutoff = 1.345 * np.maximum(1.4826 * mad, 1e-9)[..., None]
+            weights = base * np.minimum(1.0, cutoff / np.maximum(np.abs(resid), 1e-12))
+        resid_std = np.sqrt(np.einsum("dpb,dpb->dp", resid, resid) / np.maximum(n - 2, 1))
+        # Intercept is the fitted level at x = 0, i.e. now
+        return intercept, slope, resid_std, n
+
+    @staticmethod
+    def _time_to_threshold(level: float, slope: float, low: Optional[float], high: Optional[float]) -> Tuple[Optional[float], Optional[float]]:
+        """Seconds until the trend crosses a limit (0 if already outside, None if moving away)."""
+        if high is not None and level > high:
+            return 0.0, high
+        if low is not None and level < low:
+            return 0.0, low
+        if slope > 0 and high is not None:
+            return (high - level) / slope, high
+        if slope < 0 and low is not None:
+            return (low - level) / slope, low
+        return None, high if high is not None else low
+
+    def get(
+        self,
+        device_id: Optional[str] = None,
+        parameter: Optional[str] = None,
+        breaches_only: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Forecasts from the last fit, optionally filtered."""
+        return [
+            f for f in self._forecasts
+            if (device_id is None or f["device_id"] == device_id)
+            and (parameter is None or f["parameter"] == parameter)
+            and (not breaches_only or f["predicted_breach"])
+        ]
+
+    def get_metrics(self) -> dict:
+        return {
+            "devices": len(self._device_ids),
+            "fits": self.fits,
+            "last_fit_ms": self.last_fit_ms,
+            "series_forecast": len(self._forecasts),
+            "predicted_breaches": sum(1 for f in self._forecasts if f["predicted_breach"]),
+        }
+
+
+class ForecastJob:
+    """Background task that refits the forecaster and broadcasts new predicted breaches."""
+
+    def __init__(self, forecaster: TrendForecaster, interval: float = 60.0):
+        self.forecaster = forecaster
+        self.interval = interval
+        self.running = False
+        self.task: Optional[asyncio.Task] = None
+        # (device, parameter) pairs currently predicted to breach
+        self._predicted: set = set()
+
+    async def run_once(self) -> List[Dict[str, Any]]:
+        """Refit and broadcast breaches that were not predicted on the previous run."""
+        from app.websocket_manager import ws_manager
+
+        forecasts = await self.forecaster.fit_async()
+        predicted = {(f["device_id"], f["parameter"]): f for f in forecasts if f["predicted_breach"]}
+        new = [f for key, f in predicted.items() if key not in self._predicted]
+        self._predicted = set(predicted)
+        for forecast in new:
+            eta_min = forecast["time_to_threshold_seconds"] / 60
+            print(
+                f"[FORECAST] {forecast['device_id']}: {forecast['parameter']} predicted to cross "
+                f"{forecast['threshold']} in ~{eta_min:.0f} min (now {forecast['current']:.2f})"
+            )
+            await ws_manager.broadcast({"type": "forecast", "data": forecast})
+        return new
+
+    async def run_loop(self) -> None:
+        while self.running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[FORECAST] Error refreshing forecasts: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        self.task = asyncio.create_task(self.run_loop())
+        print(f"[FORECAST] Job started: window={self.forecaster.window:.0f}s, interval={self.interval:.0f}s")
+
+    async def stop(self) -> None:
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+
+forecaster = TrendForecaster(
+    window_seconds=parse_window(os.environ.get("FORECAST_WINDOW", "1h")),
+    horizon_seconds=parse_window(os.environ.get("FORECAST_HORIZON", "30m")),
+)
+forecast_job = ForecastJob(forecaster, interval=float(os.environ.get("FORECAST_INTERVAL_SECONDS", "60")))
@@ -9,7 +9,7 @@ import random
 from datetime import datetime, timedelta, timezone
 from typing import List
 
-from app.db import get_supabase
+from app.db import close_async_supabase, get_async_supabase, run_query
 
 
 def generate_sample_readings(
@@ -134,7 +134,7 @@ def generate_sample_alerts(
     return alerts
 
 
-def initialize_sample_data(
+async def initialize_sample_data(
     readings_count: int = 50,
     alerts_count: int = 3,
     device_id: str = "esp32_dummy",
@@ -159,18 +159,17 @@ def initialize_sample_data(
     # Import the module and access stores/functions from it
     import app.main as main_module
 
-    supabase = get_supabase()
+    supabase = await get_async_supabase()
     use_supabase = supabase is not None
 
     try:
         # Check if data already exists
         if not force:
             if use_supabase:
-                existing_readings = (
+                existing_readings = await run_query(
                     supabase.table("water_readings")
                     .select("id", count="exact")
                     .limit(1)
-                    .execute()
                 )
                 if existing_readings.count and existing_readings.count > 0:
                     print("[INIT] Database already has data. Use force=True to overwrite.")
@@ -204,7 +203,7 @@ def initialize_sample_data(
                 batch_size = 50
                 for i in range(0, len(readings), batch_size):
                     batch = readings[i : i + batch_size]
-                    result = supabase.table("water_readings").insert(batch).execute()
+                    result = await run_query(supabase.table("water_readings").insert(batch))
                     readings_inserted += len(result.data) if result.data else 0
             else:
                 # Insert into in-memory store
@@ -218,7 +217,7 @@ def initialize_sample_data(
                         "tds": reading["tds"],
                         "temperature": reading.get("temperature"),
                     }
-                    main_module._insert_reading(reading_record)
+                    main_module._store_reading_in_memory(reading_record)
                     readings_inserted += 1
             print(f"[INIT] Inserted {readings_inserted} readings ({'Supabase' if use_supabase else 'in-memory'})")
 
@@ -226,7 +225,7 @@ def initialize_sample_data(
         alerts_inserted = 0
         if alerts:
             if use_supabase:
-                result = supabase.table("water_alerts").insert(alerts).execute()
+                result = await run_query(supabase.table("water_alerts").insert(alerts))
                 alerts_inserted = len(result.data) if result.data else 0
             else:
                 # Insert into in-memory store
@@ -242,7 +241,7 @@ def initialize_sample_data(
                             "tds": alert.get("tds"),
                         },
                     }
-                    main_module._insert_alert(alert_record)
+                    main_module._store_alert_in_memory(alert_record)
                     alerts_inserted += 1
             print(f"[INIT] Inserted {alerts_inserted} alerts ({'Supabase' if use_supabase else 'in-memory'})")
 
@@ -263,12 +262,21 @@ def initialize_sample_data(
         }
 
 
+async def run_standalone(**kwargs) -> dict:
+    """Initialize sample data outside the server, closing the HTTP pool afterwards."""
+    try:
+        return await initialize_sample_data(**kwargs)
+    finally:
+        await close_async_supabase()
+
+
 if __name__ == "__main__":
     # Run as standalone script
+    import asyncio
     import sys
 
     force = "--force" in sys.argv
-    result = initialize_sample_data(force=force)
+    result = asyncio.run(run_standalone(force=force))
     if result["success"]:
         print(
             f"✅ Successfully initialized: {result['readings_inserted']} readings, "
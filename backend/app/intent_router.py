@@ -0,0 +1,203 @@
+"""
+Deterministic fast path for the chatbot.
+
+Factual questions ("what is my current pH", "any alerts?", "average TDS")
+are classified with simple rules and answered from templates using the
+chatbot tools, without an LLM round-trip. Anything else falls through.
+"""
+
+import re
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import chatbot_tools
+from app.thresholds import CompiledProfile, thresholds
+
+# Parameter -> (display name, unit, keyword pattern)
+PARAMETERS: Dict[str, Tuple[str, str, str]] = {
+    "ph": ("pH", "", r"\bph\b|\bacid|\balkalin"),
+    "tds": ("TDS", " ppm", r"\btds\b|dissolved solids"),
+    "turbidity": ("Turbidity", " NTU", r"turbid|cloudiness"),
+    "temperature": ("Temperature", "°C", r"\btemp(erature)?\b"),
+}
+
+# Advice, causes and follow-ups need the LLM
+# ("how many alerts" and "mean TDS" are data questions, so bare "how" and "mean" are not advice)
+_ADVICE = re.compile(
+    r"\b(how (do|does|can|could|should|would|to)|why|should|fix|reduce|lower|raise|increase|improve|"
+    r"treat|safe|drink|recommend|cause|(does|do) .*\bmean|meaning|explain|help|do i|can i)\b"
+)
+_ALERTS = re.compile(r"\b(alerts?|warnings?|breach(es)?)\b")
+_STATS = re.compile(r"\b(average|avg|mean|min(imum)?|max(imum)?|highest|lowest|stats|statistics|summary|range)\b")
+# Trends and comparisons need history, which the LLM gathers through tools
+_TREND = re.compile(r"\b(trends?|history|historical|compare|comparison|change[sd]?|over time|week|month|yesterday)\b")
+_CURRENT = re.compile(r"\b(current|currently|now|latest|what is|what s|whats|reading|readings|level|value|show)\b")
+
+
+def _normalize(message: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", message.lower()).split())
+
+
+def _mentioned_parameters(text: str) -> List[str]:
+    return [name for name, (_, _, pattern) in PARAMETERS.items() if re.search(pattern, text)]
+
+
+def classify(message: str) -> Optional[Tuple[str, List[str]]]:
+    """
+    Classify a chat message into a fast-path intent.
+
+    Returns:
+        (intent, parameters) for "current_reading", "recent_alerts" or "stats",
+        or None if the question needs the LLM
+    """
+    text = _normalize(message)
+    if not text or len(text.split()) > 12 or _ADVICE.search(text) or _TREND.search(text):
+        return None
+    params = _mentioned_parameters(text)
+    if _ALERTS.search(text):
+        return ("recent_alerts", [])
+    if _STATS.search(text):
+        return ("stats", params)
+    if _CURRENT.search(text) and (params or "reading" in text):
+        return ("current_reading", params)
+    return None
+
+
+def _stats_window(text: str) -> str:
+    if re.search(r"\bminutes?\b|\bmins?\b|\bjust now\b", text):
+        return "5m"
+    if re.search(r"\bhour\b|\blast hour\b", text):
+        return "1h"
+    return "24h"
+
+
+def _status(param: str, value: float, profile: CompiledProfile) -> str:
+    if param == "ph":
+        ok = profile.state(param, value) == "ok"
+        return "✅ within safe range" if ok else f"⚠️ outside safe range {profile.describe(param)}"
+    if param in ("tds", "turbidity"):
+        ok = profile.state(param, value) == "ok"
+        return "✅ within safe limit" if ok else f"⚠️ above safe limit of {profile.describe(param).lstrip('<')}"
+    return ""
+
+
+def _fmt(param: str, value: float) -> str:
+    digits = 2 if param == "ph" else 0 if param == "tds" else 1
+    return f"{value:.{digits}f}{PARAMETERS[param][1]}"
+
+
+async def _answer_current(params: List[str]) -> Optional[str]:
+    result = await chatbot_tools.get_latest_reading()
+    if not result.get("success"):
+        return "No readings are available yet."
+    reading = result["data"]
+    profile = thresholds.for_device(reading.get("device_id"))
+    lines = []
+    for param in params or ["ph", "tds", "turbidity", "temperature"]:
+        value = reading.get(param)
+        if value is None:
+            continue
+        status = _status(param, value, profile)
+        lines.append(f"- {PARAMETERS[param][0]}: {_fmt(param, value)}" + (f" ({status})" if status else ""))
+    if not lines:
+        return None
+    header = f"Latest reading from {reading.get('device_id', 'your device')}"
+    if reading.get("timestamp"):
+        header += f" at {reading['timestamp']}"
+    return header + ":\n" + "\n".join(lines)
+
+
+async def _answer_alerts() -> str:
+    result = await chatbot_tools.get_recent_alerts(5)
+    alerts = result.get("data") or []
+    if not alerts:
+        return "There are no recent alerts. Water quality has stayed within safe parameters."
+    lines = [f"There {'is' if len(alerts) == 1 else 'are'} {len(alerts)} recent alert{'' if len(alerts) == 1 else 's'}:"]
+    for alert in alerts:
+        line = f"- {alert.get('message', '')}"
+        if alert.get("timestamp"):
+            line += f" ({alert['timestamp']})"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+async def _answer_stats(params: List[str], window: str) -> Optional[str]:
+    result = await chatbot_tools.get_water_quality_stats(window)
+    if not result.get("success"):
+        return "There is not enough data for statistics yet."
+    stats = result["stats"]
+    lines = [f"Over the last {window} ({result['total_readings']} readings):"]
+    for param in params or ["ph", "tds", "turbidity"]:
+        s = stats.get(param)
+        if not s:
+            continue
+        lines.append(
+            f"- {PARAMETERS[param][0]}: average {_fmt(param, s['average'])}, "
+            f"min {_fmt(param, s['min'])}, max {_fmt(param, s['max'])}"
+        )
+    return "\n".join(lines) if len(lines) > 1 else None
+
+
+async def try_fast_path(message: str) -> Optional[Tuple[str, str]]:
+    """
+    Answer a message without the LLM if it matches a known intent.
+
+    Returns:
+        (intent, answer) or None to fall back to the LLM
+    """
+    intent = classify(message)
+    if intent is None:
+        return None
+    name, params = intent
+    if name == "current_reading":
+        answer = await _answer_current(params)
+    elif name == "recent_alerts":
+        answer = await _answer_alerts()
+    else:
+        answer = await _answer_stats(params, _stats_window(_normalize(message)))
+    return (name, answer) if answer else None
+
+
+DEGRADED_NOTICE = "The assistant is temporarily unavailable, so detailed advice can't be given right now."
+
+
+async def degraded_answer(message: str) -> str:
+    """
+    Answer without the LLM when the upstream is unavailable.
+
+    Uses the matching fast-path intent if there is one, otherwise the latest reading.
+    """
+    fast = await try_fast_path(message)
+    if fast is not None:
+        return fast[1]
+    current = await _answer_current([])
+    return f"{DEGRADED_NOTICE} Here is the latest data instead:\n\n{current}" if current else DEGRADED_NOTICE
+
+
+class RouteMetrics:
+    """Request counts and latency per chatbot route (fast path intents, cache, llm)."""
+
+    def __init__(self):
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.total_seconds: Dict[str, float] = defaultdict(float)
+        self.max_seconds: Dict[str, float] = defaultdict(float)
+
+    def record(self, route: str, seconds: float) -> None:
+        self.counts[route] += 1
+        self.total_seconds[route] += seconds
+        self.max_seconds[route] = max(self.max_seconds[route], seconds)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        total = sum(self.counts.values())
+        return {
+            route: {
+                "count": count,
+                "share": count / total,
+                "avg_ms": self.total_seconds[route] / count * 1000,
+                "max_ms": self.max_seconds[route] * 1000,
+            }
+            for route, count in self.counts.items()
+        }
+
+
+route_metrics = RouteMetrics()
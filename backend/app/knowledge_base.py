@@ -0,0 +1,205 @@
+"""
+Water quality knowledge base for the chatbot, split into retrievable sections.
+
+Instead of sending every recommendation with every question, the chatbot
+asks the retriever for the few sections relevant to the question (BM25 over
+section text and keywords) plus the sections for parameters that are
+currently out of range. Limits in the text are placeholders rendered from
+the device's threshold profile, so the advice matches what raises alerts.
+"""
+
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.thresholds import CompiledProfile, thresholds
+
+
+class KnowledgeSection(NamedTuple):
+    key: str
+    title: str
+    text: str
+    keywords: str = ""
+
+
+SECTIONS: Tuple[KnowledgeSection, ...] = (
+    KnowledgeSection(
+        "ph_low",
+        "pH Level Issues (Acidic)",
+        "If pH < {ph_min} (Acidic): Add alkaline substances like baking soda or lime. Install pH correction filters. "
+        "Check for industrial contamination sources.",
+        "ph acid acidic low sour corrosive metallic",
+    ),
+    KnowledgeSection(
+        "ph_high",
+        "pH Level Issues (Alkaline)",
+        "If pH > {ph_max} (Alkaline): Add acidic substances like citric acid or vinegar. Install reverse osmosis system. "
+        "Check for soap or detergent contamination.",
+        "ph alkaline alkalinity high basic bitter soapy slippery",
+    ),
+    KnowledgeSection(
+        "tds_high",
+        "High TDS (Total Dissolved Solids)",
+        "- Install reverse osmosis (RO) system\n"
+        "- Use activated carbon filters\n"
+        "- Consider distillation for very high TDS\n"
+        "- Check for salt intrusion or mineral contamination\n"
+        "- Regular filter maintenance is essential",
+        "tds dissolved solids salt salty minerals hardness hard ppm",
+    ),
+    KnowledgeSection(
+        "turbidity_high",
+        "High Turbidity",
+        "- Install sediment filters\n"
+        "- Use coagulation and flocculation treatment\n"
+        "- Consider sand filtration systems\n"
+        "- Check for source contamination\n"
+        "- Regular cleaning of storage tanks",
+        "turbidity turbid cloudy muddy murky dirty sediment particles ntu",
+    ),
+    KnowledgeSection(
+        "general",
+        "General Water Quality Improvement",
+        "- Regular testing and monitoring\n"
+        "- Proper storage in clean containers\n"
+        "- Boiling water for consumption\n"
+        "- Use of water purifiers\n"
+        "- Regular maintenance of water treatment systems\n"
+        "- Avoid storing water in direct sunlight\n"
+        "- Replace filters as per manufacturer recommendations",
+        "improve maintain storage store tank purifier filter quality tips general",
+    ),
+    KnowledgeSection(
+        "emergency",
+        "Emergency Actions",
+        "- If water quality is severely compromised, stop consumption immediately\n"
+        "- Use bottled water as temporary solution\n"
+        "- Contact local water authority\n"
+        "- Boil water before use if contamination is suspected\n"
+        "- Install emergency filtration systems",
+        "emergency unsafe sick illness drink drinking safe contaminated contamination danger urgent",
+    ),
+)
+
+# Out-of-range state (as in the chat water signature) -> section key
+STATE_SECTIONS: Dict[str, str] = {
+    "ph:low": "ph_low",
+    "ph:high": "ph_high",
+    "tds:high": "tds_high",
+    "turbidity:high": "turbidity_high",
+}
+
+
+def _limits(profile: CompiledProfile) -> Dict[str, str]:
+    """Placeholder values of a threshold profile's limits."""
+    def fmt(value: Optional[float], unset: str) -> str:
+        return f"{value:g}" if value is not None else unset
+
+    return {
+        "ph_min": fmt(profile.low("ph"), "the safe minimum"),
+        "ph_max": fmt(profile.high("ph"), "the safe maximum"),
+    }
+
+
+def format_sections(sections: Iterable[KnowledgeSection], profile: Optional[CompiledProfile] = None) -> str:
+    """
+    Render sections as a numbered knowledge block.
+
+    Args:
+        sections: Sections to render
+        profile: Threshold profile whose limits fill the text (None = default profile)
+    """
+    limits = _limits(profile or thresholds.default())
+    parts = []
+    for i, section in enumerate(sections, 1):
+        body = "\n".join(f"   {line}" for line in section.text.format(**limits).splitlines())
+        parts.append(f"{i}. {section.title}:\n{body}")
+    return "Water Quality Recommendations:\n\n" + "\n\n".join(parts) if parts else ""
+
+
+def full_knowledge(profile: Optional[CompiledProfile] = None) -> str:
+    """Full knowledge block, used when no question is available to retrieve with."""
+    return format_sections(SECTIONS, profile)
+
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from how i in is it its my of on or our should the "
+    "this to use what when which why with you your".split()
+)
+
+
+def _tokenize(text: str) -> List[str]:
+    tokens = [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in _STOPWORDS]
+    # Crude plural folding so "filters" matches "filter"
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t for t in tokens]
+
+
+class KnowledgeRetriever:
+    """Okapi BM25 over a fixed set of knowledge sections."""
+
+    def __init__(self, sections: Iterable[KnowledgeSection], k1: float = 1.2, b: float = 0.75):
+        self.sections = list(sections)
+        self.by_key = {s.key: s for s in self.sections}
+        self.k1 = k1
+        self.b = b
+        self._tf: List[Counter] = []
+        doc_freq: Counter = Counter()
+        for section in self.sections:
+            # Keywords are listed twice so they outweigh incidental body words
+            tokens = _tokenize(f"{section.title} {section.text} {section.keywords} {section.keywords}")
+            tf = Counter(tokens)
+            self._tf.append(tf)
+            doc_freq.update(tf.keys())
+        self._lengths = [sum(tf.values()) for tf in self._tf]
+        self._avg_length = sum(self._lengths) / len(self._lengths) if self._lengths else 0.0
+        n = len(self.sections)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+
+    def score(self, query: str) -> List[Tuple[float, KnowledgeSection]]:
+        """BM25 score of every section for a query, best first (zero scores omitted)."""
+        terms = [t for t in set(_tokenize(query)) if t in self._idf]
+        scored = []
+        for section, tf, length in zip(self.sections, self._tf, self._lengths):
+            s = 0.0
+            for term in terms:
+                f = tf.get(term, 0)
+                if f:
+                    norm = self.k1 * (1 - self.b + self.b * length / self._avg_length)
+                    s += self._idf[term] * f * (self.k1 + 1) / (f + norm)
+            if s > 0:
+                scored.append((s, section))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+    def retrieve(
+        self,
+        query: str,
+        k: int = 2,
+        required: Iterable[str] = (),
+        fallback: Optional[str] = "general",
+    ) -> List[KnowledgeSection]:
+        """
+        Select knowledge sections for a question.
+
+        Args:
+            query: User question
+            k: Maximum number of sections chosen by relevance
+            required: Section keys always included (e.g. out-of-range parameters)
+            fallback: Section used when nothing else is selected
+
+        Returns:
+            Sections in knowledge-base order
+        """
+        keys = {key for key in required if key in self.by_key}
+        keys.update(section.key for _, section in self.score(query)[:k])
+        if not keys and fallback in self.by_key:
+            keys.add(fallback)
+        return [s for s in self.sections if s.key in keys]
+
+
+retriever = KnowledgeRetriever(SECTIONS)
+
+# Sections chosen by relevance per question
+TOP_K = int(os.environ.get("CHATBOT_KB_TOP_K", "2"))
@@ -0,0 +1,370 @@
+"""
+Shared gateway for upstream LLM calls.
+
+Every chatbot request goes through one process-wide gateway that:
+- builds the chat model once and reuses it (and its HTTP connection pool)
+- caps concurrent upstream calls, queueing the rest first-come first-served
+- enforces a deadline per call (whole response, including streaming)
+- trips a circuit breaker after repeated failures so callers can answer
+  from the deterministic fast path instead of waiting on a failing upstream
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence
+
+from langchain_core.messages import BaseMessage
+from langchain_openai import AzureChatOpenAI
+
+
+class LLMUnavailableError(Exception):
+    """The gateway refused or abandoned a call; the caller should degrade gracefully."""
+
+
+class CircuitOpenError(LLMUnavailableError):
+    """The circuit breaker is open after repeated upstream failures."""
+
+
+class GatewayOverloadedError(LLMUnavailableError):
+    """The wait queue is full or the call waited too long for a slot."""
+
+
+class LLMTimeoutError(LLMUnavailableError):
+    """The upstream call exceeded its deadline."""
+
+
+def build_llm():
+    """Create the configured chat model (Azure OpenAI, or the fake model for offline runs)."""
+    if os.environ.get("CHATBOT_LLM_BACKEND", "azure").lower() == "fake":
+        from app.fake_llm import FakeWaterChatModel
+        return FakeWaterChatModel(
+            token_latency=float(os.environ.get("CHATBOT_FAKE_TOKEN_LATENCY", "0.02")),
+            first_token_latency=float(os.environ.get("CHATBOT_FAKE_FIRST_TOKEN_LATENCY", "0.0")),
+        )
+
+    azure_openai_endpoint = os.environ.get("AZURE_OPENAI_ENDPOINT")
+    azure_openai_api_key = os.environ.get("AZURE_OPENAI_API_KEY")
+    azure_openai_deployment = os.environ.get("AZURE_OPENAI_DEPLOYMENT", "gpt-4o")
+    api_version = os.environ.get("OPENAI_API_VERSION", "2024-12-01-preview")
+
+    if not azure_openai_endpoint or not azure_openai_api_key:
+        raise ValueError("Azure OpenAI credentials not configured. Please set AZURE_OPENAI_ENDPOINT and AZURE_OPENAI_API_KEY in .env file.")
+
+    # One client (and connection pool) serves both ainvoke and astream
+    return AzureChatOpenAI(
+        azure_endpoint=azure_openai_endpoint,
+        azure_deployment=azure_openai_deployment,
+        openai_api_version=api_version,
+        openai_api_key=azure_openai_api_key,
+        temperature=0.7,
+        max_retries=1,
+    )
+
+
+class FairLimiter:
+    """Concurrency limit with a bounded FIFO wait queue (slots are handed to waiters in arrival order)."""
+
+    def __init__(self, limit: int, max_queue: int):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: deque = deque()
+        self.peak_active = 0
+        self.peak_queued = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, timeout: float) -> float:
+        """
+        Wait for a slot.
+
+        Returns:
+            Seconds spent waiting
+
+        Raises:
+            GatewayOverloadedError: The queue is full or no slot freed up within ``timeout``
+        """
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self.peak_active = max(self.peak_active, self.active)
+            return 0.0
+        if len(self._waiters) >= self.max_queue:
+            raise GatewayOverloadedError("LLM wait queue is full")
+
+        started = time.perf_counter()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.peak_queued = max(self.peak_queued, len(self._waiters))
+        try:
+            await asyncio.wait_for(waiter, timeout)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                raise GatewayOverloadedError(f"No LLM slot free after {timeout:g}s") from None
+            raise
+        # The releasing call transferred its slot to us, so active is unchanged
+        return time.perf_counter() - started
+
+    def release(self) -> None:
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+
+class CircuitBreaker:
+    """Closed -> open after N consecutive failures; half-open probe after a cooldown."""
+
+    def __init__(self, failure_threshold: int = 5, cooldown_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown_seconds
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self._probe_in_flight = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        if self.state != "closed":
+            print("[LLM GATEWAY] Circuit closed, upstream recovered")
+        self.state = "closed"
+        self.consecutive_failures = 0
+        self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        self._probe_in_flight = False
+        if self.state == "half_open" or self.consecutive_failures >= self.failure_threshold:
+            if self.state != "open":
+                self.trips += 1
+                print(f"[LLM GATEWAY] Circuit opened after {self.consecutive_failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def record_abandoned(self) -> None:
+        """The call ended without an upstream verdict (e.g. client disconnect)."""
+        self._probe_in_flight = False
+
+
+class LLMGateway:
+    """Process-wide entry point for chat model calls."""
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_queue: int = 64,
+        queue_timeout: float = 10.0,
+        call_timeout: float = 60.0,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30.0,
+    ):
+        """
+        Initialize the gateway.
+
+        Args:
+            max_concurrency: Upstream calls allowed in flight at once
+            max_queue: Calls allowed to wait for a slot before new ones are rejected
+            queue_timeout: Seconds a call may wait for a slot
+            call_timeout: Deadline in seconds for one upstream call (full response)
+            failure_threshold: Consecutive failures that open the circuit breaker
+            cooldown_seconds: Seconds the breaker stays open before a probe call
+        """
+        self.limiter = FairLimiter(max_concurrency, max_queue)
+        self.breaker = CircuitBreaker(failure_threshold, cooldown_seconds)
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self._llm = None
+        self._bound: Dict[Any, Any] = {}
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected_open = 0
+        self.rejected_overload = 0
+        self.total_wait = 0.0
+
+    def get_llm(self):
+        """Return the shared chat model, creating it on first use."""
+        if self._llm is None:
+            self._llm = build_llm()
+        return self._llm
+
+    def _model(self, tools: Optional[Sequence[Dict[str, Any]]], tool_choice: Optional[str]):
+        llm = self.get_llm()
+        if not tools:
+            return llm
+        key = (id(tools), tool_choice)
+        if key not in self._bound:
+            self._bound[key] = llm.bind_tools(tools, tool_choice=tool_choice)
+        return self._bound[key]
+
+    @property
+    def available(self) -> bool:
+        """False while the breaker is open (a half-open probe counts as available)."""
+        return self.breaker.state != "open" or time.monotonic() - self.breaker.opened_at >= self.breaker.cooldown
+
+    async def _enter(self) -> None:
+        self.calls += 1
+        if not self.breaker.allow():
+            self.rejected_open += 1
+            raise CircuitOpenError("LLM upstream circuit is open")
+        try:
+            self.total_wait += await self.limiter.acquire(self.queue_timeout)
+        except GatewayOverloadedError:
+            self.rejected_overload += 1
+            self.breaker.record_abandoned()
+            raise
+        except BaseException:
+            self.breaker.record_abandoned()
+            raise
+
+    def _fail(self, exc: BaseException) -> None:
+        if isinstance(exc, asyncio.CancelledError):
+            self.breaker.record_abandoned()
+            return
+        self.failures += 1
+        self.breaker.record_failure()
+
+    async def ainvoke(
+        self,
+        messages: List[BaseMessage],
+        tools: Optional[Sequence[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+    ):
+        """
+        Run one non-streaming completion.
+
+        Raises:
+            LLMUnavailableError: Breaker open, queue full, or deadline exceeded
+        """
+        model = self._model(tools, tool_choice)
+        await self._enter()
+        try:
+            response = await asyncio.wait_for(model.ainvoke(messages), self.call_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._fail(TimeoutError())
+            raise LLMTimeoutError(f"LLM call exceeded {self.call_timeout:g}s") from None
+        except BaseException as e:
+            self._fail(e)
+            raise
+        finally:
+            self.limiter.release()
+        self.successes += 1
+        self.breaker.record_success()
+        return response
+
+    async def astream(
+        self,
+        messages: List[BaseMessage],
+        tools: Optional[Sequence[Dict[str, Any]]] = None,
+        tool_choice: Optional[str] = None,
+    ) -> AsyncIterator[Any]:
+        """
+        Stream one completion chunk by chunk.
+
+        The slot is held until the stream finishes and the deadline covers the
+        whole stream, not just the first chunk.
+
+        Raises:
+            LLMUnavailableError: Breaker open, queue full, or deadline exceeded
+        """
+        model = self._model(tools, tool_choice)
+        await self._enter()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.call_timeout
+        stream = model.astream(messages).__aiter__()
+        try:
+            while True:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    raise asyncio.TimeoutError()
+                try:
+                    chunk = await asyncio.wait_for(stream.__anext__(), remaining)
+                except StopAsyncIteration:
+                    break
+                yield chunk
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            self._fail(TimeoutError())
+            raise LLMTimeoutError(f"LLM stream exceeded {self.call_timeout:g}s") from None
+        except GeneratorExit:
+            # Consumer stopped early (e.g. client disconnected)
+            self.breaker.record_abandoned()
+            raise
+        except BaseException as e:
+            self._fail(e)
+            raise
+        else:
+            self.successes += 1
+            self.breaker.record_success()
+        finally:
+            self.limiter.release()
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except Exception:
+                    pass
+
+    def get_metrics(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "timeouts": self.timeouts,
+            "rejected_circuit_open": self.rejected_open,
+            "rejected_overload": self.rejected_overload,
+            "in_flight": self.limiter.active,
+            "queued": self.limiter.queued,
+            "peak_in_flight": self.limiter.peak_active,
+            "peak_queued": self.limiter.peak_queued,
+            "max_concurrency": self.limiter.limit,
+            "avg_wait_ms": self.total_wait / self.calls * 1000 if self.calls else 0.0,
+            "circuit": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.consecutive_failures,
+                "trips": self.breaker.trips,
+            },
+        }
+
+
+_gateway: Optional[LLMGateway] = None
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Get the global LLM gateway."""
+    global _gateway
+    if _gateway is None:
+        _gateway = LLMGateway(
+            max_concurrency=int(os.environ.get("CHATBOT_LLM_MAX_CONCURRENCY", "8")),
+            max_queue=int(os.environ.get("CHATBOT_LLM_MAX_QUEUE", "64")),
+            queue_timeout=float(os.environ.get("CHATBOT_LLM_QUEUE_TIMEOUT", "10")),
+            call_timeout=float(os.environ.get("CHATBOT_LLM_TIMEOUT", "60")),
+            failure_threshold=int(os.environ.get("CHATBOT_BREAKER_THRESHOLD", "5")),
+            cooldown_seconds=float(os.environ.get("CHATBOT_BREAKER_COOLDOWN", "30")),
+        )
+    return _gateway
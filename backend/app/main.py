@@ -1,20 +1,39 @@
+import asyncio
+import bisect
+import json
+import time
 from datetime import datetime, timezone
 from typing import Any, Optional, List, Dict
 from pathlib import Path
 
 from dotenv import load_dotenv
-from fastapi import FastAPI, HTTPException, WebSocket
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field, ValidationError, field_validator, model_validator
 
 # Load .env file from backend directory
 env_path = Path(__file__).parent.parent / ".env"
 load_dotenv(env_path)
 
+from app import binary_ingest
+from app.alert_digest import alert_digest
+from app.anomaly import ANOMALY_DETECTION_ENABLED, anomaly_detector
+from app.chat_context import chat_context
 from app.config import get_twilio_config, is_supabase_configured
-from app.db import get_supabase
+from app.correlation import compute_correlation, correlation_engine
+from app.dedup import reading_dedup, reading_key
+from app.db import close_async_supabase, get_async_supabase, get_query_pool, run_query
+from app.device_registry import device_monitor, device_registry
 from app.dummy_generator import get_dummy_generator, initialize_dummy_generator
+from app.fleet import SORT_KEYS as FLEET_SORT_KEYS, fleet_table
+from app.forecast import PARAMETERS as FORECAST_PARAMETERS, forecast_job, forecaster
+from app.rolling_stats import record_timestamp, rolling_stats
+from app.sensor_health import sensor_health_job, sensor_health_store
+from app.singleflight import SingleFlight
+from app.thresholds import thresholds
 from app.websocket_manager import ws_manager
+from app.ws_ingest import IngestFrameError, ingest_channel
 
 app = FastAPI(title="Household Water Quality API", version="0.2.0")
 
@@ -29,9 +48,47 @@ app.add_middleware(
 readings_store: list[dict] = []
 alerts_store: list[dict] = []
 
-PH_MIN, PH_MAX = 6.0, 9.0
-TURBIDITY_MAX_NTU = 100.0
-TDS_MAX_PPM = 500.0
+# Bumped on every write so coalesced reads never span a new reading/alert
+_data_version: dict[str, int] = {"water_readings": 0, "water_alerts": 0}
+_read_flight = SingleFlight()
+
+
+class ThresholdProfileIn(BaseModel):
+    # Unset limits inherit the default profile's
+    ph_min: Optional[float] = Field(None, ge=0, le=14)
+    ph_max: Optional[float] = Field(None, ge=0, le=14)
+    turbidity_max: Optional[float] = Field(None, ge=0)
+    tds_max: Optional[float] = Field(None, ge=0)
+    device_ids: List[str] = []
+    device_prefix: Optional[str] = None
+
+
+class BacktestRuleIn(BaseModel):
+    # Unset fields use the live alert monitor's settings
+    name: Optional[str] = None
+    alert_duration_seconds: Optional[float] = Field(None, ge=0)
+    hysteresis: Optional[Dict[str, float]] = None
+    clear_seconds: Optional[float] = Field(None, ge=0)
+    flap_window_seconds: Optional[float] = Field(None, ge=0)
+    flap_threshold: Optional[int] = Field(None, ge=0)
+    ph_min: Optional[float] = Field(None, ge=0, le=14)
+    ph_max: Optional[float] = Field(None, ge=0, le=14)
+    turbidity_max: Optional[float] = Field(None, ge=0)
+    tds_max: Optional[float] = Field(None, ge=0)
+
+
+class BacktestRequest(BaseModel):
+    start: Optional[str] = None  # ISO format date string
+    end: Optional[str] = None  # ISO format date string
+    device_id: Optional[str] = None
+    csv: Optional[str] = None  # Exported readings CSV replayed instead of stored readings
+    rules: List[BacktestRuleIn] = []
+    engine: str = "vectorized"
+    max_events: int = Field(100, ge=0, le=10000)
+
+
+# Device clocks may run this far ahead of the server
+MAX_CLOCK_SKEW_SECONDS = 300
 
 
 class ReadingIn(BaseModel):
@@ -40,6 +97,29 @@ class ReadingIn(BaseModel):
     tds: float = Field(..., ge=0)
     device_id: str = "device1"
     temperature: Optional[float] = None
+    # Optional device-side sequence number (retries with the same seq are stored once)
+    seq: Optional[int] = Field(None, ge=0)
+    # Number the device picks at every boot, so a restarted seq counter is not taken for retries
+    boot_id: Optional[int] = Field(None, ge=0)
+    # Optional device-side measurement time (ISO or epoch seconds; server time if omitted)
+    measured_at: Optional[datetime] = None
+
+    @field_validator("measured_at")
+    @classmethod
+    def _measured_at_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        if value is None:
+            return None
+        value = value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+        if value.timestamp() > time.time() + MAX_CLOCK_SKEW_SECONDS:
+            raise ValueError("measured_at is in the future")
+        return value
+
+    @model_validator(mode="after")
+    def _seq_identifies_reading(self) -> "ReadingIn":
+        # A bare seq cannot tell a retry from a device that restarted its counter
+        if self.seq is not None and self.boot_id is None and self.measured_at is None:
+            raise ValueError("seq needs boot_id or measured_at")
+        return self
 
 
 def send_sms_alert(message: str) -> bool:
@@ -75,57 +155,185 @@ def send_sms_alert(message: str) -> bool:
 
 
 def check_thresholds(r: ReadingIn) -> list[str]:
+    profile = thresholds.for_device(r.device_id)
     reasons = []
-    if r.ph < PH_MIN or r.ph > PH_MAX:
-        reasons.append(f"pH {r.ph} out of range ({PH_MIN}-{PH_MAX})")
-    if r.turbidity > TURBIDITY_MAX_NTU:
-        reasons.append(f"Turbidity {r.turbidity} NTU above {TURBIDITY_MAX_NTU}")
-    if r.tds > TDS_MAX_PPM:
-        reasons.append(f"TDS {r.tds} ppm above {TDS_MAX_PPM}")
+    for breach in profile.evaluate(r.model_dump()):
+        if breach.parameter == "ph":
+            reasons.append(f"pH {r.ph} out of range ({profile.low('ph')}-{profile.high('ph')})")
+        elif breach.parameter == "turbidity":
+            reasons.append(f"Turbidity {r.turbidity} NTU above {profile.high('turbidity')}")
+        elif breach.parameter == "tds":
+            reasons.append(f"TDS {r.tds} ppm above {profile.high('tds')}")
     return reasons
 
 
-def _insert_reading(record: dict[str, Any]) -> None:
-    supabase = get_supabase()
-    if supabase:
-        supabase.table("water_readings").insert({
-            "device_id": record["device_id"],
-            "ph": record["ph"],
-            "turbidity": record["turbidity"],
-            "tds": record["tds"],
-            "temperature": record.get("temperature"),
-        }).execute()
-    else:
-        readings_store.append(record)
-        while len(readings_store) > 500:
-            readings_store.pop(0)
+def _store_reading_in_memory(record: dict[str, Any]) -> None:
+    # Kept in event-time order, so a backfilled reading lands where it belongs
+    bisect.insort(readings_store, record, key=record_timestamp)
+    while len(readings_store) > 500:
+        readings_store.pop(0)
+
+
+def _store_alert_in_memory(alert_record: dict[str, Any]) -> None:
+    alerts_store.append(alert_record)
+    while len(alerts_store) > 100:
+        alerts_store.pop(0)
 
 
-def _insert_alert(alert_record: dict[str, Any]) -> None:
-    supabase = get_supabase()
+def _reading_from_row(x: dict) -> dict:
+    return {"timestamp": x.get("measured_at") or x.get("created_at"), "ph": x["ph"], "turbidity": x["turbidity"], "tds": x["tds"], "device_id": x["device_id"], "temperature": x.get("temperature")}
+
+
+async def _insert_reading(record: dict[str, Any]) -> None:
+    await _insert_readings([record])
+
+
+async def _insert_readings(records: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """
+    Store readings (one insert for a batch) and feed them to the in-memory analytics.
+
+    Returns:
+        The records actually stored; readings whose reading_key is already stored are skipped
+    """
+    supabase = await get_async_supabase()
+    stored = records
     if supabase:
-        supabase.table("water_alerts").insert({
+        rows = [
+            {
+                "device_id": record["device_id"],
+                "ph": record["ph"],
+                "turbidity": record["turbidity"],
+                "tds": record["tds"],
+                "temperature": record.get("temperature"),
+            }
+            for record in records
+        ]
+        keys = [reading_key(_dedup_key(record)) for record in records]
+        # Every row of a bulk insert needs the same columns
+        if any(key or record.get("measured_at") for key, record in zip(keys, records)):
+            for row, record, key in zip(rows, records, keys):
+                row["seq"] = record.get("seq")
+                row["boot_id"] = record.get("boot_id")
+                row["measured_at"] = record.get("measured_at")
+                row["reading_key"] = key
+        if any(keys):
+            # Retries missed by the in-memory window (e.g. after a restart) hit the unique index
+            r = await run_query(
+                supabase.table("water_readings").upsert(rows, on_conflict="reading_key", ignore_duplicates=True)
+            )
+            inserted = {x["reading_key"] for x in r.data or []}
+            stored = [record for record, key in zip(records, keys) if key is None or key in inserted]
+        else:
+            await run_query(supabase.table("water_readings").insert(rows))
+    else:
+        for record in records:
+            _store_reading_in_memory(record)
+    _data_version["water_readings"] += 1
+    for record in stored:
+        chat_context.on_reading(record)
+        # Receive time, not measured_at: a backfill is not the device going offline and back
+        online_event = device_registry.heartbeat(record["device_id"])
+        rolling_stats.add(record)
+        fleet_table.on_reading(record)
+        forecaster.add(record)
+        correlation_engine.add(record)
+        if online_event:
+            await report_device_event(online_event)
+    return stored
+
+
+async def _insert_alert(alert_record: dict[str, Any], threshold: bool = False) -> None:
+    """
+    Store an alert and update the in-memory views.
+
+    Args:
+        alert_record: The alert (timestamp, device_id, message, readings)
+        threshold: A persistent-breach alert, counted as open in the fleet table
+    """
+    supabase = await get_async_supabase()
+    if supabase:
+        await run_query(supabase.table("water_alerts").insert({
             "device_id": alert_record["device_id"],
             "message": alert_record["message"],
             "ph": alert_record.get("readings", {}).get("ph"),
             "turbidity": alert_record.get("readings", {}).get("turbidity"),
             "tds": alert_record.get("readings", {}).get("tds"),
-        }).execute()
+        }))
     else:
-        alerts_store.append(alert_record)
-        while len(alerts_store) > 100:
-            alerts_store.pop(0)
+        _store_alert_in_memory(alert_record)
+    _data_version["water_alerts"] += 1
+    chat_context.on_alert(alert_record)
+    if threshold:
+        fleet_table.on_alert(alert_record)
+
+
+async def _report_anomalies(record: dict[str, Any], anomalies: Optional[list[dict[str, Any]]] = None) -> int:
+    """
+    Store and broadcast the anomalies a stored reading raised.
+
+    Args:
+        record: The stored reading
+        anomalies: Its anomalies when the batch was already run through the detector
+            (None runs the reading through it here)
+    """
+    if not ANOMALY_DETECTION_ENABLED:
+        return 0
+    if anomalies is None:
+        anomalies = anomaly_detector.observe(record)
+    for anomaly in anomalies:
+        alert_record = {
+            "timestamp": record["timestamp"],
+            "device_id": anomaly["device_id"],
+            "message": anomaly["message"],
+            "readings": record,
+        }
+        await _insert_alert(alert_record)
+        await ws_manager.broadcast({"type": "anomaly", "data": {**anomaly, "timestamp": record["timestamp"]}})
+        print(f"[ANOMALY] {anomaly['device_id']}: {anomaly['message']}")
+    return len(anomalies)
+
+
+async def report_device_event(event: dict[str, Any]) -> None:
+    """Store and broadcast a device_offline/device_online event from the device registry."""
+    from app.alert_monitor import get_alert_monitor
+
+    alert_record = {
+        "timestamp": event["timestamp"],
+        "device_id": event["device_id"],
+        "message": event["message"],
+    }
+    if event["type"] == "device_offline":
+        # No more readings will arrive to end the device's breach timers
+        get_alert_monitor().reset_device(event["device_id"])
+    await _insert_alert(alert_record)
+    await ws_manager.broadcast({"type": event["type"], "data": event})
+    print(f"[DEVICES] {event['message']}")
+
+
+async def _get_readings(limit: int, device_id: Optional[str]) -> list[dict]:
+    key = ("readings", limit, device_id, _data_version["water_readings"])
+    return await _read_flight.do(key, lambda: _fetch_readings(limit, device_id))
 
 
-def _get_readings(limit: int, device_id: Optional[str]) -> list[dict]:
-    supabase = get_supabase()
+async def _get_latest(device_id: Optional[str]) -> Optional[dict]:
+    key = ("latest", device_id, _data_version["water_readings"])
+    return await _read_flight.do(key, lambda: _fetch_latest(device_id))
+
+
+async def _get_alerts(limit: int) -> list[dict]:
+    key = ("alerts", limit, _data_version["water_alerts"])
+    return await _read_flight.do(key, lambda: _fetch_alerts(limit))
+
+
+async def _fetch_readings(limit: int, device_id: Optional[str]) -> list[dict]:
+    supabase = await get_async_supabase()
     if supabase:
-        q = supabase.table("water_readings").select("*").order("created_at", desc=True).limit(limit)
+        q = supabase.table("water_readings").select("*").order("observed_at", desc=True).order("id", desc=True).limit(limit)
         if device_id:
             q = q.eq("device_id", device_id)
-        r = q.execute()
+        r = await run_query(q)
         rows = r.data or []
-        return [{"timestamp": x.get("created_at"), "ph": x["ph"], "turbidity": x["turbidity"], "tds": x["tds"], "device_id": x["device_id"], "temperature": x.get("temperature")} for x in rows]
+        return [_reading_from_row(x) for x in rows]
     out = list(readings_store)
     if device_id:
         out = [r for r in out if r.get("device_id") == device_id]
@@ -134,27 +342,26 @@ def _get_readings(limit: int, device_id: Optional[str]) -> list[dict]:
     return out
 
 
-def _get_latest(device_id: Optional[str]) -> Optional[dict]:
-    supabase = get_supabase()
+async def _fetch_latest(device_id: Optional[str]) -> Optional[dict]:
+    supabase = await get_async_supabase()
     if supabase:
-        q = supabase.table("water_readings").select("*").order("created_at", desc=True).limit(1)
+        q = supabase.table("water_readings").select("*").order("observed_at", desc=True).order("id", desc=True).limit(1)
         if device_id:
             q = q.eq("device_id", device_id)
-        r = q.execute()
+        r = await run_query(q)
         if not r.data:
             return None
-        x = r.data[0]
-        return {"timestamp": x.get("created_at"), "ph": x["ph"], "turbidity": x["turbidity"], "tds": x["tds"], "device_id": x["device_id"], "temperature": x.get("temperature")}
+        return _reading_from_row(r.data[0])
     out = list(readings_store)
     if device_id:
         out = [r for r in out if r.get("device_id") == device_id]
     return out[-1] if out else None
 
 
-def _get_alerts(limit: int) -> list[dict]:
-    supabase = get_supabase()
+async def _fetch_alerts(limit: int) -> list[dict]:
+    supabase = await get_async_supabase()
     if supabase:
-        r = supabase.table("water_alerts").select("*").order("created_at", desc=True).limit(limit).execute()
+        r = await run_query(supabase.table("water_alerts").select("*").order("created_at", desc=True).limit(limit))
         rows = r.data or []
         return [{
             "timestamp": x.get("created_at"),
@@ -176,6 +383,15 @@ def _get_alerts(limit: int) -> list[dict]:
     } for a in out]
 
 
+async def _count_rows(table: str, cap: int) -> int:
+    supabase = await get_async_supabase()
+    if supabase:
+        r = await run_query(supabase.table(table).select("id", count="exact").limit(1))
+        return min(r.count or 0, cap)
+    store = readings_store if table == "water_readings" else alerts_store
+    return min(len(store), cap)
+
+
 @app.on_event("startup")
 async def startup_event():
     """Initialize and start dummy generator on startup if enabled."""
@@ -192,11 +408,18 @@ async def startup_event():
         print(f"[STARTUP] ⚠️  SMS alerts not configured - Recipient: {to_num or 'Not set'}")
         print(f"[STARTUP]    Set TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN, TWILIO_PHONE_NUMBER, and WATER_ALERT_PHONE_NUMBER in .env")
     
+    # Load threshold profiles before any reading is evaluated
+    try:
+        count = await thresholds.load()
+        print(f"[STARTUP] Loaded {count} threshold profile(s)")
+    except Exception as e:
+        print(f"[STARTUP] ⚠️  Threshold profiles not loaded, using defaults: {e}")
+    
     # Initialize sample data if enabled and database is empty
     init_data_enabled = os.environ.get("INIT_SAMPLE_DATA", "true").lower() == "true"
     if init_data_enabled:
         print("[STARTUP] Checking for sample data initialization...")
-        result = initialize_sample_data(
+        result = await initialize_sample_data(
             readings_count=50,
             alerts_count=3,
             device_id="esp32_dummy",
@@ -211,6 +434,27 @@ async def startup_event():
         else:
             print(f"[STARTUP] ⚠️  Sample data initialization skipped: {result.get('error', 'Unknown error')}")
     
+    # Warm rolling statistics and anomaly baselines from recent history
+    try:
+        history = await _get_readings(limit=5000, device_id=None)
+        seeded = rolling_stats.seed(history)
+        fleet_table.seed(history)
+        forecaster.seed(history)
+        correlation_engine.seed(history)
+        device_registry.seed(history)
+        print(f"[STARTUP] Rolling stats, forecasts and correlations seeded with {seeded} readings")
+        if ANOMALY_DETECTION_ENABLED:
+            # History is newest first; baselines must be built oldest first
+            anomaly_detector.seed(reversed(history))
+            print(f"[STARTUP] Anomaly baselines seeded for {anomaly_detector.get_metrics()['devices']} devices")
+    except Exception as e:
+        print(f"[STARTUP] ⚠️  Rolling stats seeding skipped: {e}")
+    
+    await forecast_job.start()
+    await sensor_health_job.start()
+    await device_monitor.start()
+    await alert_digest.start()
+    
     # Initialize dummy generator
     generator = initialize_dummy_generator()
     set_dummy_generator(generator)
@@ -220,10 +464,23 @@ async def startup_event():
 
 @app.on_event("shutdown")
 async def shutdown_event():
-    """Stop dummy generator on shutdown."""
+    """Stop background jobs and close the Supabase pool and chat session store on shutdown."""
+    from app.session_store import close_session_store
+
     generator = get_dummy_generator()
     if generator:
         await generator.stop()
+    await forecast_job.stop()
+    await sensor_health_job.stop()
+    await device_monitor.stop()
+    await alert_digest.stop()
+    await close_async_supabase()
+    close_session_store()
+
+
+@app.exception_handler(TimeoutError)
+async def query_timeout_handler(request: Request, exc: TimeoutError):
+    return JSONResponse(status_code=504, content={"detail": str(exc) or "Upstream query timed out"})
 
 
 @app.get("/health")
@@ -248,84 +505,547 @@ async def websocket_endpoint(websocket: WebSocket):
         ws_manager.disconnect(websocket)
 
 
-@app.post("/api/readings")
-async def post_reading(body: ReadingIn):
-    from app.alert_monitor import get_alert_monitor
-    
+async def ingest_readings(readings: list[ReadingIn]) -> list[dict[str, int]]:
+    """
+    Store readings and run them through anomaly detection and the time-based alert monitor.
+
+    Shared by every ingest route (HTTP POST, the device WebSocket) so they behave the same.
+
+    Returns:
+        Per reading, the number of time-based alerts and anomalies it raised and whether it was a duplicate
+    """
     now = datetime.now(timezone.utc).isoformat()
-    record = {
-        "timestamp": now,
-        "ph": body.ph,
-        "turbidity": body.turbidity,
-        "tds": body.tds,
-        "device_id": body.device_id,
-        "temperature": body.temperature,
-    }
-    _insert_reading(record)
+    records = []
+    for body in readings:
+        record = {
+            "timestamp": body.measured_at.isoformat() if body.measured_at else now,
+            "ph": body.ph,
+            "turbidity": body.turbidity,
+            "tds": body.tds,
+            "device_id": body.device_id,
+            "temperature": body.temperature,
+        }
+        if body.seq is not None:
+            record["seq"] = body.seq
+        if body.boot_id is not None:
+            record["boot_id"] = body.boot_id
+        if body.measured_at:
+            record["measured_at"] = record["timestamp"]
+        records.append(record)
+    return await _process_records(records) if records else []
+
+
+def _dedup_key(record: dict[str, Any]) -> tuple:
+    """(device_id, boot_id, seq, measured_at) identifying a record for app.dedup."""
+    measured_at = record_timestamp(record) if record.get("measured_at") else None
+    return (record["device_id"], record.get("boot_id"), record.get("seq"), measured_at)
+
+
+async def _process_records(records: list[dict[str, Any]]) -> list[dict[str, int]]:
+    """
+    The ingest pipeline for already validated reading records.
+
+    Readings whose seq was already stored (or is being stored) are acknowledged
+    but not stored or alerted on again.
+    """
+    from app.alert_monitor import get_alert_monitor
+
+    keys = [_dedup_key(record) for record in records]
+    duplicates = reading_dedup.filter(keys)
+    fresh = [(record, key) for record, key, duplicate in zip(records, keys, duplicates) if not duplicate]
+    try:
+        stored = await _insert_readings([record for record, _ in fresh]) if fresh else []
+    except Exception:
+        reading_dedup.release(key for _, key in fresh)
+        raise
+    for _, key in fresh:
+        reading_dedup.record(key)
+    # Retries the in-memory window missed but the unique index caught
+    reading_dedup.duplicates += len(fresh) - len(stored)
+    stored_ids = {id(record) for record in stored}
+
+    # One vectorized anomaly pass for the whole batch
+    found = anomaly_detector.observe_records(stored) if ANOMALY_DETECTION_ENABLED else [[] for _ in stored]
+    anomalies_of = {id(record): anomalies for record, anomalies in zip(stored, found)}
 
-    # Only check time-based alerts (3-minute persistent breach)
-    # NO immediate alerts - only after 3 minutes of continuous breach
     alert_monitor = get_alert_monitor()
-    time_based_alerts = alert_monitor.check_and_alert(
-        device_id=body.device_id,
-        ph=body.ph,
-        turbidity=body.turbidity,
-        tds=body.tds,
+    results = []
+    for record in records:
+        if id(record) not in stored_ids:
+            results.append({"time_based_alerts": 0, "anomalies": 0, "duplicate": True})
+            continue
+        anomalies = await _report_anomalies(record, anomalies_of[id(record)])
+
+        # Only check time-based alerts (3-minute persistent breach)
+        # NO immediate alerts - only after 3 minutes of continuous breach
+        # Device-timestamped readings (e.g. a backfill) are judged on the device's clock;
+        # ones older than the device's last monitored reading are skipped
+        time_based_alerts = alert_monitor.check_and_alert(
+            device_id=record["device_id"],
+            ph=record["ph"],
+            turbidity=record["turbidity"],
+            tds=record["tds"],
+            current_time=record_timestamp(record) if record.get("measured_at") else None,
+        )
+
+        # Send time-based alerts if any (only after 3 minutes)
+        for alert_msg in time_based_alerts:
+            alert_record = {
+                "timestamp": record["timestamp"],
+                "device_id": record["device_id"],
+                "message": alert_msg,
+                "readings": record,
+            }
+            await _insert_alert(alert_record, threshold=True)
+            await alert_digest.submit(record["device_id"], alert_msg)
+            await ws_manager.broadcast({"type": "alert", "data": alert_record})
+            print(f"[ALERT] {alert_msg}")
+
+        # Always broadcast reading (every 5 seconds)
+        await ws_manager.broadcast({"type": "reading", "data": record})
+        results.append({"time_based_alerts": len(time_based_alerts), "anomalies": anomalies, "duplicate": False})
+    return results
+
+
+async def ingest_binary(
+    payload: bytes,
+    device_id: Optional[str] = None,
+    device_prefix: Optional[str] = None,
+) -> tuple[int, list[dict[str, Any]], list[dict[str, int]]]:
+    """
+    Decode, validate and ingest a binary reading payload (see app.binary_ingest).
+
+    Returns:
+        (readings accepted, rejected records, per-reading pipeline results)
+    """
+    binary_ingest.binary_ingest_stats.payloads += 1
+    try:
+        records = binary_ingest.decode(payload)
+    except binary_ingest.BinaryPayloadError:
+        binary_ingest.binary_ingest_stats.bad_payloads += 1
+        raise
+    valid, rejected = binary_ingest.validate(records)
+    rows = binary_ingest.to_records(
+        records, valid, datetime.now(timezone.utc).isoformat(),
+        device_prefix if device_prefix is not None else binary_ingest.DEFAULT_DEVICE_PREFIX,
+        device_id,
     )
-    
-    # Send time-based alerts if any (only after 3 minutes)
-    for alert_msg in time_based_alerts:
-        alert_record = {
-            "timestamp": now,
-            "device_id": body.device_id,
-            "message": alert_msg,
-            "readings": record,
-        }
-        _insert_alert(alert_record)
-        send_sms_alert(alert_msg)
-        await ws_manager.broadcast({"type": "alert", "data": alert_record})
-        print(f"[ALERT] {alert_msg}")
+    results = await _process_records(rows) if rows else []
+    binary_ingest.binary_ingest_stats.readings += len(rows)
+    binary_ingest.binary_ingest_stats.rejected += len(rejected)
+    binary_ingest.binary_ingest_stats.bytes += len(payload)
+    return len(rows), rejected, results
+
+
+@app.websocket("/ws/ingest")
+async def websocket_ingest(websocket: WebSocket):
+    """
+    Long-lived device connection streaming readings (see app.ws_ingest for the frame format).
+
+    Each frame goes through the same validation and alert pipeline as POST /api/readings
+    and is answered with an ack.
+    """
+    if not ingest_channel.authorized(websocket):
+        await websocket.close(code=1008)
+        return
+    device_id = websocket.query_params.get("device_id")
+    await websocket.accept()
+    ingest_channel.connections += 1
+    ingest_channel.connections_total += 1
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes") is not None:
+                # Binary frame: one binary_ingest payload
+                ingest_channel.frames += 1
+                try:
+                    accepted, rejected, results = await ingest_binary(message["bytes"], device_id)
+                except binary_ingest.BinaryPayloadError as e:
+                    ingest_channel.bad_frames += 1
+                    await websocket.send_json({"type": "error", "id": None, "detail": str(e)})
+                    continue
+                except Exception as e:
+                    # Nothing in the payload is acknowledged; the device resends it
+                    await websocket.send_json({"type": "error", "id": None, "detail": f"Could not store readings: {e}"})
+                    continue
+                await websocket.send_json(ingest_channel.ack(None, accepted, rejected, results))
+                continue
+            try:
+                frame_id, payloads = ingest_channel.parse_frame(message.get("text") or "", device_id)
+            except IngestFrameError as e:
+                await websocket.send_json({"type": "error", "id": None, "detail": str(e)})
+                continue
+            readings, rejected = [], []
+            for index, payload in enumerate(payloads):
+                try:
+                    readings.append(ReadingIn.model_validate(payload))
+                except ValidationError as e:
+                    detail = "; ".join(f"{'.'.join(map(str, err['loc'])) or 'reading'}: {err['msg']}" for err in e.errors())
+                    rejected.append({"index": index, "detail": detail})
+            try:
+                results = await ingest_readings(readings) if readings else []
+            except Exception as e:
+                # Nothing in the frame is acknowledged; the device resends it
+                await websocket.send_json({"type": "error", "id": frame_id, "detail": f"Could not store readings: {e}"})
+                continue
+            await websocket.send_json(ingest_channel.ack(frame_id, len(readings), rejected, results))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        ingest_channel.connections -= 1
+
 
-    # Always broadcast reading (every 5 seconds)
-    await ws_manager.broadcast({"type": "reading", "data": record})
+@app.post("/api/readings/binary")
+async def post_readings_binary(
+    request: Request,
+    device_id: Optional[str] = None,
+    device_prefix: Optional[str] = None,
+):
+    """
+    Store a batch of readings sent as an application/octet-stream binary payload.
+
+    `device_id` assigns every reading to one device; otherwise each record's device
+    index is appended to `device_prefix` (default BINARY_INGEST_DEVICE_PREFIX).
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type != "application/octet-stream":
+        raise HTTPException(status_code=415, detail="Expected Content-Type: application/octet-stream")
+    try:
+        accepted, rejected, results = await ingest_binary(await request.body(), device_id, device_prefix)
+    except binary_ingest.BinaryPayloadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    alerts = sum(r["time_based_alerts"] for r in results)
     return {
         "ok": True,
-        "alert": len(time_based_alerts) > 0,
-        "time_based_alerts": len(time_based_alerts),
+        "accepted": accepted,
+        "rejected": rejected,
+        "duplicates": sum(1 for r in results if r["duplicate"]),
+        "alert": alerts > 0,
+        "time_based_alerts": alerts,
+        "anomalies": sum(r["anomalies"] for r in results),
+    }
+
+
+@app.post("/api/readings")
+async def post_reading(body: ReadingIn):
+    result = (await ingest_readings([body]))[0]
+    return {
+        "ok": True,
+        "alert": result["time_based_alerts"] > 0,
+        **result,
     }
 
 
 @app.get("/api/readings")
-def get_readings(limit: int = 50, device_id: Optional[str] = None):
-    return {"readings": _get_readings(limit, device_id)}
+async def get_readings(limit: int = 50, device_id: Optional[str] = None):
+    return {"readings": await _get_readings(limit, device_id)}
 
 
 @app.get("/api/readings/latest")
-def get_latest(device_id: Optional[str] = None):
-    row = _get_latest(device_id)
+async def get_latest(device_id: Optional[str] = None):
+    row = await _get_latest(device_id)
     if not row:
         raise HTTPException(status_code=404, detail="No readings yet")
     return row
 
 
 @app.get("/api/alerts")
-def get_alerts(limit: int = 20):
-    return {"alerts": _get_alerts(limit)}
+async def get_alerts(limit: int = 20):
+    return {"alerts": await _get_alerts(limit)}
 
 
 @app.get("/api/stats")
-def get_stats():
-    readings = _get_readings(limit=5000, device_id=None)
-    alerts = _get_alerts(limit=1000)
-    latest = _get_latest(None)
+async def get_stats():
+    readings_count, alerts_count, latest = await asyncio.gather(
+        _count_rows("water_readings", cap=5000),
+        _count_rows("water_alerts", cap=1000),
+        _get_latest(None),
+    )
     return {
-        "readings_count": len(readings),
-        "alerts_count": len(alerts),
+        "readings_count": readings_count,
+        "alerts_count": alerts_count,
         "latest_timestamp": latest.get("timestamp") if latest else None,
         "device_id": latest.get("device_id") if latest else None,
     }
 
 
+@app.get("/api/stats/rolling")
+async def get_rolling_stats(device_id: Optional[str] = None, window: Optional[str] = None):
+    """Rolling-window statistics per parameter (all devices combined unless device_id is given)."""
+    try:
+        windows = rolling_stats.get(device_id, window)
+    except KeyError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown window '{window}'. Available: {', '.join(rolling_stats.windows)}",
+        )
+    return {"device_id": device_id, "windows": windows}
+
+
+@app.get("/api/forecast")
+async def get_forecast(device_id: Optional[str] = None, parameter: Optional[str] = None, breaches_only: bool = False):
+    """Trend forecasts and time-to-threshold per device and parameter."""
+    if parameter is not None and parameter not in FORECAST_PARAMETERS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown parameter '{parameter}'. Available: {', '.join(FORECAST_PARAMETERS)}",
+        )
+    if forecaster.generated_at is None or time.time() - forecaster.generated_at > forecast_job.interval:
+        await forecaster.fit_async()
+    return {
+        "generated_at": datetime.fromtimestamp(forecaster.generated_at, timezone.utc).isoformat(),
+        "window_seconds": forecaster.window,
+        "horizon_seconds": forecaster.horizon,
+        "forecasts": forecaster.get(device_id, parameter, breaches_only),
+    }
+
+
+@app.get("/api/devices")
+async def get_devices(online: Optional[bool] = None):
+    """Registered devices with last-seen time, learned reporting interval and online state."""
+    devices = device_registry.list_devices(online)
+    devices.sort(key=lambda d: (d["online"], d["device_id"]))
+    return {"summary": device_registry.get_metrics(), "devices": devices}
+
+
+@app.get("/api/devices/{device_id}")
+async def get_device(device_id: str):
+    device = device_registry.get(device_id)
+    if not device:
+        raise HTTPException(status_code=404, detail=f"Unknown device '{device_id}'")
+    return device
+
+
+@app.get("/api/fleet/summary")
+async def get_fleet_summary(
+    in_breach: Optional[bool] = None,
+    has_alerts: Optional[bool] = None,
+    stale: Optional[bool] = None,
+    parameter: Optional[str] = None,
+    search: Optional[str] = None,
+    sort: str = "device_id",
+    order: str = "asc",
+    limit: Optional[int] = None,
+    offset: int = 0,
+):
+    """Latest reading, breach status, open alerts, last-seen age and rolling averages of every device."""
+    if sort not in FLEET_SORT_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown sort '{sort}'. Available: {', '.join(FLEET_SORT_KEYS)}")
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=400, detail="order must be 'asc' or 'desc'")
+    if (limit is not None and limit < 0) or offset < 0:
+        raise HTTPException(status_code=400, detail="limit and offset must not be negative")
+    # Thousands of plain rows: skip FastAPI's generic encoder
+    return JSONResponse(fleet_table.summary(
+        in_breach=in_breach,
+        has_alerts=has_alerts,
+        stale=stale,
+        parameter=parameter,
+        search=search,
+        sort=sort,
+        descending=order == "desc",
+        limit=limit,
+        offset=offset,
+    ))
+
+
+@app.get("/api/analytics/correlation")
+async def get_correlation(
+    window: Optional[str] = None,
+    device_id: Optional[str] = None,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+):
+    """
+    Correlation matrices between pH, turbidity, TDS and temperature, per device and fleet-wide.
+
+    Served from the incrementally maintained sliding windows, or recomputed from
+    stored history when `start` and/or `end` (ISO timestamps) are given.
+    """
+    if start or end:
+        try:
+            start_date = datetime.fromisoformat(start.replace("Z", "+00:00")) if start else None
+            end_date = datetime.fromisoformat(end.replace("Z", "+00:00")) if end else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid date format: {str(e)}")
+        result = await compute_correlation(start_date, end_date, device_id)
+        return {"start": start, "end": end, **result}
+
+    window = window or next(iter(correlation_engine.windows))
+    try:
+        result = correlation_engine.get(window, device_id)
+    except KeyError:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown window '{window}'. Available: {', '.join(correlation_engine.windows)}",
+        )
+    return {"window": window, **result}
+
+
+@app.get("/api/sensor-health")
+async def get_sensor_health(device_id: Optional[str] = None, status: Optional[str] = None):
+    """Per-device sensor health (drift, stuck-at, flatline, noise) from the last analysis."""
+    rows = await sensor_health_store.load()
+    devices = [
+        row for row in rows
+        if (device_id is None or row["device_id"] == device_id)
+        and (status is None or row["status"] == status)
+    ]
+    devices.sort(key=lambda row: ({"fault": 0, "warning": 1}.get(row["status"], 2), row["device_id"]))
+    return {**sensor_health_job.get_status(), "devices": devices}
+
+
+@app.post("/api/sensor-health/analyze", status_code=202)
+async def analyze_sensor_health(days: Optional[float] = None):
+    """Start a sensor health analysis over the last `days` of history (runs in the background)."""
+    if sensor_health_job.analyzing:
+        raise HTTPException(status_code=409, detail="Sensor health analysis is already running")
+    if days is not None and days <= 0:
+        raise HTTPException(status_code=400, detail="days must be positive")
+
+    async def run():
+        try:
+            await sensor_health_job.run_once(days)
+        except Exception as e:
+            print(f"[SENSOR HEALTH] Error analyzing sensor health: {e}")
+
+    asyncio.create_task(run())
+    # Let the task mark itself as running before reporting status
+    await asyncio.sleep(0)
+    return sensor_health_job.get_status()
+
+
+def _require_admin(request: Request) -> None:
+    """Check the X-Admin-Key header when ADMIN_API_KEY is set."""
+    import os
+
+    key = os.environ.get("ADMIN_API_KEY")
+    if key and request.headers.get("X-Admin-Key") != key:
+        raise HTTPException(status_code=401, detail="Invalid or missing admin key")
+
+
+def _on_thresholds_changed() -> None:
+    chat_context.invalidate()
+    fleet_table.reevaluate()
+
+
+@app.get("/api/admin/thresholds")
+async def list_threshold_profiles(request: Request, device_id: Optional[str] = None):
+    """Threshold profiles with their effective limits (`?device_id=...` shows the profile a device uses)."""
+    _require_admin(request)
+    if device_id is not None:
+        return thresholds.get(thresholds.for_device(device_id).name)
+    return {"version": thresholds.version, "profiles": thresholds.list_profiles()}
+
+
+@app.put("/api/admin/thresholds/{name}")
+async def put_threshold_profile(name: str, body: ThresholdProfileIn, request: Request):
+    """Create or replace a threshold profile; applies to new readings immediately."""
+    _require_admin(request)
+    try:
+        profile = await thresholds.upsert(name, body.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _on_thresholds_changed()
+    print(f"[THRESHOLDS] Profile '{name}' updated (version {thresholds.version})")
+    return profile
+
+
+@app.delete("/api/admin/thresholds/{name}")
+async def delete_threshold_profile(name: str, request: Request):
+    _require_admin(request)
+    try:
+        deleted = await thresholds.delete(name)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Unknown threshold profile '{name}'")
+    _on_thresholds_changed()
+    return {"ok": True}
+
+
+@app.post("/api/admin/thresholds/reload")
+async def reload_threshold_profiles(request: Request):
+    """Reload threshold profiles from storage (after editing the table directly)."""
+    _require_admin(request)
+    count = await thresholds.load()
+    _on_thresholds_changed()
+    print(f"[THRESHOLDS] Reloaded {count} profile(s) (version {thresholds.version})")
+    return {"profiles": count, "version": thresholds.version}
+
+
+@app.post("/api/admin/backtest")
+async def backtest_alert_rules(body: BacktestRequest, request: Request):
+    """
+    Replay stored readings (or an exported CSV) through candidate alert rule configurations.
+
+    Reports how many alerts each configuration would have produced and when;
+    without `rules` the live configuration is replayed.
+    """
+    from app.backtest import RuleConfig, iter_csv_pages, run_backtest
+
+    _require_admin(request)
+    try:
+        start_date = datetime.fromisoformat(body.start.replace("Z", "+00:00")) if body.start else None
+        end_date = datetime.fromisoformat(body.end.replace("Z", "+00:00")) if body.end else None
+        pages = iter_csv_pages(body.csv) if body.csv is not None else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid input: {str(e)}")
+    configs = [
+        RuleConfig(
+            name=rule.name,
+            alert_duration_seconds=rule.alert_duration_seconds,
+            hysteresis=rule.hysteresis,
+            clear_seconds=rule.clear_seconds,
+            flap_window_seconds=rule.flap_window_seconds,
+            flap_threshold=rule.flap_threshold,
+            limits={column: getattr(rule, column) for column in ("ph_min", "ph_max", "turbidity_max", "tds_max")},
+        )
+        for rule in body.rules
+    ]
+    try:
+        result = await run_backtest(configs, start_date, end_date, body.device_id, pages, body.engine, body.max_events)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    print(f"[BACKTEST] Replayed {result['readings']} readings through {len(result['results'])} rule configuration(s) in {result['elapsed_seconds']}s")
+    return result
+
+
+@app.get("/api/metrics")
+async def get_metrics():
+    """Runtime performance metrics."""
+    from app.alert_monitor import get_alert_monitor
+    from app.chatbot import response_cache, stream_metrics
+    from app.intent_router import route_metrics
+    from app.llm_gateway import get_llm_gateway
+    from app.session_store import get_session_store
+
+    return {
+        "db_pool": get_query_pool().get_metrics(),
+        "read_coalescing": _read_flight.get_metrics(),
+        "anomaly_detection": anomaly_detector.get_metrics(),
+        "forecast": forecaster.get_metrics(),
+        "fleet": fleet_table.get_metrics(),
+        "devices": device_registry.get_metrics(),
+        "alert_monitor": get_alert_monitor().get_metrics(),
+        "alert_digest": alert_digest.get_metrics(),
+        "ws_ingest": ingest_channel.get_metrics(),
+        "ingest_dedup": reading_dedup.get_metrics(),
+        "binary_ingest": binary_ingest.binary_ingest_stats.get_metrics(),
+        "thresholds": thresholds.get_metrics(),
+        "correlation": correlation_engine.get_metrics(),
+        "sensor_health": sensor_health_job.get_status(),
+        "chatbot_stream": stream_metrics.get_metrics(),
+        "chat_context": chat_context.get_metrics(),
+        "chatbot_response_cache": response_cache.get_metrics(),
+        "chatbot_routes": route_metrics.get_metrics(),
+        "llm_gateway": get_llm_gateway().get_metrics(),
+        "chat_sessions": get_session_store().get_metrics(),
+    }
+
+
 # Dummy Generator Control Endpoints
 @app.get("/api/dummy-generator/status")
 async def get_dummy_generator_status():
@@ -365,7 +1085,7 @@ async def init_sample_data_endpoint(force: bool = False):
     """Manually initialize sample data."""
     from app.init_data import initialize_sample_data
     
-    result = initialize_sample_data(
+    result = await initialize_sample_data(
         readings_count=50,
         alerts_count=3,
         device_id="esp32_dummy",
@@ -397,13 +1117,18 @@ class ChatbotRequest(BaseModel):
 from fastapi.responses import StreamingResponse
 
 
+def _sse_data(text: str) -> str:
+    """Frame a text delta as an SSE event, JSON-encoded so whitespace and newlines survive."""
+    return f"data: {json.dumps(text)}\n\n"
+
+
 @app.post("/api/chatbot")
 async def chatbot_endpoint(request: ChatbotRequest):
     """Chatbot endpoint for water quality assistance (non-streaming)."""
     try:
         from app.chatbot import get_chatbot_response
         
-        response = get_chatbot_response(
+        response = await get_chatbot_response(
             user_message=request.message,
             alerts=request.alerts or [],
             session_id=request.session_id or "default",
@@ -435,7 +1160,7 @@ async def chatbot_stream_endpoint(request: ChatbotRequest):
                     alerts=request.alerts or [],
                     session_id=request.session_id or "default",
                 ):
-                    yield f"data: {chunk}\n\n"
+                    yield _sse_data(chunk)
                 yield "data: [DONE]\n\n"
             except Exception as e:
                 import traceback
@@ -444,14 +1169,14 @@ async def chatbot_stream_endpoint(request: ChatbotRequest):
                 # Fallback to non-streaming
                 from app.chatbot import get_chatbot_response
                 try:
-                    response = get_chatbot_response(
+                    response = await get_chatbot_response(
                         user_message=request.message,
                         alerts=request.alerts or [],
                         session_id=request.session_id or "default",
                     )
-                    yield f"data: {response}\n\n"
+                    yield _sse_data(response)
                 except Exception as e2:
-                    yield f"data: I apologize, but I'm experiencing technical difficulties. Please try again later.\n\n"
+                    yield _sse_data("I apologize, but I'm experiencing technical difficulties. Please try again later.")
                 yield "data: [DONE]\n\n"
         
         return StreamingResponse(generate(), media_type="text/event-stream")
@@ -498,13 +1223,13 @@ async def export_csv(request: ExportRequest):
         
         # Generate CSV
         if request.export_type == "readings":
-            csv_content = export_readings_to_csv(start_date, end_date, request.device_id)
+            csv_content = await export_readings_to_csv(start_date, end_date, request.device_id)
             filename = f"water_readings_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         elif request.export_type == "alerts":
-            csv_content = export_alerts_to_csv(start_date, end_date, request.device_id)
+            csv_content = await export_alerts_to_csv(start_date, end_date, request.device_id)
             filename = f"water_alerts_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         elif request.export_type == "combined":
-            csv_content = export_combined_to_csv(start_date, end_date, request.device_id)
+            csv_content = await export_combined_to_csv(start_date, end_date, request.device_id)
             filename = f"water_data_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         else:
             raise HTTPException(status_code=400, detail="Invalid export_type. Must be 'readings', 'alerts', or 'combined'")
@@ -0,0 +1,257 @@
+"""
+Rolling-window statistics updated at ingest time.
+
+For every device (and the fleet as a whole) and every parameter, keeps
+count, mean, variance (Welford), min and max over sliding windows such as
+5m, 1h and 24h. Each window is split into a fixed number of time buckets;
+bucket aggregates are merged into / removed from the window totals with
+Chan's parallel Welford formulas and min/max are tracked with monotonic
+deques, so every reading costs O(1) and memory per window is bounded
+regardless of reporting rate. A late (backfilled) reading goes into the
+bucket of its own time, at O(buckets), or is dropped once that time has
+left the window.
+"""
+
+import math
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+PARAMETERS = ("ph", "turbidity", "tds", "temperature")
+
+# Aggregate key covering every device
+ALL_DEVICES = "*"
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(spec: str) -> float:
+    """Parse a window like ``30s``, ``5m``, ``1h`` or ``7d`` into seconds."""
+    spec = spec.strip().lower()
+    if not spec or spec[-1] not in _UNITS:
+        raise ValueError(f"Invalid window '{spec}'. Use a number followed by s, m, h or d.")
+    return float(spec[:-1]) * _UNITS[spec[-1]]
+
+
+class _Bucket:
+    __slots__ = ("start", "n", "mean", "m2", "min", "max")
+
+    def __init__(self, start: float):
+        self.start = start
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+
+class RollingWindow:
+    """Sliding-window count/mean/variance/min/max of a single series."""
+
+    __slots__ = ("span", "bucket_width", "buckets", "n", "mean", "m2", "min_q", "max_q")
+
+    def __init__(self, span_seconds: float, buckets: int = 60):
+        self.span = span_seconds
+        self.bucket_width = span_seconds / buckets
+        self.buckets: deque = deque()
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        # (bucket start, value) with increasing values (min) / decreasing values (max)
+        self.min_q: deque = deque()
+        self.max_q: deque = deque()
+
+    def _expire(self, now: float) -> None:
+        cutoff = now - self.span
+        while self.buckets and self.buckets[0].start + self.bucket_width <= cutoff:
+            b = self.buckets.popleft()
+            remaining = self.n - b.n
+            if remaining <= 0:
+                self.n, self.mean, self.m2 = 0, 0.0, 0.0
+            else:
+                mean_rest = (self.n * self.mean - b.n * b.mean) / remaining
+                delta = b.mean - mean_rest
+                self.m2 = max(0.0, self.m2 - b.m2 - delta * delta * remaining * b.n / self.n)
+                self.n, self.mean = remaining, mean_rest
+        oldest = self.buckets[0].start if self.buckets else math.inf
+        while self.min_q and self.min_q[0][0] < oldest:
+            self.min_q.popleft()
+        while self.max_q and self.max_q[0][0] < oldest:
+            self.max_q.popleft()
+
+    def _bucket(self, start: float) -> Optional[_Bucket]:
+        """The bucket starting at ``start`` (created if needed), None if it is outside the window."""
+        if not self.buckets or start > self.buckets[-1].start:
+            self.buckets.append(_Bucket(start))
+            return self.buckets[-1]
+        # A late (e.g. backfilled) reading goes into the bucket of its own time
+        if start <= self.buckets[-1].start - self.span:
+            return None
+        i = len(self.buckets) - 1
+        while i >= 0 and self.buckets[i].start > start:
+            i -= 1
+        if i >= 0 and self.buckets[i].start == start:
+            return self.buckets[i]
+        self.buckets.insert(i + 1, _Bucket(start))
+        return self.buckets[i + 1]
+
+    def add(self, t: float, x: float) -> bool:
+        """Fold a value observed at time t in; False if t is already outside the window."""
+        self._expire(t)
+        start = t - t % self.bucket_width
+        late = bool(self.buckets) and start < self.buckets[-1].start
+        b = self._bucket(start)
+        if b is None:
+            return False
+        b.n += 1
+        d = x - b.mean
+        b.mean += d / b.n
+        b.m2 += d * (x - b.mean)
+        b.min = min(b.min, x)
+        b.max = max(b.max, x)
+
+        self.n += 1
+        d = x - self.mean
+        self.mean += d / self.n
+        self.m2 += d * (x - self.mean)
+
+        if late:
+            self._rebuild_extremes()
+            return True
+        # At most one entry per bucket: a tail entry of the same bucket that is
+        # not dropped already dominates x (same expiry, better value)
+        while self.min_q and self.min_q[-1][1] >= x:
+            self.min_q.pop()
+        if not self.min_q or self.min_q[-1][0] != b.start:
+            self.min_q.append((b.start, x))
+        while self.max_q and self.max_q[-1][1] <= x:
+            self.max_q.pop()
+        if not self.max_q or self.max_q[-1][0] != b.start:
+            self.max_q.append((b.start, x))
+        return True
+
+    def _rebuild_extremes(self) -> None:
+        """Recompute the min/max deques from the bucket extremes (after a late reading)."""
+        self.min_q.clear()
+        self.max_q.clear()
+        for b in self.buckets:
+            while self.min_q and self.min_q[-1][1] >= b.min:
+                self.min_q.pop()
+            self.min_q.append((b.start, b.min))
+            while self.max_q and self.max_q[-1][1] <= b.max:
+                self.max_q.pop()
+            self.max_q.append((b.start, b.max))
+
+    def snapshot(self, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        self._expire(time.time() if now is None else now)
+        if self.n == 0:
+            return None
+        variance = self.m2 / (self.n - 1) if self.n > 1 else 0.0
+        return {
+            "count": self.n,
+            "mean": self.mean,
+            "std": math.sqrt(variance),
+            "min": self.min_q[0][1],
+            "max": self.max_q[0][1],
+        }
+
+
+def record_timestamp(record: Dict[str, Any]) -> float:
+    """Epoch seconds of a reading's ISO timestamp (now if missing or unparsable)."""
+    ts = record.get("timestamp")
+    if isinstance(ts, str):
+        try:
+            return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            pass
+    return time.time()
+
+
+class RollingStatsEngine:
+    """Per-device, per-parameter rolling windows fed from the ingest path."""
+
+    def __init__(self, windows: Dict[str, float]):
+        self.windows = windows
+        # device -> parameter -> window name -> RollingWindow
+        self._series: Dict[str, Dict[str, Dict[str, RollingWindow]]] = {}
+
+    def _device(self, device_id: str) -> Dict[str, Dict[str, RollingWindow]]:
+        series = self._series.get(device_id)
+        if series is None:
+            series = {
+                param: {name: RollingWindow(span) for name, span in self.windows.items()}
+                for param in PARAMETERS
+            }
+            self._series[device_id] = series
+        return series
+
+    def add(self, record: Dict[str, Any]) -> None:
+        """
+        Fold a stored reading into its device's and the fleet's windows.
+
+        A late reading counts in the windows that still cover its time and is
+        dropped from those it has already left.
+        """
+        t = record_timestamp(record)
+        for device_id in (record.get("device_id") or "unknown", ALL_DEVICES):
+            series = self._device(device_id)
+            for param in PARAMETERS:
+                value = record.get(param)
+                if value is None:
+                    continue
+                for window in series[param].values():
+                    window.add(t, value)
+
+    def seed(self, readings: Iterable[Dict[str, Any]]) -> int:
+        """Warm the windows from stored history (any order)."""
+        ordered = sorted(readings, key=record_timestamp)
+        for record in ordered:
+            self.add(record)
+        return len(ordered)
+
+    def get(self, device_id: Optional[str] = None, window: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Get rolling statistics.
+
+        Args:
+            device_id: Device to report (None = all devices combined)
+            window: Window name to report (None = every configured window)
+
+        Returns:
+            {window: {parameter: {count, mean, std, min, max}}}
+        """
+        if window is not None and window not in self.windows:
+            raise KeyError(window)
+        series = self._series.get(device_id or ALL_DEVICES)
+        names = [window] if window else list(self.windows)
+        now = time.time()
+        out: Dict[str, Any] = {}
+        for name in names:
+            out[name] = {}
+            if series is None:
+                continue
+            for param in PARAMETERS:
+                snap = series[param][name].snapshot(now)
+                if snap is not None:
+                    out[name][param] = snap
+        return out
+
+    def means(self, device_id: str, window: str) -> Dict[str, float]:
+        """Current window mean of each parameter (as of the device's last reading, no expiry)."""
+        series = self._series.get(device_id)
+        if series is None:
+            return {}
+        return {param: series[param][window].mean for param in PARAMETERS if series[param][window].n}
+
+    def devices(self) -> List[str]:
+        return [d for d in self._series if d != ALL_DEVICES]
+
+
+def _configured_windows() -> Dict[str, float]:
+    specs = os.environ.get("ROLLING_STATS_WINDOWS", "5m,1h,24h")
+    return {spec.strip(): parse_window(spec) for spec in specs.split(",") if spec.strip()}
+
+
+rolling_stats = RollingStatsEngine(_configured_windows())
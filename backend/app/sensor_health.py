@@ -0,0 +1,549 @@
+"""
+Sensor health analysis over stored reading history.
+
+Probes drift over weeks, freeze, lose contact or get noisy. This job streams
+water_readings once, oldest first, in pages and keeps a fixed amount of
+state per device, so months of fleet data are processed with bounded
+memory. Each page is evaluated with vectorized NumPy operations:
+
+- stuck-at: long runs of exactly repeated values (frozen ADC or firmware)
+- flatline: hours whose spread is below the sensor's resolution
+- noise: hours whose noise level (from successive differences) is too high
+- drift: slope of hourly means over the whole history (running regression)
+
+Results are written to a per-device sensor health table.
+"""
+
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.rolling_stats import record_timestamp
+
+PARAMETERS = ("ph", "turbidity", "tds")
+
+# Display name, resolution (spread below this is flat), noise sigma limit, drift limit per 30 days
+_PARAM_INFO = {
+    "ph": ("pH", 0.01, 0.3, 0.5),
+    "turbidity": ("Turbidity", 0.1, 15.0, 20.0),
+    "tds": ("TDS", 1.0, 40.0, 50.0),
+}
+
+_HOUR = 3600.0
+_DAY = 86400.0
+
+
+class SensorHealthAnalyzer:
+    """Single-pass, bounded-memory sensor health statistics for the whole fleet."""
+
+    def __init__(
+        self,
+        stuck_min_run: int = 60,
+        min_readings_per_hour: int = 6,
+        min_drift_days: float = 7.0,
+    ):
+        """
+        Initialize the analyzer.
+
+        Args:
+            stuck_min_run: Consecutive identical readings that count as stuck
+            min_readings_per_hour: Readings an hour needs before its spread/noise is judged
+            min_drift_days: History span required before drift is reported
+        """
+        self.stuck_min_run = stuck_min_run
+        self.min_per_hour = min_readings_per_hour
+        self.min_drift_days = min_drift_days
+        self._resolution = np.array([_PARAM_INFO[p][1] for p in PARAMETERS])
+        self._noise_limit = np.array([_PARAM_INFO[p][2] for p in PARAMETERS])
+
+        self._rows: Dict[str, int] = {}
+        self._device_ids: List[str] = []
+        self._state: Dict[str, np.ndarray] = {}
+        self._capacity = 0
+        self._fields = {
+            # name: (per-parameter?, dtype, fill)
+            "readings": (False, np.int64, 0),
+            "first_t": (False, float, np.inf),
+            "last_t": (False, float, -np.inf),
+            "last_value": (True, float, np.nan),
+            "run": (True, np.int64, 0),
+            "max_run": (True, np.int64, 0),
+            "max_run_value": (True, float, np.nan),
+            "stuck_readings": (True, np.int64, 0),
+            # Open (not yet complete) hour per device
+            "open_hour": (False, np.int64, -1),
+            "h_n": (True, float, 0.0),
+            "h_min": (True, float, np.inf),
+            "h_max": (True, float, -np.inf),
+            "h_sum": (True, float, 0.0),
+            "h_absdiff": (True, float, 0.0),
+            "h_ndiff": (True, float, 0.0),
+            # Completed hours
+            "hours": (True, np.int64, 0),
+            "flat_hours": (True, np.int64, 0),
+            "noisy_hours": (True, np.int64, 0),
+            "noise_sum": (True, float, 0.0),
+            # Running regression of hourly mean on time (days since t0)
+            "t0": (False, float, np.nan),
+            "r_n": (True, float, 0.0),
+            "r_x": (True, float, 0.0),
+            "r_y": (True, float, 0.0),
+            "r_xx": (True, float, 0.0),
+            "r_xy": (True, float, 0.0),
+        }
+        self._ensure(16)
+        self.rows_processed = 0
+
+    # -- state management -------------------------------------------------
+
+    def _ensure(self, capacity: int) -> None:
+        if capacity <= self._capacity:
+            return
+        new_capacity = max(capacity, self._capacity * 2)
+        for name, (per_param, dtype, fill) in self._fields.items():
+            shape = (new_capacity, len(PARAMETERS)) if per_param else (new_capacity,)
+            array = np.full(shape, fill, dtype=dtype)
+            if name in self._state:
+                array[: self._capacity] = self._state[name]
+            self._state[name] = array
+        self._capacity = new_capacity
+
+    def _row_ids(self, device_ids: List[str]) -> np.ndarray:
+        rows = np.empty(len(device_ids), dtype=np.int64)
+        for i, device_id in enumerate(device_ids):
+            row = self._rows.get(device_id)
+            if row is None:
+                row = len(self._device_ids)
+                self._rows[device_id] = row
+                self._device_ids.append(device_id)
+            rows[i] = row
+        self._ensure(len(self._device_ids))
+        return rows
+
+    # -- streaming pass ---------------------------------------------------
+
+    def add_page(self, readings: List[Dict[str, Any]]) -> None:
+        """Fold a page of readings (globally ordered by time) into the per-device state."""
+        if not readings:
+            return
+        s = self._state
+        dev = self._row_ids([r.get("device_id") or "unknown" for r in readings])
+        t = np.fromiter((record_timestamp(r) for r in readings), dtype=float, count=len(readings))
+        values = np.array([[np.nan if r.get(p) is None else r[p] for p in PARAMETERS] for r in readings], dtype=float)
+
+        # Group by device, keeping time order within each device
+        order = np.lexsort((t, dev))
+        dev, t, values = dev[order], t[order], values[order]
+        n = len(dev)
+        idx = np.arange(n)
+        seg_start = np.r_[True, dev[1:] != dev[:-1]]
+        seg_end = np.r_[dev[1:] != dev[:-1], True]
+        hour = (t // _HOUR).astype(np.int64)
+
+        np.add.at(s["readings"], dev, 1)
+        np.minimum.at(s["first_t"], dev, t)
+        np.maximum.at(s["last_t"], dev, t)
+        first_seen = np.isnan(s["t0"][dev]) & seg_start
+        s["t0"][dev[first_seen]] = t[first_seen]
+
+        # Previous value of each reading (carried over from the last page at segment starts)
+        prev = np.empty_like(values)
+        prev[1:] = values[:-1]
+        prev[seg_start] = s["last_value"][dev[seg_start]]
+        prev_hour = np.empty_like(hour)
+        prev_hour[1:] = hour[:-1]
+        prev_hour[seg_start] = s["open_hour"][dev[seg_start]]
+
+        self._stuck_runs(dev, values, prev, seg_start, seg_end, idx)
+        self._hourly(dev, hour, values, prev, prev_hour, seg_start, seg_end)
+
+        last = seg_end
+        s["last_value"][dev[last]] = np.where(np.isnan(values[last]), s["last_value"][dev[last]], values[last])
+        self.rows_processed += n
+
+    def _stuck_runs(self, dev, values, prev, seg_start, seg_end, idx) -> None:
+        s = self._state
+        same = values == prev  # NaN never equals anything
+        for j in range(len(PARAMETERS)):
+            eq = same[:, j]
+            breaks = ~eq | seg_start
+            # Runs continuing from the previous page start from the carried run length
+            offset = np.where(seg_start & eq, s["run"][dev, j], 0)
+            last_break = np.maximum.accumulate(np.where(breaks, idx, 0))
+            run = idx - last_break + 1 + offset[last_break]
+            run = np.where(np.isnan(values[:, j]), 0, run)
+
+            # Longest (earliest on ties) run per device in this page, and the value it was stuck at
+            best = np.lexsort((-idx, run, dev))
+            best = best[np.r_[dev[best][1:] != dev[best][:-1], True]]
+            improved = run[best] > s["max_run"][dev[best], j]
+            rows = dev[best][improved]
+            s["max_run"][rows, j] = run[best][improved]
+            s["max_run_value"][rows, j] = values[best][improved, j]
+
+            np.add.at(s["stuck_readings"][:, j], dev, (run >= self.stuck_min_run).astype(np.int64))
+            s["run"][dev[seg_end], j] = run[seg_end]
+
+    def _hourly(self, dev, hour, values, prev, prev_hour, seg_start, seg_end) -> None:
+        s = self._state
+        # One group per (device, hour); groups are contiguous after the device/time sort
+        new_group = seg_start | np.r_[True, hour[1:] != hour[:-1]]
+        group = np.cumsum(new_group) - 1
+        groups = int(group[-1]) + 1
+        g_dev = dev[new_group]
+        g_hour = hour[new_group]
+        present = ~np.isnan(values)
+        diff = np.abs(values - prev)
+        diff_ok = present & ~np.isnan(prev) & (hour == prev_hour)[:, None]
+
+        width = len(PARAMETERS)
+        g_n = np.zeros((groups, width))
+        g_sum = np.zeros((groups, width))
+        g_absdiff = np.zeros((groups, width))
+        g_ndiff = np.zeros((groups, width))
+        g_min = np.full((groups, width), np.inf)
+        g_max = np.full((groups, width), -np.inf)
+        np.add.at(g_n, group, present)
+        np.add.at(g_sum, group, np.where(present, values, 0.0))
+        np.add.at(g_absdiff, group, np.where(diff_ok, diff, 0.0))
+        np.add.at(g_ndiff, group, diff_ok)
+        np.minimum.at(g_min, group, np.where(present, values, np.inf))
+        np.maximum.at(g_max, group, np.where(present, values, -np.inf))
+
+        # Merge each device's first group with its open hour from the previous page
+        first_groups = np.flatnonzero(np.r_[True, g_dev[1:] != g_dev[:-1]])
+        cont = first_groups[s["open_hour"][g_dev[first_groups]] == g_hour[first_groups]]
+        rows = g_dev[cont]
+        g_n[cont] += s["h_n"][rows]
+        g_sum[cont] += s["h_sum"][rows]
+        g_absdiff[cont] += s["h_absdiff"][rows]
+        g_ndiff[cont] += s["h_ndiff"][rows]
+        g_min[cont] = np.minimum(g_min[cont], s["h_min"][rows])
+        g_max[cont] = np.maximum(g_max[cont], s["h_max"][rows])
+
+        # A device's previous open hour that did not continue into this page is complete
+        closed_rows = g_dev[first_groups][s["open_hour"][g_dev[first_groups]] != g_hour[first_groups]]
+        closed_rows = closed_rows[s["open_hour"][closed_rows] >= 0]
+        self._close_hours(
+            closed_rows, s["open_hour"][closed_rows], s["h_n"][closed_rows], s["h_sum"][closed_rows],
+            s["h_min"][closed_rows], s["h_max"][closed_rows], s["h_absdiff"][closed_rows], s["h_ndiff"][closed_rows],
+        )
+
+        # Every group except each device's last is complete; the last becomes the open hour
+        last_groups = np.flatnonzero(np.r_[g_dev[1:] != g_dev[:-1], True])
+        complete = np.ones(groups, dtype=bool)
+        complete[last_groups] = False
+        self._close_hours(
+            g_dev[complete], g_hour[complete], g_n[complete], g_sum[complete],
+            g_min[complete], g_max[complete], g_absdiff[complete], g_ndiff[complete],
+        )
+        rows = g_dev[last_groups]
+        s["open_hour"][rows] = g_hour[last_groups]
+        s["h_n"][rows] = g_n[last_groups]
+        s["h_sum"][rows] = g_sum[last_groups]
+        s["h_min"][rows] = g_min[last_groups]
+        s["h_max"][rows] = g_max[last_groups]
+        s["h_absdiff"][rows] = g_absdiff[last_groups]
+        s["h_ndiff"][rows] = g_ndiff[last_groups]
+
+    def _close_hours(self, rows, hours, n, sums, mins, maxs, absdiff, ndiff) -> None:
+        """Judge completed device-hours and fold them into the per-device totals."""
+        if len(rows) == 0:
+            return
+        s = self._state
+        judged = n >= self.min_per_hour
+        # Mean absolute successive difference / sqrt(2) estimates the noise sigma, ignoring slow trends
+        noise = np.divide(absdiff, ndiff, out=np.zeros_like(absdiff), where=ndiff > 0) / np.sqrt(2)
+        flat = judged & ((maxs - mins) < self._resolution)
+        noisy = judged & (noise > self._noise_limit)
+        np.add.at(s["hours"], rows, judged.astype(np.int64))
+        np.add.at(s["flat_hours"], rows, flat.astype(np.int64))
+        np.add.at(s["noisy_hours"], rows, noisy.astype(np.int64))
+        np.add.at(s["noise_sum"], rows, np.where(judged, noise, 0.0))
+
+        has = n > 0
+        mean = np.divide(sums, n, out=np.zeros_like(sums), where=has)
+        x = ((hours + 0.5) * _HOUR - s["t0"][rows])[:, None] / _DAY
+        x = np.broadcast_to(x, mean.shape)
+        np.add.at(s["r_n"], rows, has)
+        np.add.at(s["r_x"], rows, np.where(has, x, 0.0))
+        np.add.at(s["r_y"], rows, np.where(has, mean, 0.0))
+        np.add.at(s["r_xx"], rows, np.where(has, x * x, 0.0))
+        np.add.at(s["r_xy"], rows, np.where(has, x * mean, 0.0))
+
+    def finish(self) -> None:
+        """Close every device's open hour (call after the last page)."""
+        s = self._state
+        rows = np.flatnonzero(s["open_hour"][: len(self._device_ids)] >= 0)
+        self._close_hours(
+            rows, s["open_hour"][rows], s["h_n"][rows], s["h_sum"][rows],
+            s["h_min"][rows], s["h_max"][rows], s["h_absdiff"][rows], s["h_ndiff"][rows],
+        )
+        s["open_hour"][rows] = -1
+
+    # -- report -------------------------------------------------------------
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Per-device health rows (call after ``finish``)."""
+        s = self._state
+        devices = len(self._device_ids)
+        if devices == 0:
+            return []
+        r_n, r_x, r_y, r_xx, r_xy = (s[k][:devices] for k in ("r_n", "r_x", "r_y", "r_xx", "r_xy"))
+        denom = r_n * r_xx - r_x * r_x
+        slope_per_day = np.divide(r_n * r_xy - r_x * r_y, denom, out=np.zeros_like(denom), where=denom > 1e-9)
+        span_days = (s["last_t"][:devices] - s["first_t"][:devices]) / _DAY
+
+        analyzed_at = datetime.now(timezone.utc).isoformat()
+        rows = []
+        for row, device_id in enumerate(self._device_ids):
+            issues: List[str] = []
+            fault = False
+            parameters = {}
+            for j, param in enumerate(PARAMETERS):
+                name, _, _, drift_limit = _PARAM_INFO[param]
+                hours = int(s["hours"][row, j])
+                drift_30d = float(slope_per_day[row, j] * 30)
+                max_run = int(s["max_run"][row, j])
+                flat_hours = int(s["flat_hours"][row, j])
+                noisy_hours = int(s["noisy_hours"][row, j])
+                parameters[param] = {
+                    "drift_per_30_days": drift_30d,
+                    "max_stuck_run": max_run,
+                    "stuck_value": None if max_run < self.stuck_min_run else float(s["max_run_value"][row, j]),
+                    "stuck_readings": int(s["stuck_readings"][row, j]),
+                    "hours_analyzed": hours,
+                    "flatline_hours": flat_hours,
+                    "noisy_hours": noisy_hours,
+                    "avg_noise": float(s["noise_sum"][row, j] / hours) if hours else None,
+                }
+                if max_run >= self.stuck_min_run:
+                    issues.append(f"{name} stuck at {s['max_run_value'][row, j]:g} for {max_run} consecutive readings")
+                    fault = fault or max_run >= self.stuck_min_run * 10
+                if hours and flat_hours / hours > 0.25:
+                    issues.append(f"{name} flatlined in {flat_hours} of {hours} hours")
+                    fault = fault or flat_hours / hours > 0.5
+                if hours and noisy_hours / hours > 0.25:
+                    issues.append(f"{name} noisy in {noisy_hours} of {hours} hours")
+                if span_days[row] >= self.min_drift_days and abs(drift_30d) > drift_limit:
+                    issues.append(f"{name} drifting {drift_30d:+.2f} per 30 days")
+            rows.append({
+                "device_id": device_id,
+                "status": "fault" if fault else "warning" if issues else "ok",
+                "issues": issues,
+                "readings": int(s["readings"][row]),
+                "first_seen": datetime.fromtimestamp(s["first_t"][row], timezone.utc).isoformat(),
+                "last_seen": datetime.fromtimestamp(s["last_t"][row], timezone.utc).isoformat(),
+                "parameters": parameters,
+                "analyzed_at": analyzed_at,
+            })
+        return rows
+
+
+async def iter_reading_pages(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    device_id: Optional[str] = None,
+    page_size: int = 5000,
+) -> AsyncIterator[List[Dict[str, Any]]]:
+    """
+    Yield stored readings oldest first (by measurement time), one page at a time.
+
+    Readings are ordered by observed_at (measured_at, or created_at when the
+    device sent no time), so backfilled rows come in event-time order. Supabase
+    is paged with an (observed_at, id) keyset so each page is an index range
+    scan, however deep into the history it is.
+
+    Args:
+        since: Only readings at or after this time
+        until: Only readings before this time
+        device_id: Only this device's readings
+        page_size: Readings per page
+    """
+    from app.db import get_async_supabase, run_query
+    from app.main import readings_store
+
+    supabase = await get_async_supabase()
+    if not supabase:
+        since_ts = since.timestamp() if since else None
+        until_ts = until.timestamp() if until else None
+        out = [
+            r for r in readings_store
+            if (since_ts is None or record_timestamp(r) >= since_ts)
+            and (until_ts is None or record_timestamp(r) < until_ts)
+            and (device_id is None or r.get("device_id") == device_id)
+        ]
+        # Backfilled readings were appended after newer ones
+        out.sort(key=record_timestamp)
+        for i in range(0, len(out), page_size):
+            yield out[i:i + page_size]
+        return
+
+    cursor: Optional[Tuple[str, str]] = None
+    while True:
+        q = (
+            supabase.table("water_readings")
+            .select("id,device_id,ph,turbidity,tds,temperature,observed_at")
+            .order("observed_at")
+            .order("id")
+            .limit(page_size)
+        )
+        if cursor is not None:
+            observed_at, row_id = cursor
+            q = q.or_(f'observed_at.gt."{observed_at}",and(observed_at.eq."{observed_at}",id.gt.{row_id})')
+        elif since is not None:
+            q = q.gte("observed_at", since.isoformat())
+        if until is not None:
+            q = q.lt("observed_at", until.isoformat())
+        if device_id is not None:
+            q = q.eq("device_id", device_id)
+        rows = (await run_query(q)).data or []
+        if not rows:
+            return
+        yield [
+            {
+                "timestamp": x["observed_at"], "device_id": x["device_id"], "ph": x["ph"],
+                "turbidity": x["turbidity"], "tds": x["tds"], "temperature": x.get("temperature"),
+            }
+            for x in rows
+        ]
+        if len(rows) < page_size:
+            return
+        cursor = (rows[-1]["observed_at"], rows[-1]["id"])
+
+
+class SensorHealthStore:
+    """Latest sensor health rows, persisted to the sensor_health table when Supabase is configured."""
+
+    def __init__(self):
+        self.rows: Dict[str, Dict[str, Any]] = {}
+        self.analyzed_at: Optional[str] = None
+
+    async def save(self, rows: List[Dict[str, Any]]) -> None:
+        from app.db import get_async_supabase, run_query
+
+        self.rows = {row["device_id"]: row for row in rows}
+        self.analyzed_at = rows[0]["analyzed_at"] if rows else datetime.now(timezone.utc).isoformat()
+        supabase = await get_async_supabase()
+        if supabase and rows:
+            await run_query(supabase.table("sensor_health").upsert([
+                {
+                    "device_id": row["device_id"],
+                    "status": row["status"],
+                    "issues": row["issues"],
+                    "readings": row["readings"],
+                    "first_seen": row["first_seen"],
+                    "last_seen": row["last_seen"],
+                    "parameters": row["parameters"],
+                    "analyzed_at": row["analyzed_at"],
+                }
+                for row in rows
+            ]))
+
+    async def load(self) -> List[Dict[str, Any]]:
+        """Rows from the last analysis (read back from Supabase after a restart)."""
+        from app.db import get_async_supabase, run_query
+
+        if not self.rows:
+            supabase = await get_async_supabase()
+            if supabase:
+                data = (await run_query(supabase.table("sensor_health").select("*"))).data or []
+                self.rows = {row["device_id"]: row for row in data}
+                if data:
+                    self.analyzed_at = max(row["analyzed_at"] for row in data)
+        return list(self.rows.values())
+
+
+class SensorHealthJob:
+    """Periodic (and on-demand) sensor health analysis."""
+
+    def __init__(self, store: SensorHealthStore, interval: float = 86400.0, history_days: float = 90.0):
+        self.store = store
+        self.interval = interval
+        self.history_days = history_days
+        self.running = False
+        self.analyzing = False
+        self.task: Optional[asyncio.Task] = None
+        self.last_duration: Optional[float] = None
+        self.last_rows_processed = 0
+
+    async def run_once(self, history_days: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Stream the history once and write a fresh health table."""
+        if self.analyzing:
+            raise RuntimeError("Sensor health analysis is already running")
+        self.analyzing = True
+        started = time.perf_counter()
+        try:
+            days = self.history_days if history_days is None else history_days
+            since = datetime.now(timezone.utc) - timedelta(days=days)
+            analyzer = SensorHealthAnalyzer(
+                stuck_min_run=int(os.environ.get("SENSOR_STUCK_MIN_RUN", "60")),
+            )
+            async for page in iter_reading_pages(since):
+                analyzer.add_page(page)
+                # Let ingestion run between pages
+                await asyncio.sleep(0)
+            analyzer.finish()
+            rows = analyzer.report()
+            await self.store.save(rows)
+            self.last_rows_processed = analyzer.rows_processed
+            self.last_duration = time.perf_counter() - started
+            unhealthy = sum(1 for row in rows if row["status"] != "ok")
+            print(
+                f"[SENSOR HEALTH] Analyzed {analyzer.rows_processed} readings from {len(rows)} devices "
+                f"in {self.last_duration:.1f}s; {unhealthy} need attention"
+            )
+            return rows
+        finally:
+            self.analyzing = False
+
+    async def run_loop(self) -> None:
+        try:
+            # Only analyze at startup when there is no stored result to serve
+            if await self.store.load():
+                await asyncio.sleep(self.interval)
+        except Exception as e:
+            print(f"[SENSOR HEALTH] Could not load stored sensor health: {e}")
+        while self.running:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"[SENSOR HEALTH] Error analyzing sensor health: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self.running = True
+        self.task = asyncio.create_task(self.run_loop())
+
+    async def stop(self) -> None:
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "analyzing": self.analyzing,
+            "analyzed_at": self.store.analyzed_at,
+            "last_duration_seconds": self.last_duration,
+            "last_rows_processed": self.last_rows_processed,
+            "history_days": self.history_days,
+        }
+
+
+sensor_health_store = SensorHealthStore()
+sensor_health_job = SensorHealthJob(
+    sensor_health_store,
+    interval=float(os.environ.get("SENSOR_HEALTH_INTERVAL_HOURS", "24")) * 3600,
+    history_days=float(os.environ.get("SENSOR_HEALTH_HISTORY_DAYS", "90")),
+)
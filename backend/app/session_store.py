@@ -0,0 +1,204 @@
+"""
+Bounded chat session store.
+
+Keeps recent conversation turns per session in RAM with a max session
+count, idle TTL and LRU eviction. An optional SQLite backend persists
+every turn so evicted sessions can be reloaded on demand and history
+survives restarts. SQLite calls run on a single worker thread (in order),
+so a commit's fsync never stalls the event loop.
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+
+class _Session:
+    """Compact per-session state: a bounded deque of (user message, response) tuples."""
+
+    __slots__ = ("turns", "last_access", "chars")
+
+    def __init__(self, max_turns: int):
+        self.turns: deque = deque(maxlen=max_turns)
+        self.last_access = time.monotonic()
+        self.chars = 0
+
+
+class SessionStore:
+    """LRU + idle-TTL bounded store of chat turns, with optional SQLite spillover."""
+
+    def __init__(
+        self,
+        max_sessions: int = 1000,
+        idle_ttl_seconds: float = 3600.0,
+        max_turns: int = 5,
+        db_path: Optional[str] = None,
+    ):
+        """
+        Initialize the session store.
+
+        Args:
+            max_sessions: Sessions kept in RAM before the least recently used is evicted
+            idle_ttl_seconds: Sessions idle longer than this are evicted from RAM
+            max_turns: Conversation turns kept per session (2 messages each)
+            db_path: SQLite file for persistence; None keeps history in RAM only
+        """
+        self.max_sessions = max_sessions
+        self.idle_ttl = idle_ttl_seconds
+        self.max_turns = max_turns
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self.total_chars = 0
+        self.lru_evictions = 0
+        self.idle_evictions = 0
+        self.disk_loads = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if db_path:
+            # One thread: statements run in submission order and never concurrently
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="session-store")
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS chat_turns ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " session_id TEXT NOT NULL,"
+                " user_message TEXT NOT NULL,"
+                " response TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_chat_turns_session ON chat_turns (session_id, id)")
+            self._db.commit()
+
+    def _evict(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        self.total_chars -= session.chars
+
+    def _expire_idle(self, now: float) -> None:
+        # Sessions are ordered by last access, so expired ones are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_access < self.idle_ttl:
+                break
+            self._evict(session_id)
+            self.idle_evictions += 1
+
+    def _read_turns(self, session_id: str) -> List[Tuple[str, str]]:
+        rows = self._db.execute(
+            "SELECT user_message, response FROM chat_turns WHERE session_id = ? ORDER BY id DESC LIMIT ?",
+            (session_id, self.max_turns),
+        ).fetchall()
+        return list(reversed(rows))
+
+    def _write_turn(self, session_id: str, user_message: str, response: str, created_at: float) -> None:
+        self._db.execute(
+            "INSERT INTO chat_turns (session_id, user_message, response, created_at) VALUES (?, ?, ?, ?)",
+            (session_id, user_message, response, created_at),
+        )
+        # Only the last max_turns rows per session are ever read back
+        self._db.execute(
+            "DELETE FROM chat_turns WHERE session_id = ? AND id NOT IN "
+            "(SELECT id FROM chat_turns WHERE session_id = ? ORDER BY id DESC LIMIT ?)",
+            (session_id, session_id, self.max_turns),
+        )
+        self._db.commit()
+
+    async def _run_db(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def _get(self, session_id: str) -> _Session:
+        now = time.monotonic()
+        self._expire_idle(now)
+        session = self._sessions.get(session_id)
+        if session is None and self._db is not None:
+            turns = await self._run_db(self._read_turns, session_id)
+            # Another request may have loaded the session while this one waited
+            session = self._sessions.get(session_id)
+        else:
+            turns = []
+        if session is None:
+            session = _Session(self.max_turns)
+            if turns:
+                self.disk_loads += 1
+            for user_message, response in turns:
+                session.turns.append((user_message, response))
+                session.chars += len(user_message) + len(response)
+            self._sessions[session_id] = session
+            self.total_chars += session.chars
+            while len(self._sessions) > self.max_sessions:
+                self._evict(next(iter(self._sessions)))
+                self.lru_evictions += 1
+        else:
+            self._sessions.move_to_end(session_id)
+        session.last_access = now
+        return session
+
+    async def get_history(self, session_id: str, limit: int = 5) -> List[Dict[str, str]]:
+        """Return the last ``limit`` messages as ``{"role", "content"}`` dicts, oldest first."""
+        messages: List[Dict[str, str]] = []
+        for user_message, response in (await self._get(session_id)).turns:
+            messages.append({"role": "user", "content": user_message})
+            messages.append({"role": "assistant", "content": response})
+        return messages[-limit:] if limit else messages
+
+    async def append(self, session_id: str, user_message: str, response: str) -> None:
+        """Record a conversation turn."""
+        session = await self._get(session_id)
+        if len(session.turns) == session.turns.maxlen:
+            dropped_user, dropped_response = session.turns[0]
+            dropped = len(dropped_user) + len(dropped_response)
+            session.chars -= dropped
+            self.total_chars -= dropped
+        session.turns.append((user_message, response))
+        added = len(user_message) + len(response)
+        session.chars += added
+        self.total_chars += added
+        if self._db is not None:
+            await self._run_db(self._write_turn, session_id, user_message, response, time.time())
+
+    def close(self) -> None:
+        if self._executor is not None:
+            # Let queued writes finish first
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def get_metrics(self) -> dict:
+        return {
+            "sessions_in_memory": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "approx_message_bytes": self.total_chars,
+            "lru_evictions": self.lru_evictions,
+            "idle_evictions": self.idle_evictions,
+            "disk_loads": self.disk_loads,
+            "persistent": self._db is not None,
+        }
+
+
+_session_store: Optional[SessionStore] = None
+
+
+def get_session_store() -> SessionStore:
+    """Get the global chat session store."""
+    global _session_store
+    if _session_store is None:
+        _session_store = SessionStore(
+            max_sessions=int(os.environ.get("CHAT_SESSION_MAX", "1000")),
+            idle_ttl_seconds=float(os.environ.get("CHAT_SESSION_IDLE_TTL", "3600")),
+            db_path=os.environ.get("CHAT_SESSION_DB", "").strip() or None,
+        )
+    return _session_store
+
+
+def close_session_store() -> None:
+    """Close the SQLite backend of the global store, if one was created; the next get creates a fresh store."""
+    global _session_store
+    if _session_store is not None:
+        _session_store.close()
+        _session_store = None
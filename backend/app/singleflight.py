@@ -0,0 +1,58 @@
+"""
+Single-flight request coalescing.
+
+Concurrent callers asking for the same key share one in-flight backend call
+and its result, so N identical dashboard refreshes cost one query.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Deduplicates concurrent async calls by key."""
+
+    def __init__(self):
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run ``fn`` once per key while a call for that key is in flight.
+
+        Args:
+            key: Hashable identity of the call (query, params, data version)
+            fn: Zero-argument coroutine factory performing the backend call
+
+        Returns:
+            The (shared) result of ``fn``
+        """
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is None:
+            self.executions += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t, k=key: self._finish(k, t))
+        else:
+            self.coalesced += 1
+        # Shield so one cancelled caller doesn't cancel the call for everyone else
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        if not task.cancelled():
+            # Mark the exception as retrieved in case every waiter went away
+            task.exception()
+
+    def get_metrics(self) -> dict:
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+            "in_flight": len(self._in_flight),
+            "coalesce_ratio": self.coalesced / self.calls if self.calls else 0.0,
+        }
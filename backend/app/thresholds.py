@@ -0,0 +1,274 @@
+"""
+Threshold profiles per device or device group.
+
+Safe limits used to be module constants; different sites need different
+limits. A profile overrides some or all of the default limits and applies
+to listed devices and/or every device whose ID starts with a prefix
+(explicit device IDs win over prefixes, longer prefixes over shorter ones,
+and everything else uses the ``default`` profile).
+
+Profiles are stored in the threshold_profiles table (in memory without
+Supabase) and can be changed through the admin API without a restart. Each
+profile is compiled into an evaluator closure, cached per profile version,
+and the device -> profile resolution is memoized, so looking up a device's
+limits at ingest is a dict hit.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Built-in defaults (used when no stored profile overrides them)
+PH_MIN, PH_MAX = 6.0, 9.0
+TURBIDITY_MAX_NTU = 100.0
+TDS_MAX_PPM = 500.0
+
+DEFAULT_PROFILE = "default"
+
+# Limit columns of a profile: column -> (parameter, 0 = low / 1 = high)
+LIMIT_FIELDS = {
+    "ph_min": ("ph", 0),
+    "ph_max": ("ph", 1),
+    "turbidity_max": ("turbidity", 1),
+    "tds_max": ("tds", 1),
+}
+
+_UNITS = {"ph": "", "turbidity": " NTU", "tds": " ppm"}
+
+Limits = Dict[str, Tuple[Optional[float], Optional[float]]]
+
+
+class Breach(NamedTuple):
+    parameter: str
+    value: float
+    state: str  # "low" or "high"
+    low: Optional[float]
+    high: Optional[float]
+
+
+def _fmt_limit(value: float) -> str:
+    return f"{value:g}" if value != int(value) else f"{value:.1f}" if value < 100 else f"{value:.0f}"
+
+
+class CompiledProfile:
+    """Effective limits of a profile plus a specialized evaluator."""
+
+    __slots__ = ("name", "version", "limits", "evaluate")
+
+    def __init__(self, name: str, version: int, limits: Limits, evaluate: Callable[[Dict[str, Any]], List[Breach]]):
+        self.name = name
+        self.version = version
+        self.limits = limits
+        self.evaluate = evaluate
+
+    def low(self, parameter: str) -> Optional[float]:
+        return self.limits.get(parameter, (None, None))[0]
+
+    def high(self, parameter: str) -> Optional[float]:
+        return self.limits.get(parameter, (None, None))[1]
+
+    def state(self, parameter: str, value: Optional[float]) -> str:
+        """``low``, ``high`` or ``ok`` for a value of a parameter."""
+        low, high = self.limits.get(parameter, (None, None))
+        if value is None:
+            return "ok"
+        if low is not None and value < low:
+            return "low"
+        if high is not None and value > high:
+            return "high"
+        return "ok"
+
+    def describe(self, parameter: str) -> str:
+        """Safe range text, e.g. ``6.0-9.0`` or ``<500 ppm``."""
+        low, high = self.limits.get(parameter, (None, None))
+        unit = _UNITS.get(parameter, "")
+        if low is not None and high is not None:
+            return f"{_fmt_limit(low)}-{_fmt_limit(high)}{unit}"
+        if high is not None:
+            return f"<{_fmt_limit(high)}{unit}"
+        if low is not None:
+            return f">{_fmt_limit(low)}{unit}"
+        return "no limit"
+
+
+def compile_profile(name: str, version: int, limits: Limits) -> CompiledProfile:
+    """Build an evaluator that checks only the limits the profile defines."""
+    checks = tuple((param, low, high) for param, (low, high) in limits.items() if low is not None or high is not None)
+
+    def evaluate(record: Dict[str, Any]) -> List[Breach]:
+        breaches = []
+        for param, low, high in checks:
+            value = record.get(param)
+            if value is None:
+                continue
+            if low is not None and value < low:
+                breaches.append(Breach(param, value, "low", low, high))
+            elif high is not None and value > high:
+                breaches.append(Breach(param, value, "high", low, high))
+        return breaches
+
+    return CompiledProfile(name, version, limits, evaluate)
+
+
+class ThresholdRegistry:
+    """Stored threshold profiles, their compiled evaluators and the device -> profile mapping."""
+
+    def __init__(self):
+        # name -> stored row (limit columns, device_ids, device_prefix, updated_at)
+        self._profiles: Dict[str, Dict[str, Any]] = {}
+        self._versions: Dict[str, int] = {}
+        # (name, version) -> compiled profile
+        self._compiled: Dict[Tuple[str, int], CompiledProfile] = {}
+        self._by_device: Dict[str, str] = {}
+        self._prefixes: List[Tuple[str, str]] = []
+        # device -> compiled profile, cleared whenever profiles change
+        self._resolved: Dict[Optional[str], CompiledProfile] = {}
+        self.version = 0
+        self.reloads = 0
+        self._apply([])
+
+    # -- lookup -------------------------------------------------------------
+
+    def for_device(self, device_id: Optional[str]) -> CompiledProfile:
+        """Compiled profile of a device (memoized; None = default profile)."""
+        profile = self._resolved.get(device_id)
+        if profile is None:
+            profile = self._resolved[device_id] = self._compile(self._profile_name(device_id))
+        return profile
+
+    def default(self) -> CompiledProfile:
+        return self.for_device(None)
+
+    def _profile_name(self, device_id: Optional[str]) -> str:
+        if device_id is None:
+            return DEFAULT_PROFILE
+        name = self._by_device.get(device_id)
+        if name is not None:
+            return name
+        for prefix, name in self._prefixes:
+            if device_id.startswith(prefix):
+                return name
+        return DEFAULT_PROFILE
+
+    def _compile(self, name: str) -> CompiledProfile:
+        key = (name, self._versions[name])
+        compiled = self._compiled.get(key)
+        if compiled is None:
+            compiled = self._compiled[key] = compile_profile(name, key[1], self._effective_limits(name))
+        return compiled
+
+    def _effective_limits(self, name: str) -> Limits:
+        limits = {"ph": [PH_MIN, PH_MAX], "turbidity": [None, TURBIDITY_MAX_NTU], "tds": [None, TDS_MAX_PPM]}
+        # The stored default profile overrides the built-ins; other profiles override the default
+        for source in dict.fromkeys((DEFAULT_PROFILE, name)):
+            row = self._profiles.get(source, {})
+            for column, (param, side) in LIMIT_FIELDS.items():
+                if row.get(column) is not None:
+                    limits[param][side] = row[column]
+        return {param: (low, high) for param, (low, high) in limits.items()}
+
+    # -- changes ------------------------------------------------------------
+
+    def _apply(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Replace every profile and invalidate cached resolutions."""
+        profiles = {row["name"]: dict(row) for row in rows}
+        profiles.setdefault(DEFAULT_PROFILE, {"name": DEFAULT_PROFILE, "device_ids": [], "device_prefix": None})
+        self.version += 1
+        for name, row in profiles.items():
+            if self._profiles.get(name) != row or name not in self._versions:
+                self._versions[name] = self.version
+        # The default feeds every profile's effective limits
+        if self._profiles.get(DEFAULT_PROFILE) != profiles[DEFAULT_PROFILE]:
+            for name in profiles:
+                self._versions[name] = self.version
+        self._profiles = profiles
+        self._versions = {name: version for name, version in self._versions.items() if name in profiles}
+        self._by_device = {
+            device_id: name
+            for name, row in profiles.items()
+            for device_id in row.get("device_ids") or []
+        }
+        self._prefixes = sorted(
+            ((row["device_prefix"], name) for name, row in profiles.items() if row.get("device_prefix")),
+            key=lambda item: len(item[0]),
+            reverse=True,
+        )
+        # Drop evaluators of superseded versions
+        self._compiled = {key: c for key, c in self._compiled.items() if self._versions.get(key[0]) == key[1]}
+        self._resolved = {}
+
+    async def load(self) -> int:
+        """(Re)load profiles from storage; in-memory profiles are kept without Supabase."""
+        from app.db import get_async_supabase, run_query
+
+        supabase = await get_async_supabase()
+        if supabase:
+            rows = (await run_query(supabase.table("threshold_profiles").select("*"))).data or []
+            self._apply(rows)
+        else:
+            self._apply(self._profiles.values())
+        self.reloads += 1
+        return len(self._profiles)
+
+    async def upsert(self, name: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """Create or replace a profile and apply it at once."""
+        row = {
+            "name": name,
+            **{column: row.get(column) for column in LIMIT_FIELDS},
+            "device_ids": list(row.get("device_ids") or []),
+            "device_prefix": row.get("device_prefix") or None,
+            "updated_at": datetime.now(timezone.utc).isoformat(),
+        }
+        if row["ph_min"] is not None and row["ph_max"] is not None and row["ph_min"] >= row["ph_max"]:
+            raise ValueError("ph_min must be below ph_max")
+        if name == DEFAULT_PROFILE and (row["device_ids"] or row["device_prefix"]):
+            raise ValueError("The default profile applies to every device; it takes no device_ids or device_prefix")
+
+        from app.db import get_async_supabase, run_query
+
+        supabase = await get_async_supabase()
+        if supabase:
+            await run_query(supabase.table("threshold_profiles").upsert(row))
+        self._apply([*(r for n, r in self._profiles.items() if n != name), row])
+        return self.get(name)
+
+    async def delete(self, name: str) -> bool:
+        if name == DEFAULT_PROFILE:
+            raise ValueError("The default profile cannot be deleted")
+        if name not in self._profiles:
+            return False
+
+        from app.db import get_async_supabase, run_query
+
+        supabase = await get_async_supabase()
+        if supabase:
+            await run_query(supabase.table("threshold_profiles").delete().eq("name", name))
+        self._apply(r for n, r in self._profiles.items() if n != name)
+        return True
+
+    # -- reporting ------------------------------------------------------------
+
+    def get(self, name: str) -> Optional[Dict[str, Any]]:
+        row = self._profiles.get(name)
+        if row is None:
+            return None
+        compiled = self._compile(name)
+        return {
+            **row,
+            "version": compiled.version,
+            "effective_limits": {param: {"min": low, "max": high} for param, (low, high) in compiled.limits.items()},
+        }
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        return [self.get(name) for name in self._profiles]
+
+    def get_metrics(self) -> dict:
+        return {
+            "profiles": len(self._profiles),
+            "version": self.version,
+            "reloads": self.reloads,
+            "resolved_devices": len(self._resolved),
+            "compiled_evaluators": len(self._compiled),
+        }
+
+
+thresholds = ThresholdRegistry()
@@ -0,0 +1,130 @@
+"""
+Persistent WebSocket ingest channel for devices.
+
+Posting every reading over HTTP costs a TCP (and often Wi-Fi power) round
+of connection setup every 5 seconds per device. On ``/ws/ingest`` a device
+authenticates once and keeps the connection open, then streams frames:
+
+- a single reading: ``{"ph": 7.1, "turbidity": 3.2, "tds": 180, "temperature": 24.5}``
+- a batch: ``{"id": 42, "readings": [{...}, {...}]}`` (or a bare JSON array)
+
+``device_id`` may be omitted from readings when the connection was opened
+with ``?device_id=...``. Every frame is answered with an ack carrying its
+``id`` (when given), the number of readings accepted (including ones
+already stored under the same ``seq``) and the index and reason of each
+rejected one, so the device knows what to resend.
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+
+class IngestFrameError(ValueError):
+    """A frame that could not be parsed at all (answered with an error, the connection stays open)."""
+
+
+class DeviceIngestChannel:
+    """Authentication, frame parsing and counters of the device ingest WebSocket."""
+
+    def __init__(self, token: Optional[str] = None, max_batch: int = 100):
+        """
+        Initialize the channel.
+
+        Args:
+            token: Shared device token required to connect (None = open)
+            max_batch: Max readings accepted in one frame
+        """
+        self.token = token
+        self.max_batch = max_batch
+        self.connections = 0
+        self.connections_total = 0
+        self.auth_failures = 0
+        self.frames = 0
+        self.readings = 0
+        self.rejected = 0
+        self.bad_frames = 0
+
+    def authorized(self, websocket: WebSocket) -> bool:
+        """Check the device token from ``?token=``, ``X-Device-Token`` or ``Authorization: Bearer``."""
+        if not self.token:
+            return True
+        supplied = websocket.query_params.get("token") or websocket.headers.get("x-device-token")
+        auth = websocket.headers.get("authorization", "")
+        if not supplied and auth.lower().startswith("bearer "):
+            supplied = auth[7:].strip()
+        if supplied != self.token:
+            self.auth_failures += 1
+            return False
+        return True
+
+    def parse_frame(self, text: str, device_id: Optional[str]) -> Tuple[Any, List[Dict[str, Any]]]:
+        """
+        Split a frame into its id and reading payloads.
+
+        Args:
+            text: Frame text
+            device_id: Device the connection is bound to (filled into readings without one)
+
+        Returns:
+            (frame id or None, reading payloads)
+        """
+        self.frames += 1
+        try:
+            frame = json.loads(text)
+        except json.JSONDecodeError as e:
+            self.bad_frames += 1
+            raise IngestFrameError(f"Invalid JSON: {e}")
+        frame_id = None
+        if isinstance(frame, dict) and "readings" in frame:
+            frame_id = frame.get("id")
+            payloads = frame["readings"]
+        elif isinstance(frame, dict):
+            frame_id = frame.pop("id", None)
+            payloads = [frame]
+        else:
+            payloads = frame
+        if not isinstance(payloads, list):
+            self.bad_frames += 1
+            raise IngestFrameError("Expected a reading object, a list of readings or {\"readings\": [...]}")
+        if len(payloads) > self.max_batch:
+            self.bad_frames += 1
+            raise IngestFrameError(f"Too many readings in one frame ({len(payloads)} > {self.max_batch})")
+        if device_id is not None:
+            payloads = [
+                {**p, "device_id": p.get("device_id") or device_id} if isinstance(p, dict) else p
+                for p in payloads
+            ]
+        return frame_id, payloads
+
+    def ack(self, frame_id: Any, accepted: int, rejected: List[Dict[str, Any]], results: List[Dict[str, int]]) -> Dict[str, Any]:
+        self.readings += accepted
+        self.rejected += len(rejected)
+        return {
+            "type": "ack",
+            "id": frame_id,
+            "accepted": accepted,
+            "rejected": rejected,
+            "duplicates": sum(1 for r in results if r.get("duplicate")),
+            "alerts": sum(r["time_based_alerts"] for r in results),
+            "anomalies": sum(r["anomalies"] for r in results),
+        }
+
+    def get_metrics(self) -> dict:
+        return {
+            "connections": self.connections,
+            "connections_total": self.connections_total,
+            "auth_failures": self.auth_failures,
+            "frames": self.frames,
+            "bad_frames": self.bad_frames,
+            "readings": self.readings,
+            "rejected": self.rejected,
+        }
+
+
+ingest_channel = DeviceIngestChannel(
+    token=os.environ.get("DEVICE_INGEST_TOKEN") or None,
+    max_batch=int(os.environ.get("WS_INGEST_MAX_BATCH", "100")),
+)
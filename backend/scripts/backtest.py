@@ -0,0 +1,94 @@
+"""
+Replay water readings through candidate alert rule configurations.
+
+Usage:
+    python scripts/backtest.py --csv water_readings.csv
+    python scripts/backtest.py --start 2025-01-01 --end 2026-01-01
+    python scripts/backtest.py --csv water_readings.csv \\
+        --rule '{"name": "slow", "alert_duration_seconds": 600}' \\
+        --rule '{"name": "loose", "turbidity_max": 120, "clear_seconds": 120}'
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+from datetime import datetime
+from pathlib import Path
+
+# Add parent directory to path to import app modules
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.backtest import ENGINES, RuleConfig, iter_csv_pages, run_backtest
+from app.thresholds import LIMIT_FIELDS
+
+
+def parse_rule(spec: str) -> RuleConfig:
+    rule = json.loads(spec)
+    limits = {column: rule.pop(column) for column in list(rule) if column in LIMIT_FIELDS}
+    return RuleConfig(limits=limits, **rule)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Backtest alert rules against historical water readings",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Rules are JSON objects with any of: name, alert_duration_seconds, hysteresis
+(e.g. {"turbidity": 8}), clear_seconds, flap_window_seconds, flap_threshold,
+ph_min, ph_max, turbidity_max, tds_max. Unset fields use the live settings
+(ALERT_* environment variables and the stored threshold profiles).
+
+Without --csv the readings stored in Supabase (or the in-memory store) are replayed.
+        """,
+    )
+    parser.add_argument("--csv", type=str, help="Readings CSV exported from /api/export/csv")
+    parser.add_argument("--start", type=str, help="Only readings at or after this ISO date/time")
+    parser.add_argument("--end", type=str, help="Only readings before this ISO date/time")
+    parser.add_argument("--device-id", type=str, help="Only this device's readings")
+    parser.add_argument("--rule", action="append", default=[], help="Candidate rule configuration as JSON (repeatable)")
+    parser.add_argument("--engine", choices=ENGINES, default="vectorized", help="Replay engine (default: vectorized)")
+    parser.add_argument("--events", type=int, default=20, help="Alert events listed per configuration (default: 20)")
+
+    args = parser.parse_args()
+
+    pages = None
+    if args.csv:
+        pages = iter_csv_pages(Path(args.csv).read_text())
+    configs = [parse_rule(spec) for spec in args.rule]
+
+    result = asyncio.run(run_backtest(
+        configs,
+        start=datetime.fromisoformat(args.start) if args.start else None,
+        end=datetime.fromisoformat(args.end) if args.end else None,
+        device_id=args.device_id,
+        pages=pages,
+        engine=args.engine,
+        max_events=args.events,
+    ))
+
+    print("=" * 70)
+    print(
+        f"Replayed {result['readings']} readings from {result['devices']} device(s) "
+        f"in {result['elapsed_seconds']}s ({result['readings_per_second']} readings/s)"
+    )
+    print("=" * 70)
+    for report in result["results"]:
+        config = report["config"]
+        print(f"Rule: {config['name'] or 'unnamed'} {json.dumps({k: v for k, v in config.items() if k != 'name'})}")
+        print(
+            f"  Notifications: {report['notifications']} "
+            f"(alerts: {report['alerts']}, flapping: {report['flap_alerts']}, suppressed: {report['suppressed']})"
+        )
+        print(f"  By parameter: {report['by_parameter']}")
+        print(f"  First/last alert: {report['first_alert']} / {report['last_alert']}")
+        for event in report["events"]:
+            print(
+                f"    {event['timestamp']} {event['device_id']} {event['parameter']}={event['value']} "
+                f"after {int(event['breach_seconds'])}s ({event['kind']})"
+            )
+        print("-" * 70)
+
+
+if __name__ == "__main__":
+    main()
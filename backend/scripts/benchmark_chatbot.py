@@ -0,0 +1,366 @@
+"""
+Chatbot Load Benchmark
+
+Starts the backend in-process with the fake LLM (no Azure credits needed),
+drives N concurrent chat sessions against /api/chatbot and /api/chatbot/stream,
+and reports time-to-first-byte, latency percentiles, throughput and
+event-loop lag of the server. Results are written as JSON so runs can be
+compared across commits.
+
+Storage is forced to in-memory and the response cache is disabled unless
+--with-cache is given, so every non-factual question reaches the (fake) LLM.
+
+Usage:
+    python scripts/benchmark_chatbot.py
+    python scripts/benchmark_chatbot.py --sessions 50 --turns 4 --token-latency 0.01
+    python scripts/benchmark_chatbot.py --output results.json --compare baseline.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+# Questions cycled through by each session: LLM answers, tool-calling
+# trend questions and factual questions served by the fast path
+QUESTIONS = [
+    "How can I reduce the TDS in my drinking water?",
+    "Why does my water look cloudy and what should I do?",
+    "Show me the pH trend over time",
+    "What is the current pH?",
+    "Is it safe to drink the water from my tank?",
+    "Compare the turbidity history with the TDS history",
+]
+
+SAMPLE_READINGS = [
+    {"device_id": "bench_1", "ph": 7.1, "tds": 320.0, "turbidity": 12.0, "temperature": 24.0},
+    {"device_id": "bench_2", "ph": 5.6, "tds": 610.0, "turbidity": 130.0, "temperature": 26.5},
+    {"device_id": "bench_1", "ph": 7.3, "tds": 340.0, "turbidity": 15.0, "temperature": 24.2},
+]
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Summarize samples (seconds) as milliseconds."""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def pick(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        "mean": statistics.fmean(ordered) * 1000,
+        "p50": pick(0.50),
+        "p90": pick(0.90),
+        "p99": pick(0.99),
+        "max": ordered[-1] * 1000,
+    }
+
+
+class ServerThread:
+    """Runs the FastAPI app under uvicorn on its own event loop in a background thread."""
+
+    def __init__(self, port: int):
+        import uvicorn
+
+        from app.main import app
+
+        self.config = uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="on")
+        self.server = uvicorn.Server(self.config)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve())
+
+    def start(self, timeout: float = 30.0) -> None:
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("Backend failed to start")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+class LoopLagProbe:
+    """Measures how late a periodic timer fires on the server's event loop."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._running = True
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._running:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - expected))
+
+    def stop(self) -> None:
+        self._running = False
+
+
+async def _timed_request(client: httpx.AsyncClient, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """POST and time the first body byte and the full response."""
+    started = time.perf_counter()
+    first_byte: Optional[float] = None
+    body = bytearray()
+    async with client.stream("POST", path, json=payload) as response:
+        async for chunk in response.aiter_bytes():
+            if chunk and first_byte is None:
+                first_byte = time.perf_counter()
+            body.extend(chunk)
+        status = response.status_code
+    finished = time.perf_counter()
+    return {
+        "ok": status == 200,
+        "ttfb": (first_byte or finished) - started,
+        "total": finished - started,
+        "bytes": len(body),
+    }
+
+
+async def run_endpoint(base_url: str, path: str, sessions: int, turns: int, tag: str) -> Dict[str, Any]:
+    """Drive ``sessions`` concurrent sessions, each sending ``turns`` sequential messages."""
+    results: List[Dict[str, Any]] = []
+    errors: List[str] = []
+    limits = httpx.Limits(max_connections=sessions, max_keepalive_connections=sessions)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120.0, limits=limits) as client:
+
+        async def session(n: int) -> None:
+            for turn in range(turns):
+                question = QUESTIONS[(n + turn) % len(QUESTIONS)]
+                payload = {"message": question, "session_id": f"{tag}-{n}"}
+                try:
+                    result = await _timed_request(client, path, payload)
+                    if result["ok"]:
+                        results.append(result)
+                    else:
+                        errors.append(f"HTTP error on {path}")
+                except Exception as e:
+                    errors.append(f"{type(e).__name__}: {e}")
+
+        started = time.perf_counter()
+        await asyncio.gather(*(session(n) for n in range(sessions)))
+        duration = time.perf_counter() - started
+
+    return {
+        "requests": len(results) + len(errors),
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "duration_s": duration,
+        "throughput_rps": len(results) / duration if duration > 0 else 0.0,
+        "ttfb_ms": percentiles([r["ttfb"] for r in results]),
+        "latency_ms": percentiles([r["total"] for r in results]),
+    }
+
+
+async def seed(base_url: str) -> None:
+    """Post sample readings and warm up the chatbot (its modules are imported on first use)."""
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+        for reading in SAMPLE_READINGS:
+            (await client.post("/api/readings", json=reading)).raise_for_status()
+        warmup = {"message": "Hello, how is my water?", "session_id": "warmup"}
+        (await client.post("/api/chatbot", json=warmup)).raise_for_status()
+
+
+async def fetch_metrics(base_url: str) -> Dict[str, Any]:
+    async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+        metrics = (await client.get("/api/metrics")).json()
+    keys = ("chatbot_routes", "chatbot_stream", "llm_gateway", "chat_context", "chatbot_response_cache")
+    return {key: metrics.get(key) for key in keys}
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    """Start the backend with the fake LLM, run the load and collect results."""
+    # Must be set before the app modules are imported
+    os.environ["CHATBOT_LLM_BACKEND"] = "fake"
+    os.environ["CHATBOT_FAKE_TOKEN_LATENCY"] = str(args.token_latency)
+    os.environ["CHATBOT_FAKE_FIRST_TOKEN_LATENCY"] = str(args.first_token_latency)
+    os.environ["INIT_SAMPLE_DATA"] = "true"
+    os.environ["DUMMY_GENERATOR_ENABLED"] = "false"
+    if not args.with_cache:
+        os.environ["CHATBOT_CACHE_SIZE"] = "0"
+    for name in ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "SUPABASE_ANON_KEY", "CHAT_SESSION_DB"):
+        os.environ.pop(name, None)
+
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    endpoints = {
+        "chatbot": "/api/chatbot",
+        "stream": "/api/chatbot/stream",
+    }
+    if args.endpoint != "both":
+        endpoints = {args.endpoint: endpoints[args.endpoint]}
+
+    # The backend logs every chat turn; keep the report readable unless asked
+    quiet = contextlib.redirect_stdout(io.StringIO()) if not args.verbose else contextlib.nullcontext()
+    with quiet:
+        server = ServerThread(port)
+        server.start()
+        probe = LoopLagProbe()
+        probe_future = asyncio.run_coroutine_threadsafe(probe.run(), server.loop)
+        try:
+            asyncio.run(seed(base_url))
+            del probe.samples[:]
+            results: Dict[str, Any] = {}
+            for name, path in endpoints.items():
+                lag_start = len(probe.samples)
+                results[name] = asyncio.run(run_endpoint(base_url, path, args.sessions, args.turns, name))
+                results[name]["event_loop_lag_ms"] = percentiles(probe.samples[lag_start:])
+            server_metrics = asyncio.run(fetch_metrics(base_url))
+        finally:
+            probe.stop()
+            probe_future.result(timeout=5)
+            server.stop()
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "config": {
+            "sessions": args.sessions,
+            "turns": args.turns,
+            "token_latency": args.token_latency,
+            "first_token_latency": args.first_token_latency,
+            "response_cache": args.with_cache,
+        },
+        "endpoints": results,
+        "event_loop_lag_ms": percentiles(probe.samples),
+        "server_metrics": server_metrics,
+    }
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    print("=" * 70)
+    print(f"Chatbot benchmark ({report['commit'] or 'unknown commit'})")
+    config = report["config"]
+    print(
+        f"  {config['sessions']} sessions x {config['turns']} turns, "
+        f"token latency {config['token_latency'] * 1000:.0f}ms, "
+        f"cache {'on' if config['response_cache'] else 'off'}"
+    )
+    print("=" * 70)
+    for name, result in report["endpoints"].items():
+        print(f"\n/{name}: {result['requests']} requests, {result['errors']} errors, {result['throughput_rps']:.1f} req/s")
+        for metric in ("ttfb_ms", "latency_ms", "event_loop_lag_ms"):
+            values = result[metric]
+            if not values:
+                continue
+            line = f"  {metric:<18} p50 {values['p50']:8.1f}  p90 {values['p90']:8.1f}  p99 {values['p99']:8.1f}  max {values['max']:8.1f}"
+            previous = (baseline or {}).get("endpoints", {}).get(name, {}).get(metric, {})
+            if previous.get("p50"):
+                line += f"  (p50 {(values['p50'] / previous['p50'] - 1) * 100:+.0f}% vs baseline)"
+            print(line)
+        for sample in result["error_samples"]:
+            print(f"  error: {sample}")
+    routes = (report.get("server_metrics") or {}).get("chatbot_routes") or {}
+    if routes:
+        print("\nRoutes: " + ", ".join(f"{route}={data['count']}" for route, data in sorted(routes.items())))
+
+
+def main():
+    """Main entry point."""
+    parser = argparse.ArgumentParser(
+        description="Benchmark the chatbot endpoints with a fake LLM",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Default: 20 sessions x 3 turns against both endpoints
+  python scripts/benchmark_chatbot.py
+
+  # Heavier load with a slower simulated model
+  python scripts/benchmark_chatbot.py --sessions 100 --turns 5 --token-latency 0.03
+
+  # Save results and compare against a previous run
+  python scripts/benchmark_chatbot.py --output after.json --compare before.json
+        """,
+    )
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent chat sessions (default: 20)")
+    parser.add_argument("--turns", type=int, default=3, help="Sequential messages per session (default: 3)")
+    parser.add_argument(
+        "--token-latency",
+        type=float,
+        default=0.02,
+        help="Fake LLM delay per streamed token in seconds (default: 0.02)",
+    )
+    parser.add_argument(
+        "--first-token-latency",
+        type=float,
+        default=0.2,
+        help="Fake LLM delay before the first token in seconds (default: 0.2)",
+    )
+    parser.add_argument(
+        "--endpoint",
+        choices=["chatbot", "stream", "both"],
+        default="both",
+        help="Endpoint(s) to benchmark (default: both)",
+    )
+    parser.add_argument("--with-cache", action="store_true", help="Keep the chatbot response cache enabled")
+    parser.add_argument(
+        "--output",
+        type=str,
+        default="chatbot_benchmark.json",
+        help="Where to write the JSON results (default: chatbot_benchmark.json)",
+    )
+    parser.add_argument("--compare", type=str, help="Previous results JSON to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show backend logs during the run")
+
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    report = run_benchmark(args)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report, baseline)
+    print(f"\nResults saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
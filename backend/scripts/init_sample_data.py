@@ -8,13 +8,14 @@ Usage:
 """
 
 import argparse
+import asyncio
 import sys
 from pathlib import Path
 
 # Add parent directory to path to import app modules
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.init_data import initialize_sample_data
+from app.init_data import run_standalone
 
 
 def main():
@@ -80,13 +81,13 @@ Examples:
     print("=" * 70)
     print()
 
-    result = initialize_sample_data(
+    result = asyncio.run(run_standalone(
         readings_count=args.readings,
         alerts_count=args.alerts,
         device_id=args.device_id,
         hours_back=args.hours,
         force=args.force,
-    )
+    ))
 
     if result["success"]:
         print()
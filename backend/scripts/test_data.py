@@ -2,24 +2,31 @@
 Quick test script to check if sample data exists and initialize if needed.
 """
 
+import asyncio
 import sys
 from pathlib import Path
 
 # Add parent directory to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
+from app.db import close_async_supabase
 from app.init_data import initialize_sample_data
 from app.main import readings_store, alerts_store, _get_readings, _get_latest, _get_alerts
 
-def main():
+async def _fetch_current():
+    return await asyncio.gather(
+        _get_readings(limit=5, device_id=None),
+        _get_latest(None),
+        _get_alerts(limit=5),
+    )
+
+async def _main():
     print("=" * 70)
     print("Testing Sample Data")
     print("=" * 70)
     
     # Check current data
-    readings = _get_readings(limit=5, device_id=None)
-    latest = _get_latest(None)
-    alerts = _get_alerts(limit=5)
+    readings, latest, alerts = await _fetch_current()
     
     print(f"\nCurrent Status:")
     print(f"  Readings in store: {len(readings_store)}")
@@ -39,7 +46,7 @@ def main():
     
     if len(readings) == 0:
         print("\n⚠️  No data found! Initializing sample data...")
-        result = initialize_sample_data(force=True)
+        result = await initialize_sample_data(force=True)
         if result["success"]:
             print(f"✅ Successfully initialized:")
             print(f"   - {result['readings_inserted']} readings")
@@ -53,5 +60,14 @@ def main():
     
     print("=" * 70)
 
+def main():
+    async def run():
+        try:
+            await _main()
+        finally:
+            await close_async_supabase()
+
+    asyncio.run(run())
+
 if __name__ == "__main__":
     main()
@@ -5,11 +5,32 @@ CREATE TABLE IF NOT EXISTS public.water_readings (
   turbidity DOUBLE PRECISION NOT NULL,
   tds DOUBLE PRECISION NOT NULL,
   temperature DOUBLE PRECISION,
-  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+  seq BIGINT,
+  boot_id BIGINT,
+  measured_at TIMESTAMPTZ,
+  reading_key TEXT,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  observed_at TIMESTAMPTZ GENERATED ALWAYS AS (COALESCE(measured_at, created_at)) STORED
 );
 
+-- Device sequence numbers and timestamps (for tables created before they existed)
+ALTER TABLE public.water_readings ADD COLUMN IF NOT EXISTS seq BIGINT;
+ALTER TABLE public.water_readings ADD COLUMN IF NOT EXISTS boot_id BIGINT;
+ALTER TABLE public.water_readings ADD COLUMN IF NOT EXISTS measured_at TIMESTAMPTZ;
+ALTER TABLE public.water_readings ADD COLUMN IF NOT EXISTS reading_key TEXT;
+-- Event time: the device's measurement time, else the time the reading arrived
+ALTER TABLE public.water_readings ADD COLUMN IF NOT EXISTS observed_at TIMESTAMPTZ
+  GENERATED ALWAYS AS (COALESCE(measured_at, created_at)) STORED;
+
 CREATE INDEX IF NOT EXISTS idx_water_readings_device ON public.water_readings (device_id);
 CREATE INDEX IF NOT EXISTS idx_water_readings_created ON public.water_readings (created_at DESC);
+-- Keyset pagination (observed_at, id) for history scans such as the sensor health analysis
+CREATE INDEX IF NOT EXISTS idx_water_readings_observed_id ON public.water_readings (observed_at, id);
+-- Idempotent ingest: a retried reading is stored once. reading_key is set by the
+-- backend for readings with a seq (device/boot/seq, or device/measurement time/seq);
+-- rows without one never conflict (NULLs are distinct).
+DROP INDEX IF EXISTS public.uq_water_readings_device_measured_seq;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_water_readings_reading_key ON public.water_readings (reading_key);
 
 CREATE TABLE IF NOT EXISTS public.water_alerts (
   id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
@@ -24,11 +45,42 @@ CREATE TABLE IF NOT EXISTS public.water_alerts (
 CREATE INDEX IF NOT EXISTS idx_water_alerts_device ON public.water_alerts (device_id);
 CREATE INDEX IF NOT EXISTS idx_water_alerts_created ON public.water_alerts (created_at DESC);
 
+CREATE TABLE IF NOT EXISTS public.sensor_health (
+  device_id TEXT PRIMARY KEY,
+  status TEXT NOT NULL,
+  issues JSONB NOT NULL DEFAULT '[]',
+  readings BIGINT NOT NULL DEFAULT 0,
+  first_seen TIMESTAMPTZ,
+  last_seen TIMESTAMPTZ,
+  parameters JSONB NOT NULL DEFAULT '{}',
+  analyzed_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Per-device / device-group limits; unset limits inherit the 'default' profile
+CREATE TABLE IF NOT EXISTS public.threshold_profiles (
+  name TEXT PRIMARY KEY,
+  ph_min DOUBLE PRECISION,
+  ph_max DOUBLE PRECISION,
+  turbidity_max DOUBLE PRECISION,
+  tds_max DOUBLE PRECISION,
+  device_ids TEXT[] NOT NULL DEFAULT '{}',
+  device_prefix TEXT,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
 ALTER TABLE public.water_readings ENABLE ROW LEVEL SECURITY;
 ALTER TABLE public.water_alerts ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.sensor_health ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.threshold_profiles ENABLE ROW LEVEL SECURITY;
 
 CREATE POLICY "Allow all for service role" ON public.water_readings
   FOR ALL USING (true);
 
 CREATE POLICY "Allow all for service role" ON public.water_alerts
   FOR ALL USING (true);
+
+CREATE POLICY "Allow all for service role" ON public.sensor_health
+  FOR ALL USING (true);
+
+CREATE POLICY "Allow all for service role" ON public.threshold_profiles
+  FOR ALL USING (true);
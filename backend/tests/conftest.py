@@ -0,0 +1,43 @@
+"""
+Shared fixtures: the backend in-process with the fake LLM and in-memory storage.
+
+The environment is set here, before any app module is imported, because the
+app reads its configuration at import time.
+"""
+
+import contextlib
+import io
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+FIRST_TOKEN_LATENCY = 0.2
+TOKEN_LATENCY = 0.01
+
+os.environ["CHATBOT_LLM_BACKEND"] = "fake"
+os.environ["CHATBOT_FAKE_TOKEN_LATENCY"] = str(TOKEN_LATENCY)
+os.environ["CHATBOT_FAKE_FIRST_TOKEN_LATENCY"] = str(FIRST_TOKEN_LATENCY)
+os.environ["CHATBOT_CACHE_SIZE"] = "0"
+os.environ["INIT_SAMPLE_DATA"] = "true"
+os.environ["DUMMY_GENERATOR_ENABLED"] = "false"
+for name in ("SUPABASE_URL", "SUPABASE_SERVICE_ROLE_KEY", "SUPABASE_ANON_KEY", "CHAT_SESSION_DB"):
+    os.environ.pop(name, None)
+
+
+@pytest.fixture(scope="session")
+def base_url():
+    """URL of the backend running under uvicorn in a background thread."""
+    from scripts.benchmark_chatbot import ServerThread, _free_port
+
+    port = _free_port()
+    with contextlib.redirect_stdout(io.StringIO()):
+        server = ServerThread(port)
+        server.start()
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.stop()
@@ -0,0 +1,39 @@
+"""
+Anomaly detector: no false drift alerts on stationary noise once a device
+is armed, while a real level shift is still found.
+"""
+
+import numpy as np
+
+from app.anomaly import AnomalyDetector
+
+
+def _reading(rng, ph=7.0, tds=300.0, turbidity=10.0):
+    return {
+        "device_id": "dev",
+        "ph": ph + rng.normal(0, 0.1),
+        "tds": tds + rng.normal(0, 15),
+        "turbidity": turbidity + rng.normal(0, 1),
+    }
+
+
+def test_stationary_noise_raises_no_anomalies():
+    rng = np.random.default_rng(42)
+    for _ in range(50):
+        detector = AnomalyDetector()
+        for i in range(60):
+            assert detector.observe(_reading(rng), now=i) == []
+
+
+def test_level_shift_is_detected():
+    rng = np.random.default_rng(7)
+    detector = AnomalyDetector()
+    for i in range(100):
+        detector.observe(_reading(rng), now=i)
+
+    found = []
+    for i in range(100, 130):
+        found += detector.observe(_reading(rng, ph=7.3), now=i)
+
+    assert any(a["parameter"] == "ph" and a["kind"] in ("shift_up", "spike") for a in found)
+    assert all(a["parameter"] == "ph" for a in found)
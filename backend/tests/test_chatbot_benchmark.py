@@ -0,0 +1,73 @@
+"""
+Chatbot latency with the fake LLM: /api/chatbot answers in one body, while
+/api/chatbot/stream sends the first token as soon as the model produces it
+and the rest of the answer in chunks.
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from conftest import FIRST_TOKEN_LATENCY
+from scripts.benchmark_chatbot import _timed_request, run_endpoint, seed
+
+# Answered by the (fake) LLM rather than the factual fast path
+QUESTION = "How can I reduce the TDS in my drinking water?"
+
+
+@pytest.fixture(scope="module")
+def seeded(base_url):
+    asyncio.run(seed(base_url))
+    return base_url
+
+
+async def _post(base_url, path, session_id):
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+        return await _timed_request(client, path, {"message": QUESTION, "session_id": session_id})
+
+
+async def _stream_events(base_url, session_id):
+    """SSE events of one streamed answer, in arrival order."""
+    events = []
+    async with httpx.AsyncClient(base_url=base_url, timeout=60.0) as client:
+        payload = {"message": QUESTION, "session_id": session_id}
+        async with client.stream("POST", "/api/chatbot/stream", json=payload) as response:
+            assert response.status_code == 200
+            async for line in response.aiter_lines():
+                if line.startswith("data: "):
+                    events.append(line[len("data: "):])
+    return events
+
+
+def test_stream_first_token_latency(seeded):
+    result = asyncio.run(_post(seeded, "/api/chatbot/stream", "test-stream-ttfb"))
+
+    assert result["ok"]
+    # The first token arrives about when the model emits it ...
+    assert result["ttfb"] < FIRST_TOKEN_LATENCY + 0.5
+    # ... well before the answer is complete
+    assert result["ttfb"] < 0.7 * result["total"]
+
+
+def test_stream_is_chunked(seeded):
+    events = asyncio.run(_stream_events(seeded, "test-stream-chunks"))
+
+    assert events[-1] == "[DONE]"
+    assert len(events[:-1]) > 5
+
+
+def test_non_streaming_waits_for_full_answer(seeded):
+    result = asyncio.run(_post(seeded, "/api/chatbot", "test-chatbot"))
+
+    assert result["ok"]
+    assert result["ttfb"] >= FIRST_TOKEN_LATENCY
+    assert result["ttfb"] > 0.9 * result["total"]
+
+
+@pytest.mark.parametrize("path", ["/api/chatbot", "/api/chatbot/stream"])
+def test_concurrent_sessions(seeded, path):
+    result = asyncio.run(run_endpoint(seeded, path, sessions=5, turns=2, tag=f"test-{path.rsplit('/', 1)[-1]}"))
+
+    assert result["errors"] == 0, result["error_samples"]
+    assert result["requests"] == 10
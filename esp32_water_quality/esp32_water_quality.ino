@@ -4,6 +4,7 @@
 #include <DallasTemperature.h>
 #include <WiFi.h>
 #include <HTTPClient.h>
+#include <time.h>
 // ----- Pins -----
 #define DS18B20_PIN    13
 #define TURBIDITY_PIN  32
@@ -29,6 +30,57 @@ const char* WIFI_PASSWORD = "12345678";
 // ----- Backend: replace 192.168.1.100 with your laptop's IP (run ipconfig on laptop). ESP32 cannot use "localhost". -----
 const char* API_URL       = "http://192.168.1.100:8000/api/readings";
 
+// ----- Binary payload: set to 1 to send each reading as a 28-byte binary record (see backend
+// app/binary_ingest.py) to /api/readings/binary, or as a binary frame on the WebSocket, instead of JSON. -----
+#define USE_BINARY_INGEST 0
+const char*    API_BINARY_URL = "http://192.168.1.100:8000/api/readings/binary";
+const uint16_t DEVICE_INDEX   = 1;   // Stored as device_id "esp32_1"
+
+struct __attribute__((packed)) BinaryReading {
+  uint16_t device;
+  uint32_t epoch;   // 0 = clock not synced
+  float ph;
+  float turbidity;
+  float tds;
+  float temperature;
+};
+
+// Header "JM", version 1, flags 0, count 1 (little-endian, like the ESP32 itself)
+size_t packReading(uint8_t* buf, float temp, float ph, float turbidityNtu, float tds) {
+  const uint8_t header[6] = {'J', 'M', 1, 0, 1, 0};
+  time_t now = time(nullptr);
+  BinaryReading rec = {DEVICE_INDEX, (uint32_t)(now > 1577836800 ? now : 0), ph, turbidityNtu, tds, temp};
+  memcpy(buf, header, sizeof(header));
+  memcpy(buf + sizeof(header), &rec, sizeof(rec));
+  return sizeof(header) + sizeof(rec);
+}
+
+// ----- Persistent ingest: set to 1 to stream readings over one WebSocket to /ws/ingest instead of
+// opening a new HTTP connection per reading (needs the "WebSockets" library by Markus Sattler).
+// Falls back to HTTP POST while the WebSocket is not connected. -----
+#define USE_WS_INGEST 0
+#if USE_WS_INGEST
+#include <WebSocketsClient.h>
+const char*    WS_HOST = "192.168.1.100";
+const uint16_t WS_PORT = 8000;
+// device_id binds the connection; token must match DEVICE_INGEST_TOKEN on the backend (if set)
+const char*    WS_PATH = "/ws/ingest?device_id=esp32_1&token=change-me";
+WebSocketsClient wsIngest;
+
+void onWsEvent(WStype_t type, uint8_t* payload, size_t length) {
+  if (type == WStype_CONNECTED) {
+    Serial.println("[WS] Connected to /ws/ingest");
+  } else if (type == WStype_DISCONNECTED) {
+    Serial.println("[WS] Disconnected");
+  } else if (type == WStype_TEXT) {
+    // {"type":"ack",...} or {"type":"error",...}
+    Serial.print("[WS] ");
+    Serial.write(payload, length);
+    Serial.println();
+  }
+}
+#endif
+
 // ----- SMS (SIM900A) -----
 const char* ALERT_PHONE_NUMBER = "+918208170566";
 
@@ -76,6 +128,11 @@ void setup() {
     Serial.println(WiFi.localIP().toString());
     Serial.print("[DEBUG] API_URL: ");
     Serial.println(API_URL);
+#if USE_WS_INGEST
+    wsIngest.begin(WS_HOST, WS_PORT, WS_PATH);
+    wsIngest.onEvent(onWsEvent);
+    wsIngest.setReconnectInterval(5000);
+#endif
   } else {
     Serial.println("[DEBUG] Wi-Fi FAILED. SMS-only mode. Check SSID/password.");
   }
@@ -130,7 +187,42 @@ void sendSMS(const char* msg) {
 void postToServer(float temp, float ph, float turbidityNtu, float tds, int waterLevel) {
   if (WiFi.status() != WL_CONNECTED) return;
 
+#if USE_WS_INGEST
+  if (wsIngest.isConnected()) {
+    // device_id comes from the connection; the server acks every frame
+#if USE_BINARY_INGEST
+    uint8_t packed[32];
+    wsIngest.sendBIN(packed, packReading(packed, temp, ph, turbidityNtu, tds));
+    return;
+#endif
+    String frame = "{\"ph\":";
+    frame += ph;
+    frame += ",\"turbidity\":";
+    frame += turbidityNtu;
+    frame += ",\"tds\":";
+    frame += tds;
+    frame += ",\"temperature\":";
+    frame += temp;
+    frame += "}";
+    wsIngest.sendTXT(frame);
+    return;
+  }
+#endif
+
   HTTPClient http;
+#if USE_BINARY_INGEST
+  uint8_t packed[32];
+  size_t packedLen = packReading(packed, temp, ph, turbidityNtu, tds);
+  http.begin(API_BINARY_URL);
+  http.addHeader("Content-Type", "application/octet-stream");
+  int binaryCode = http.POST(packed, packedLen);
+  Serial.print("POST ");
+  Serial.print(API_BINARY_URL);
+  Serial.print(" -> ");
+  Serial.println(binaryCode);
+  http.end();
+  return;
+#endif
   http.begin(API_URL);
   http.addHeader("Content-Type", "application/json");
 
@@ -190,5 +282,14 @@ void loop() {
   // POST to FastAPI when Wi-Fi available (for website)
   postToServer(temperature, ph, turbidityNtu, tds, waterLevel);
 
+#if USE_WS_INGEST
+  // Keep the WebSocket serviced (pings, acks, reconnects) while waiting
+  unsigned long waitStart = millis();
+  while (millis() - waitStart < 5000) {
+    wsIngest.loop();
+    delay(10);
+  }
+#else
   delay(5000);  // Every 5 seconds
+#endif
 }
@@ -9,7 +9,7 @@ import { useEffect, useRef, useState, useCallback } from 'react';
 import { API_ENDPOINTS, WaterReading, WaterAlert } from '@/lib/api';
 
 export interface WebSocketMessage {
-  type: 'reading' | 'alert';
+  type: 'reading' | 'alert' | 'anomaly' | 'device_offline' | 'device_online';
   data: WaterReading | WaterAlert;
 }
 
@@ -64,8 +64,9 @@ export function useWebSocket(): UseWebSocketReturn {
           if (message.type === 'reading') {
             console.log('[WebSocket] New reading from backend:', message.data);
             setLatestReading(message.data as WaterReading);
-          } else if (message.type === 'alert') {
-            console.log('[WebSocket] New alert from backend:', message.data);
+          } else if (message.type === 'alert' || message.type === 'anomaly' || message.type.startsWith('device_')) {
+            // Anomalies (sudden jumps/drifts) and devices going offline/online are stored as alerts too
+            console.log(`[WebSocket] New ${message.type} from backend:`, message.data);
             setLatestAlert(message.data as WaterAlert);
           }
         } catch (err) {
@@ -157,6 +157,7 @@ const Chatbot = () => {
       const reader = response.body?.getReader();
       const decoder = new TextDecoder();
       let accumulatedContent = "";
+      let buffer = "";
 
       if (reader) {
         try {
@@ -164,15 +165,25 @@ const Chatbot = () => {
             const { done, value } = await reader.read();
             if (done) break;
 
-            const chunk = decoder.decode(value, { stream: true });
-            const lines = chunk.split("\n");
+            // Events can be split across network chunks; keep the trailing partial line
+            buffer += decoder.decode(value, { stream: true });
+            const lines = buffer.split("\n");
+            buffer = lines.pop() ?? "";
 
             for (const line of lines) {
               if (line.startsWith("data: ")) {
-                const data = line.slice(6).trim();
-                if (data === "[DONE]") {
+                const raw = line.slice(6);
+                if (raw.trim() === "[DONE]") {
                   break;
                 }
+
+                // Deltas are JSON-encoded strings so leading spaces and newlines are preserved
+                let data: string;
+                try {
+                  data = JSON.parse(raw);
+                } catch {
+                  data = raw;
+                }
                 
                 if (data) {
                   accumulatedContent += data;